@@ -0,0 +1,4 @@
+'''
+Benchmarks for the PPC parser. "generator" builds synthetic Processing sketches and "suite" times the parser on them;
+run "python3 -m benchmarks" from the repository root. The bench_*.py scripts are standalone experiments.
+'''
@@ -0,0 +1,80 @@
+'''
+Benchmark comparing the tokenizer-based comment stripper and brace matcher with the line-based helpers they replaced.
+Both versions make a single pass; the tokenizer does more work per line in exchange for understanding strings,
+chars and comments that start or end in the middle of a line.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_lexer.py
+'''
+
+import os, sys, timeit
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ppc
+
+SKETCH = [
+  '/* Bouncing balls',
+  '   with a multiline comment */',
+  'float x = 0; // position',
+  'void setup() {',
+  '  size(200, 200);',
+  '  img = loadImage("http://example.com/ball.png");',
+  '}',
+  'void draw() {',
+  '  // move the ball',
+  '  for (int i = 0; i < 10; i++) {',
+  '    if (x > width) {',
+  '      x = 0;',
+  '    }',
+  '  }',
+  '}',
+]
+
+def line_based_strip_comments(code):
+  '''
+  Returns the code without comments using the line-based helpers (before the tokenizer)
+  '''
+
+  no_comments = [line.rstrip() for line in code]
+  no_comments = [line for line in no_comments if line != '']
+  no_comments = [line for line in no_comments if not line.strip().startswith('//')]
+  no_comments = [line[:line.find('//')] if '//' in line else line for line in no_comments]
+  return ppc.strip_multiline_comments(no_comments)
+
+def line_based_block_index(code):
+  '''
+  Returns the block index counting every curly bracket, including those in strings (before the tokenizer)
+  '''
+
+  blocks = dict()
+  waiting = dict()
+  opened = 0
+  for index, line in enumerate(code):
+    waiting.setdefault(opened, []).append(index)
+    opened += line.count('{') - line.count('}')
+    for start in waiting.pop(opened, ()):
+      blocks[start] = index + 1
+  return blocks
+
+def best_time(function, code, repeat=5):
+  '''
+  Returns the best time in seconds of calling function(code)
+  '''
+
+  return min(timeit.repeat(lambda: function(code), number=1, repeat=repeat))
+
+def main():
+  benchmarks = [
+    ('strip_comments', line_based_strip_comments, ppc.strip_comments),
+    ('get_block_index', line_based_block_index, ppc.get_block_index),
+  ]
+  for repeats in [100, 1000, 10000]:
+    code = SKETCH * repeats
+    print('%d lines' % len(code))
+    for name, line_based, tokenized in benchmarks:
+      before = best_time(line_based, code)
+      after = best_time(tokenized, code)
+      print('  %-16s line-based %9.5f s  tokenizer %9.5f s  (x%.1f)' % (name, before, after, after / before))
+
+if __name__ == '__main__':
+  main()
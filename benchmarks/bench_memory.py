@@ -0,0 +1,58 @@
+'''
+Benchmark comparing the memory used by the two representations of parsed student code: the nested dictionaries returned by
+"parse_student_code" and the slotted objects returned with "typed=True". Parses a corpus of 1,000 sketches built from
+the test sketches and measures the memory each representation holds with tracemalloc.
+
+Run from the repository root:
+
+    python3 benchmarks/bench_memory.py
+'''
+
+import os, sys, gc, re, tracemalloc
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ppc
+
+SKETCH_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'test_sketches')
+CORPUS_SIZE = 1000
+METHOD_HEADER = re.compile(r'^\w+\s+(\w+)\s*\([^=]*\{')
+
+def corpus():
+  '''
+  Returns a list of 1,000 (file, sketch_methods, class_methods) tuples cycling through the test sketches
+  '''
+
+  sketches = []
+  for sketch in sorted(os.listdir(SKETCH_DIR)):
+    file_name = os.path.join(SKETCH_DIR, sketch)
+    code = ppc.strip_comments(ppc.read_file(file_name))
+    methods = [match.group(1) for match in map(METHOD_HEADER.match, code) if match]
+    class_methods = ['update'] if sketch == 'class_example.pde' else None
+    sketches.append((file_name, methods, class_methods))
+
+  return [sketches[index % len(sketches)] for index in range(CORPUS_SIZE)]
+
+def measure(parse):
+  '''
+  Returns the number of bytes held by the results of calling parse on every sketch in the corpus
+  '''
+
+  sketches = corpus()
+  gc.collect()
+  tracemalloc.start()
+  results = [parse(file_name, methods, class_methods) for file_name, methods, class_methods in sketches]
+  gc.collect()
+  size, _ = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  del results
+
+  return size
+
+def main():
+  plain = measure(lambda file_name, methods, class_methods: ppc.parse_student_code(file_name, methods, class_methods))
+  typed = measure(lambda file_name, methods, class_methods: ppc.parse_student_code(file_name, methods, class_methods, typed=True))
+  print('%d sketches' % CORPUS_SIZE)
+  print('  dictionaries    %10d bytes' % plain)
+  print('  typed objects   %10d bytes  (%.0f%% of dictionaries)' % (typed, 100.0 * typed / plain))
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,65 @@
+'''
+Benchmark for the positional scanning used by the PPC parser. Times "parse_loops", "parse_conditional" and
+"strip_comments" on methods made of the same few lines repeated over and over, doubling the size each round.
+With positional scanning each doubling should roughly double the time (linear scaling).
+
+Run from the repository root:
+
+    python3 benchmarks/bench_scanning.py
+'''
+
+import os, sys, timeit
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ppc
+
+REPEATED_BLOCK = [
+  'for (int i = 0; i < 3; i++) {',
+  'x += 1;',
+  '}',
+  'if (x > 5) {',
+  'x += 1;',
+  '} else {',
+  'x = 0;',
+  '}',
+]
+
+REPEATED_COMMENT = [
+  '/*',
+  'comment',
+  '*/',
+  '  x += 1; // trailing',
+]
+
+def make_method(repeats):
+  '''
+  Returns a list of strings representing a method whose body repeats the same loop and conditional
+  '''
+
+  return ['void draw() {'] + REPEATED_BLOCK * repeats + ['}']
+
+def time_function(function, code, number=5):
+  '''
+  Returns the best time in seconds of calling function(code)
+  '''
+
+  return min(timeit.repeat(lambda: function(code), number=1, repeat=number))
+
+def main():
+  sizes = [250, 500, 1000, 2000, 4000]
+  benchmarks = [
+    ('parse_loops', ppc.parse_loops, make_method),
+    ('parse_conditional', ppc.parse_conditional, make_method),
+    ('strip_comments', ppc.strip_comments, lambda repeats: REPEATED_COMMENT * repeats),
+  ]
+  for name, function, make_code in benchmarks:
+    print(name)
+    previous = None
+    for size in sizes:
+      code = make_code(size)
+      seconds = time_function(function, code)
+      ratio = '' if previous is None else '  x%.2f' % (seconds / previous)
+      print('  %6d lines  %9.5f s%s' % (len(code), seconds, ratio))
+      previous = seconds
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,127 @@
+'''
+Deterministic generator of Processing sketches for benchmarking the PPC parser. The same arguments always give the
+same sketch, so timings from different versions of the parser can be compared.
+'''
+
+import random
+
+## Statements used to fill method bodies; "{n}" is replaced with a number
+STATEMENTS = [
+  'x += {n};',
+  'y = y * {n} - x;',
+  'ellipse(x, y, {n}, {n});',
+  'fill({n}, 100, 200);',
+  'count = (count + {n}) % 360;',
+  'println("value: " + x);',
+]
+
+## Comments placed before a statement or at the end of one
+COMMENTS = [
+  '// move the shape',
+  '// {n} is a magic number',
+  '/* keep inside the window */',
+]
+
+def generate_sketch(lines=200, methods=5, depth=2, comment_density=0.1, classes=0, seed=0):
+  '''
+  Returns a list of strings representing a Processing sketch, one string per line ending in a newline, the same as
+  "read_file" returns
+
+  Parameters:
+    lines (integer): approximate number of lines in the sketch; defaults to 200
+    methods (integer): number of methods outside of classes, including setup and draw; defaults to 5
+    depth (integer): how deeply loops and conditionals are nested inside each other; defaults to 2
+    comment_density (float): chance from 0 to 1 that a statement has a comment; defaults to 0.1
+    classes (integer): number of user-defined classes, each with a constructor and two methods; defaults to 0
+    seed (integer): seed for the random choices; defaults to 0
+
+  Returns:
+     sketch (list of strings): lines of the generated sketch
+  '''
+
+  rng = random.Random(seed)
+  sketch = ['// Generated sketch: %d lines, %d methods, depth %d\n' % (lines, methods, depth)]
+  sketch += ['int count = 0;\n', 'float x = 0;\n', 'float y = 0;\n']
+  for index in range(classes):
+    sketch.append('Shape%d shape%d = new Shape%d(%d);\n' % (index, index, index, index))
+  sketch.append('\n')
+
+  names = ['setup', 'draw'] + ['method%d' % index for index in range(max(methods - 2, 0))]
+  names = names[:max(methods, 0)]
+  class_lines = classes * (14 + 2 * depth)
+  budget = max((lines - len(sketch) - class_lines) // max(len(names), 1) - 3, 1)
+  for name in names:
+    sketch.append('void %s() {\n' % name)
+    sketch += generate_body(rng, budget, depth, comment_density, '  ')
+    sketch += ['}\n', '\n']
+
+  for index in range(classes):
+    sketch += generate_class(rng, 'Shape%d' % index, depth, comment_density)
+
+  return sketch
+
+def generate_body(rng, budget, depth, comment_density, indent):
+  '''
+  Returns about "budget" lines of statements, loops and conditionals nested "depth" levels deep
+  '''
+
+  body = []
+  while len(body) < budget:
+    body += generate_block(rng, depth, comment_density, indent)
+
+  return body
+
+def generate_block(rng, depth, comment_density, indent):
+  '''
+  Returns the lines of one statement, or of a loop or conditional holding blocks one level less deep
+  '''
+
+  if depth <= 0:
+    return generate_statement(rng, comment_density, indent)
+
+  inner = indent + '  '
+  kind = rng.choice(['for', 'while', 'if', 'if else', 'else if'])
+  if kind == 'for':
+    lines = [indent + 'for (int i%d = 0; i%d < %d; i%d++) {\n' % (depth, depth, rng.randint(2, 9), depth)]
+  elif kind == 'while':
+    lines = [indent + 'while (x < %d) {\n' % rng.randint(10, 500)]
+  else:
+    lines = [indent + 'if (x > %d) {\n' % rng.randint(0, 400)]
+  lines += generate_block(rng, depth - 1, comment_density, inner)
+  lines += generate_statement(rng, comment_density, inner)
+  if kind == 'if else':
+    lines.append(indent + '} else {\n')
+    lines += generate_block(rng, depth - 1, comment_density, inner)
+  elif kind == 'else if':
+    lines.append(indent + '} else if (y < %d) {\n' % rng.randint(0, 400))
+    lines += generate_block(rng, depth - 1, comment_density, inner)
+  lines.append(indent + '}\n')
+
+  return lines
+
+def generate_statement(rng, comment_density, indent):
+  '''
+  Returns one statement, sometimes with a comment on the line before or at the end of the line
+  '''
+
+  statement = indent + rng.choice(STATEMENTS).format(n=rng.randint(1, 99))
+  if rng.random() >= comment_density:
+    return [statement + '\n']
+
+  comment = rng.choice(COMMENTS).format(n=rng.randint(1, 99))
+  if rng.random() < 0.5:
+    return [indent + comment + '\n', statement + '\n']
+
+  return [statement + ' ' + comment + '\n']
+
+def generate_class(rng, name, depth, comment_density):
+  '''
+  Returns the lines of a user-defined class with two attributes, a constructor and two methods
+  '''
+
+  lines = ['class %s {\n' % name, '  float size;\n', '  int hits = 0;\n', '\n']
+  lines += ['  %s(float size) {\n' % name, '    this.size = size;\n', '  }\n', '\n']
+  lines += ['  void update() {\n'] + generate_block(rng, depth, comment_density, '    ') + ['  }\n', '\n']
+  lines += ['  float area() {\n', '    return size * size;\n', '  }\n', '}\n', '\n']
+
+  return lines
@@ -0,0 +1,189 @@
+'''
+Benchmark suite for the PPC parser. Times "parse_student_code", "strip_comments", "classify_lines", "get_end_bracket",
+"parse_conditional", "parse_loops" and "get_global_variables" on generated sketches of several sizes and saves the results as JSON.
+Comparing two result files shows which benchmarks got slower or faster between versions of the parser.
+
+Run from the repository root:
+
+    python3 -m benchmarks --output results.json
+    python3 -m benchmarks --output new.json --compare results.json
+'''
+
+import os, sys, json, time, timeit, argparse, platform, tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import ppc
+from benchmarks.generator import generate_sketch
+
+## Sketches every benchmark is run on; each is passed to "generate_sketch"
+SKETCHES = {
+  'small': {'lines': 100, 'methods': 4, 'depth': 2, 'comment_density': 0.1, 'classes': 1},
+  'medium': {'lines': 1000, 'methods': 20, 'depth': 3, 'comment_density': 0.2, 'classes': 3},
+  'large': {'lines': 10000, 'methods': 100, 'depth': 4, 'comment_density': 0.2, 'classes': 10},
+  'deep': {'lines': 1000, 'methods': 4, 'depth': 8, 'comment_density': 0.1, 'classes': 0},
+  'commented': {'lines': 1000, 'methods': 20, 'depth': 2, 'comment_density': 0.8, 'classes': 0},
+}
+
+## A benchmark is slower or faster in a comparison when its time changes by more than this fraction
+THRESHOLD = 0.1
+
+#######################
+## Benchmarks
+#######################
+
+def prepare(sketch, directory):
+  '''
+  Returns everything the benchmarks need for one generated sketch, so only the function being measured is timed
+
+  Parameters:
+    sketch (list of strings): lines of a generated sketch
+    directory (string): directory the sketch file is written to
+
+  Returns:
+     data (dictionary): has the keys file_name, full_code, code, pc, and method (the method with the most lines)
+  '''
+
+  file_name = os.path.join(directory, 'sketch.pde')
+  with open(file_name, 'w') as sketch_file:
+    sketch_file.writelines(sketch)
+  pc = ppc.parse_student_code(file_name)
+  method = max(pc.get('methods'), key=lambda method: len(method.get('code')))
+
+  return {'file_name': file_name, 'full_code': sketch, 'code': pc.get('code'), 'pc': pc, 'method': method.get('code')}
+
+## Each benchmark takes the prepared data and runs the function being measured once
+BENCHMARKS = {
+  'parse_student_code': lambda data: ppc.parse_student_code(data['file_name']),
+  'strip_comments': lambda data: ppc.strip_comments(data['full_code']),
+  'classify_lines': lambda data: ppc.classify_lines(data['code']),
+  'get_end_bracket': lambda data: ppc.get_end_bracket(data['method'], 0),
+  'parse_conditional': lambda data: ppc.parse_conditional(data['method']),
+  'parse_loops': lambda data: ppc.parse_loops(data['method']),
+  'get_global_variables': lambda data: ppc.get_global_variables(data['pc']['methods'], data['code'], data['pc']['classes']),
+}
+
+def time_benchmark(benchmark, data, repeat=5, min_seconds=0.2):
+  '''
+  Returns the fastest time for one call of a benchmark. The number of calls per round is chosen so a round takes at
+  least "min_seconds", and the fastest of "repeat" rounds is kept
+
+  Parameters:
+    benchmark (function): takes the prepared data
+    data (dictionary): built by "prepare"
+    repeat (integer): number of rounds; defaults to 5
+    min_seconds (float): shortest time for one round; defaults to 0.2
+
+  Returns:
+     (seconds, number) (tuple): seconds per call and the number of calls per round
+  '''
+
+  timer = timeit.Timer(lambda: benchmark(data))
+  number, _ = timer.autorange()
+  number = max(1, int(number * min_seconds / 0.2))
+  best = min(timer.repeat(repeat, number))
+
+  return best / number, number
+
+def run_suite(sketches=None, benchmarks=None, repeat=5, min_seconds=0.2):
+  '''
+  Returns the results of running every benchmark on every sketch
+
+  Parameters:
+    sketches (dictionary): maps a sketch name to the arguments of "generate_sketch"; defaults to None, which uses SKETCHES
+    benchmarks (list of strings): names from BENCHMARKS to run; defaults to None, which runs all of them
+    repeat (integer): number of rounds per benchmark; defaults to 5
+    min_seconds (float): shortest time for one round; defaults to 0.2
+
+  Returns:
+     results (dictionary): has the keys parser_version, python, platform, date, and results. "results" is a list of
+                           dictionaries with the keys benchmark, sketch, parameters, lines, seconds, and number
+  '''
+
+  sketches = SKETCHES if sketches is None else sketches
+  benchmarks = list(BENCHMARKS) if benchmarks is None else benchmarks
+  results = []
+  with tempfile.TemporaryDirectory() as directory:
+    for sketch_name, parameters in sketches.items():
+      sketch = generate_sketch(**parameters)
+      data = prepare(sketch, directory)
+      for name in benchmarks:
+        seconds, number = time_benchmark(BENCHMARKS[name], data, repeat, min_seconds)
+        results.append({'benchmark': name, 'sketch': sketch_name, 'parameters': parameters, 'lines': len(sketch),
+                        'seconds': seconds, 'number': number})
+
+  return {'parser_version': ppc.PARSER_VERSION, 'python': platform.python_version(), 'platform': platform.platform(),
+          'date': time.strftime('%Y-%m-%dT%H:%M:%S'), 'results': results}
+
+#######################
+## Comparing Results
+#######################
+
+def compare(baseline, current, threshold=THRESHOLD):
+  '''
+  Returns how each benchmark changed between two runs; benchmarks that are only in one run are left out
+
+  Parameters:
+    baseline (dictionary): results of an earlier "run_suite"
+    current (dictionary): results of a later "run_suite"
+    threshold (float): fraction a time must change by to count as slower or faster; defaults to THRESHOLD
+
+  Returns:
+     changes (list of dictionaries): has the keys benchmark, sketch, baseline, current, ratio (current / baseline), and
+                                     status ("slower", "faster", or "same")
+  '''
+
+  before = {(result['benchmark'], result['sketch']): result['seconds'] for result in baseline.get('results')}
+  changes = []
+  for result in current.get('results'):
+    key = (result['benchmark'], result['sketch'])
+    if key not in before:
+      continue
+    ratio = result['seconds'] / before[key]
+    status = 'slower' if ratio > 1 + threshold else 'faster' if ratio < 1 - threshold else 'same'
+    changes.append({'benchmark': key[0], 'sketch': key[1], 'baseline': before[key], 'current': result['seconds'],
+                    'ratio': ratio, 'status': status})
+
+  return changes
+
+def print_results(results, changes=None):
+  '''
+  Prints a table of the results and, if given, how they compare to an earlier run
+  '''
+
+  ratios = {(change['benchmark'], change['sketch']): change for change in changes or []}
+  print('%-22s %-10s %7s %12s' % ('benchmark', 'sketch', 'lines', 'ms per call') + ('  change' if changes else ''))
+  for result in results.get('results'):
+    line = '%-22s %-10s %7d %12.4f' % (result['benchmark'], result['sketch'], result['lines'], result['seconds'] * 1000)
+    change = ratios.get((result['benchmark'], result['sketch']))
+    if change is not None:
+      line += '  %5.2fx %s' % (change['ratio'], change['status'])
+    print(line)
+
+def main(argv=None):
+  '''
+  Runs the suite from the command line; see the module docstring
+  '''
+
+  parser = argparse.ArgumentParser(description='Benchmark the PPC parser on generated sketches.')
+  parser.add_argument('--output', help='JSON file the results are saved to')
+  parser.add_argument('--compare', help='JSON file with earlier results to compare against')
+  parser.add_argument('--benchmark', action='append', choices=sorted(BENCHMARKS), help='run only this benchmark (can be repeated)')
+  parser.add_argument('--sketch', action='append', choices=sorted(SKETCHES), help='run only on this sketch (can be repeated)')
+  parser.add_argument('--repeat', type=int, default=5, help='rounds per benchmark')
+  parser.add_argument('--quick', action='store_true', help='shorter rounds, for a rough check')
+  args = parser.parse_args(argv)
+
+  sketches = {name: SKETCHES[name] for name in args.sketch} if args.sketch else None
+  results = run_suite(sketches, args.benchmark, args.repeat, 0.02 if args.quick else 0.2)
+  changes = None
+  if args.compare:
+    with open(args.compare) as baseline:
+      changes = compare(json.load(baseline), results)
+  print_results(results, changes)
+  if args.output:
+    with open(args.output, 'w') as output:
+      json.dump(results, output, indent=2)
+
+  return 1 if changes and any(change['status'] == 'slower' for change in changes) else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
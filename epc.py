@@ -0,0 +1,300 @@
+'''
+Exporting Processing Code (EPC) - Streams parse results for a cohort into columnar files for pandas, DuckDB or a spreadsheet.
+
+Each parsed sketch is split into rows of six normalised tables that share a "sketch_id" (and a "method_id" for the
+loops and conditionals of a method):
+
+* sketches - sketch_id, name, lines, code_lines, methods, classes, global_variables
+* methods - sketch_id, method_id, class_name, name, return_type, parameters, lines, loops, conditionals, return_value
+* loops - sketch_id, method_id, type, start, lines, header
+* conditionals - sketch_id, method_id, start, lines, true_branch_lines, false_branch_lines, header
+* classes - sketch_id, name, parent, lines, methods, constructors, attributes
+* globals - sketch_id, line, modifiers, type, names, code
+
+Tables are written as Parquet when the optional "pyarrow" package is installed and as gzipped CSV or JSON Lines otherwise.
+Rows are kept in memory only until a table has "row_group_size" of them, so memory stays flat for any number of sketches.
+Export a cohort from the command line:
+
+    python epc.py path/to/output path/to/sketches/*.pde --format csv
+'''
+
+import os, sys, csv, gzip, json, argparse
+import ppc
+
+try:
+  import pyarrow
+  import pyarrow.parquet
+except ImportError:
+  pyarrow = None
+
+## Columns of each table and their types; lists of strings are joined with ", "
+TABLES = {
+  'sketches': [('sketch_id', 'int'), ('name', 'str'), ('lines', 'int'), ('code_lines', 'int'), ('methods', 'int'),
+               ('classes', 'int'), ('global_variables', 'int')],
+  'methods': [('sketch_id', 'int'), ('method_id', 'int'), ('class_name', 'str'), ('name', 'str'), ('return_type', 'str'),
+              ('parameters', 'str'), ('lines', 'int'), ('loops', 'int'), ('conditionals', 'int'), ('return_value', 'str')],
+  'loops': [('sketch_id', 'int'), ('method_id', 'int'), ('type', 'str'), ('start', 'int'), ('lines', 'int'), ('header', 'str')],
+  'conditionals': [('sketch_id', 'int'), ('method_id', 'int'), ('start', 'int'), ('lines', 'int'), ('true_branch_lines', 'int'),
+                   ('false_branch_lines', 'int'), ('header', 'str')],
+  'classes': [('sketch_id', 'int'), ('name', 'str'), ('parent', 'str'), ('lines', 'int'), ('methods', 'int'),
+              ('constructors', 'int'), ('attributes', 'int')],
+  'globals': [('sketch_id', 'int'), ('line', 'int'), ('modifiers', 'str'), ('type', 'str'), ('names', 'str'), ('code', 'str')],
+}
+
+## Number of rows of a table buffered before they are written
+ROW_GROUP_SIZE = 10000
+
+## File extension written for each format
+EXTENSIONS = {'parquet': '.parquet', 'csv': '.csv.gz', 'jsonl': '.jsonl.gz'}
+
+#######################
+## Building Rows
+#######################
+
+def sketch_rows(sketch_id, name, pc):
+  '''
+  Returns the rows of every table for one parsed sketch. The start of a loop or conditional is the one the parser found;
+  its line counts are None (an empty cell) if it does not close before the end of its method
+
+  Parameters:
+    sketch_id (integer): identifies the sketch in every table
+    name (string): name stored in the sketches table, e.g. the file name
+    pc (dictionary): parsed student code; a typed or lazy result works as well
+
+  Returns:
+     rows (dictionary): maps each table name in TABLES to a list of row tuples in the order of its columns
+  '''
+
+  rows = {table: [] for table in TABLES}
+  methods = [(None, method) for method in pc.get('methods')]
+  for parsed_class in pc.get('classes'):
+    methods.extend((parsed_class.get('name'), method) for method in parsed_class.get('methods'))
+    rows['classes'].append((sketch_id, parsed_class.get('name'), parsed_class.get('parent'), len(parsed_class.get('code')),
+                            len(parsed_class.get('methods')), len(parsed_class.get('constructors')), len(parsed_class.get('attributes'))))
+  for method_id, (class_name, method) in enumerate(methods):
+    code = method.get('code')
+    rows['methods'].append((sketch_id, method_id, class_name, method.get('name'), method.get('return_type'),
+                            ', '.join(method.get('parameters')), len(code), len(method.get('loops')),
+                            len(method.get('conditionals')), method.get('return_value')))
+    for loop in method.get('loops'):
+      rows['loops'].append((sketch_id, method_id, loop.get('type'), loop.get('start'), count_lines(loop.get('code')),
+                            code[loop.get('start')]))
+    for conditional in method.get('conditionals'):
+      closed = conditional.get('code') is not None
+      rows['conditionals'].append((sketch_id, method_id, conditional.get('start'), count_lines(conditional.get('code')),
+                                   count_lines(conditional.get('true_branch')), len(conditional.get('false_branch')) if closed else None,
+                                   code[conditional.get('start')]))
+  for declaration in pc.get('global_declarations'):
+    rows['globals'].append((sketch_id, declaration.get('line'), ', '.join(declaration.get('modifiers')), declaration.get('type'),
+                            ', '.join(declaration.get('names')), declaration.get('code')))
+  rows['sketches'].append((sketch_id, name, len(pc.get('full_code')), len(pc.get('code')), len(methods),
+                           len(pc.get('classes')), len(pc.get('global_variables'))))
+
+  return rows
+
+def count_lines(block):
+  '''
+  Returns the number of lines in a loop, conditional or branch, or None if the parser could not find where it ends
+  '''
+
+  return len(block) if block is not None else None
+
+#######################
+## Writing Tables
+#######################
+
+class CsvTable:
+  '''
+  Writes rows to a gzipped CSV file with a header line; None is written as an empty cell
+  '''
+
+  def __init__(self, path, columns):
+    self.file = gzip.open(path, 'wt', encoding='utf-8', newline='')
+    self.writer = csv.writer(self.file)
+    self.writer.writerow([column for column, _ in columns])
+
+  def write(self, rows):
+    self.writer.writerows(rows)
+
+  def close(self):
+    self.file.close()
+
+class JsonlTable:
+  '''
+  Writes rows to a gzipped JSON Lines file, one object per row
+  '''
+
+  def __init__(self, path, columns):
+    self.file = gzip.open(path, 'wt', encoding='utf-8')
+    self.columns = [column for column, _ in columns]
+
+  def write(self, rows):
+    for row in rows:
+      self.file.write(json.dumps(dict(zip(self.columns, row))) + '\n')
+
+  def close(self):
+    self.file.close()
+
+class ParquetTable:
+  '''
+  Writes rows to a Parquet file; every call to "write" adds one row group
+  '''
+
+  def __init__(self, path, columns):
+    types = {'int': pyarrow.int64(), 'str': pyarrow.string()}
+    self.schema = pyarrow.schema([(column, types[kind]) for column, kind in columns])
+    self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+  def write(self, rows):
+    columns = list(zip(*rows))
+    self.writer.write_table(pyarrow.Table.from_arrays([pyarrow.array(column, field.type) for column, field in zip(columns, self.schema)],
+                                                      schema=self.schema))
+
+  def close(self):
+    self.writer.close()
+
+## Class that writes each format
+WRITERS = {'parquet': ParquetTable, 'csv': CsvTable, 'jsonl': JsonlTable}
+
+#######################
+## Exporting a Cohort
+#######################
+
+class Exporter:
+  '''
+  Streams parsed sketches into one file per table in a directory. Rows are buffered per table and written every
+  "row_group_size" rows; "close" writes the rest. It can be used as a context manager.
+
+  Attributes:
+    paths (dictionary): maps each table name to the path of its file
+    sketches (integer): number of sketches added so far
+  '''
+
+  def __init__(self, directory, format=None, row_group_size=ROW_GROUP_SIZE):
+    '''
+    Parameters:
+      directory (string): directory the files are written to; created if it does not exist
+      format (string): "parquet", "csv", or "jsonl"; defaults to None, which uses Parquet if pyarrow is installed and CSV otherwise
+      row_group_size (integer): rows of a table kept in memory before they are written; defaults to ROW_GROUP_SIZE
+    '''
+
+    format = format or ('parquet' if pyarrow is not None else 'csv')
+    if format not in WRITERS:
+      raise ValueError('unknown export format %r' % format)
+    if format == 'parquet' and pyarrow is None:
+      raise ImportError('Parquet export needs pyarrow; install it with "pip install pyarrow" or use format="csv"')
+    os.makedirs(directory, exist_ok=True)
+    self.row_group_size = row_group_size
+    self.paths = {table: os.path.join(directory, table + EXTENSIONS[format]) for table in TABLES}
+    self.tables = {table: WRITERS[format](self.paths[table], columns) for table, columns in TABLES.items()}
+    self.buffers = {table: [] for table in TABLES}
+    self.sketches = 0
+
+  def add(self, name, pc):
+    '''
+    Adds the rows of one parsed sketch; its sketch_id is the number of sketches added before it
+
+    Parameters:
+      name (string): name stored in the sketches table, e.g. the file name
+      pc (dictionary): parsed student code
+    '''
+
+    for table, rows in sketch_rows(self.sketches, name, pc).items():
+      buffer = self.buffers[table]
+      buffer.extend(rows)
+      if len(buffer) >= self.row_group_size:
+        self.flush(table)
+    self.sketches += 1
+
+  def flush(self, table):
+    '''
+    Writes the buffered rows of a table
+    '''
+
+    if self.buffers[table]:
+      self.tables[table].write(self.buffers[table])
+      self.buffers[table] = []
+
+  def close(self):
+    '''
+    Writes every buffered row and closes the files
+    '''
+
+    for table in TABLES:
+      self.flush(table)
+      self.tables[table].close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+def export(sketches, directory, format=None, row_group_size=ROW_GROUP_SIZE):
+  '''
+  Returns the paths of the table files after exporting every sketch
+
+  Parameters:
+    sketches (iterable of tuples): (name, parsed student code) pairs; a generator keeps memory flat
+    directory (string): directory the files are written to
+    format (string): "parquet", "csv", or "jsonl"; defaults to None, see "Exporter"
+    row_group_size (integer): rows of a table kept in memory before they are written; defaults to ROW_GROUP_SIZE
+
+  Returns:
+     paths (dictionary): maps each table name to the path of its file
+  '''
+
+  with Exporter(directory, format, row_group_size) as exporter:
+    for name, pc in sketches:
+      exporter.add(name, pc)
+
+  return exporter.paths
+
+def parse_files(paths, sketch_methods=None, class_methods=None, workers=None, failed=None):
+  '''
+  Yields (path, parsed student code) pairs from "ppc.parse_many" as they finish, which only keeps a few results in
+  memory at a time. Files that could not be parsed are left out (generator)
+
+  Parameters:
+    paths (list of strings): student files to parse
+    sketch_methods (list of strings): methods to parse from every sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    workers (integer): number of worker processes; defaults to "None", which uses one per CPU
+    failed (list): if given, a (path, exception) pair is appended for every file that could not be parsed; defaults to None
+  '''
+
+  for path, pc in ppc.parse_many(paths, sketch_methods, class_methods, workers):
+    if isinstance(pc, Exception):
+      if failed is not None:
+        failed.append((path, pc))
+      continue
+    yield path, pc
+
+#######################
+## Command Line
+#######################
+
+def main(argv=None):
+  '''
+  Exports sketch files from the command line; see the module docstring
+  '''
+
+  parser = argparse.ArgumentParser(description='Export PPC parse results as columnar tables.')
+  parser.add_argument('output', help='directory the tables are written to')
+  parser.add_argument('files', nargs='+', help='sketch files to parse')
+  parser.add_argument('--format', choices=sorted(WRITERS), help='file format; defaults to parquet when pyarrow is installed, csv otherwise')
+  parser.add_argument('--workers', type=int, help='number of worker processes')
+  parser.add_argument('--row-group-size', type=int, default=ROW_GROUP_SIZE, help='rows of a table kept in memory before writing')
+  args = parser.parse_args(argv)
+
+  failed = []
+  paths = export(parse_files(args.files, workers=args.workers, failed=failed), args.output, args.format, args.row_group_size)
+  for table, path in paths.items():
+    print(table, path)
+  for path, error in failed:
+    print('could not parse %s: %r' % (path, error), file=sys.stderr)
+
+  return 1 if failed else 0
+
+if __name__ == '__main__':
+  sys.exit(main())
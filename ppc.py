@@ -1,13 +1,15 @@
 '''
 Parsing Processing Code (PPC) - Parser for grouping Processing code into high level units that can be examined further to assess student work.
-You are only expected to use the "parse_student_code". Everything else are helper functions. The resulting dictionary has the following structure:
+You are only expected to use the "parse_student_code" (or "parse_many" for a batch of files, "parse_sketch_dir" for a sketch folder). Everything else are helper functions. The resulting dictionary has the following structure:
 
-* Classes - Dictionary that represents a user-defined class. You do not need to specify the name of the class,
-            but you must provide the expected  class methods. If no class is detected, this will be an empty string.
-            It has the following key-value pairs.
+* Classes - List of dictionaries. Each dictionary represents a user-defined class, including inner classes, in source order.
+            You do not need to specify the names of the classes. If no class is detected, this will be an empty list.
+            Each dictionary has the following key-value pairs.
     - Attributes - List of strings representing attributes of a class. 
     - Code - List of strings representing a user-defined class. No comments are in the list. Elements retain leading whitespace.
-    - Constructor - Dictionary representing the constructor of a user-defined class. It has the following key-value pairs:
+    - Constructors - List of dictionaries representing every constructor of the class, with the same key-value pairs as Constructor.
+    - Parent - String with the name of the class an inner class is declared in, or None.
+    - Constructor - Dictionary representing the first constructor of a user-defined class, or None. It has the following key-value pairs:
         + Code - List of strings representing the constructor. There is no leading whitespace.
         + Parameters - List of strings representing all of the parameters passed to the constructor.
     - Methods - List of dictionaries. Each dictionary represents a method. It has the following key-value pairs:
@@ -23,9 +25,14 @@ You are only expected to use the "parse_student_code". Everything else are helpe
         + Parameters - List of strings representing the parameters passed to the method.
         + Return Type - String with the type the method should return.
         + Return Value - String representing the value returned by the method. The keyword return is not included in the string.
+* Class Method Index - Dictionary that maps the class name to a dictionary of method names and their positions in the class Methods list.
 * Code - List of strings representing student code. Comments and newlines have been removed. Leading whitespace remains. This list of strings is used for the parsing.
 * Full Code - List of strings representing the student code as they wrote it. It includes comments and blank lines. This list is not used for parsing.
-* Global Variables - List of strings representing the global variables.
+* Global Declarations - List of dictionaries, one for each statement outside of any class or method, in source order. Each has the keys
+                        code, initialisers, line, modifiers, names, and type (None for a statement that is not a declaration).
+* Global Variables - Sorted list of strings representing the global variables; the code of every global declaration.
+* Line Numbers - List of integers with the line number in Full Code (starting at 1) of each line of Code.
+* Method Index - Dictionary that maps each method name to a list of its positions in the Methods list (overloaded methods have more than one).
 * Methods - List of dictionaries. Each dictionary represents a method. It has the following key-value pairs:
     - Code - List of strings representing the method. There is no leading whitespace.
     - Conditionals - List of dictionaries representing a conditional. Each dictionary has the following key-value pairs:
@@ -39,30 +46,1549 @@ You are only expected to use the "parse_student_code". Everything else are helpe
     - Parameters - List of strings representing the parameters passed to the method.
     - Return Type - String with the type the method should return.
     - Return Value - String representing the value returned by the method. The keyword return is not included in the string. 
+* Spans - Dictionary with the keys methods, classes, and global declarations. Each is a list of [start, end] slices of Code, one for
+          each entry of the list of the same name, in the same order.
 '''
 
-def parse_student_code(file_name, sketch_methods=['setup', 'draw'], class_methods=None):
+import os, io, re, json, time, codecs, hashlib, tarfile, tempfile, threading, zipfile
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+## Change PARSER_VERSION whenever the parsed structure changes
+## so results stored by a ParseCache are not reused.
+PARSER_VERSION = '11'
+
+def parse_student_code(file_name, sketch_methods=None, class_methods=None, cache=None, memoize=False, typed=False, lazy=False, stats=None):
   '''
   Returns a dictionary of the parsed student code
 
   Parameters:
     file_name (string): student file to be parsed; should include the path
-    sketch_methods (list of strings): methods expected to be found in the sketch; defaults to "setup" and "draw"
-    class_methods (list of strings): methods expected to be found in user-defined class; defaults to "None"
+    sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    cache (ParseCache): on-disk cache of parse results; defaults to "None", which always parses the file
+    memoize (boolean): reuse the result of an earlier call in this process for the same unchanged file; defaults to False.
+                       The result is shared between callers and is read-only
+    typed (boolean): return a ParsedSketch (slotted objects with the same keys) instead of nested dictionaries; defaults to False
+    lazy (boolean): return a LazyParsedSketch that only parses each section the first time it is read; defaults to False.
+                    The "cache", "memoize", "typed" and "stats" arguments are ignored, since nothing is parsed up front
+    stats (ParseStats): records the time spent in each phase of the parse; defaults to None, which records nothing.
+                        A parse run after a cache or memo miss is recorded; results reused from the cache or the memo are not
+
+  Returns:
+     pc (dictionary): parsed student code; has the keys classes, class_method_index, code, full_code, global_declarations, global_variables,
+                      line_numbers, method_index, methods, and spans
+  '''
+
+  if lazy:
+    return LazyParsedSketch(read_file(file_name), sketch_methods, class_methods)
+  if typed:
+    return to_typed(parse_student_code(file_name, sketch_methods, class_methods, cache, memoize, stats=stats))
+  if memoize:
+    return memoized_parse(file_name, sketch_methods, class_methods, cache, stats)
+  if cache is not None:
+    return cache.parse(file_name, sketch_methods, class_methods, stats)
+  if stats is not None:
+    timer = stats.start(file_name)
+    full_code = read_file(file_name)
+    timer.lap('read_file')
+    return parse_lines(full_code, sketch_methods, class_methods, timer)
+
+  return parse_lines(read_file(file_name), sketch_methods, class_methods)
+
+def parse_lines(full_code, sketch_methods=None, class_methods=None, timer=None):
+  '''
+  Returns a dictionary of the parsed student code given the lines of the sketch; used by "parse_student_code" and "parse_source"
+
+  Parameters:
+    full_code (list of strings): lines of student code as they wrote it, including line endings
+    sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    timer (ParseTimer): times each phase of this parse, see "ParseStats.start"; defaults to None, which does not time anything
 
   Returns:
-     pc (dictionary): parsed student code; has the keys classes, code, full_code, global_variables, and methods
+     pc (dictionary): parsed student code
   '''
 
   pc = dict()
-  pc['full_code'] = read_file(file_name)
-  pc['code'] = strip_comments(pc.get('full_code'))
-  pc['methods'] = parse_methods(pc.get('code'), sketch_methods)
-  pc['classes'] = create_class_dict(pc.get('code'), class_methods) if class_methods else ''
-  pc['global_variables'] = get_global_variables(pc.get('methods'), pc.get('code'), pc.get('classes'))
+  pc['full_code'] = full_code
+  pc['code'], line_numbers = strip_comments_with_line_numbers(pc.get('full_code'))
+  if timer is not None:
+    timer.lap('strip_comments')
+  blocks = get_block_index(pc.get('code'))
+  if timer is not None:
+    timer.lap('get_block_index')
+  kinds = classify_lines(pc.get('code'))
+  if timer is not None:
+    timer.lap('classify_lines')
+  symbols = build_symbol_table(pc.get('code'), blocks, kinds)
+  if timer is not None:
+    timer.lap('build_symbol_table')
+  pc['methods'] = parse_methods(pc.get('code'), sketch_methods, blocks, symbols=symbols)
+  if timer is not None:
+    timer.lap('parse_methods')
+  pc['classes'] = parse_classes(pc.get('code'), class_methods, blocks, symbols=symbols)
+  if timer is not None:
+    timer.lap('parse_classes')
+  pc['global_declarations'] = get_global_declarations(pc.get('code'), symbols, line_numbers)
+  pc['global_variables'] = sorted(declaration['code'] for declaration in pc.get('global_declarations'))
+  if timer is not None:
+    timer.lap('get_global_variables')
+  pc['method_index'] = build_method_index(pc.get('methods'))
+  pc['class_method_index'] = {parsed_class['name']: build_method_index(parsed_class['methods']) for parsed_class in pc.get('classes')}
+  pc['spans'] = get_spans(symbols, sketch_methods)
+  pc['line_numbers'] = line_numbers
+  if timer is not None:
+    timer.lap('build_method_index')
+    timer.finish(pc, blocks)
+
+  return pc
+
+##############################
+## Parsing In-Memory Source
+##############################
+
+## Byte order marks checked by "decode_source"; UTF-32 comes first
+## because its little-endian mark starts with the UTF-16 one.
+BYTE_ORDER_MARKS = (
+  (codecs.BOM_UTF32_LE, 'utf-32-le'),
+  (codecs.BOM_UTF32_BE, 'utf-32-be'),
+  (codecs.BOM_UTF8, 'utf-8'),
+  (codecs.BOM_UTF16_LE, 'utf-16-le'),
+  (codecs.BOM_UTF16_BE, 'utf-16-be'),
+)
+
+def parse_source(source, sketch_methods=None, class_methods=None, cache=None, typed=False, lazy=False, stats=None):
+  '''
+  Returns a dictionary of the parsed student code given the contents of a sketch instead of a file name
+
+  Parameters:
+    source (string or bytes): contents of the student sketch; bytes are decoded by "decode_source"
+    sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    cache (ParseCache): on-disk cache of parse results; defaults to "None", which always parses the source
+    typed (boolean): return a ParsedSketch instead of nested dictionaries; defaults to False
+    lazy (boolean): return a LazyParsedSketch; defaults to False. The "cache", "typed" and "stats" arguments are ignored
+    stats (ParseStats): records the time spent in each phase of the parse; defaults to None. Decoding is recorded as "read_file".
+                        A parse run after a cache miss is recorded; results reused from the cache are not
+
+  Returns:
+     pc (dictionary): parsed student code; the same as "parse_student_code" returns for a file with these contents
+  '''
+
+  if lazy:
+    return LazyParsedSketch(split_lines(decode_source(source)), sketch_methods, class_methods)
+  if typed:
+    return to_typed(parse_source(source, sketch_methods, class_methods, cache, stats=stats))
+  if cache is not None:
+    return cache.parse_source(source, sketch_methods, class_methods, stats)
+  if stats is not None:
+    timer = stats.start()
+    full_code = split_lines(decode_source(source))
+    timer.lap('read_file')
+    return parse_lines(full_code, sketch_methods, class_methods, timer)
+
+  return parse_lines(split_lines(decode_source(source)), sketch_methods, class_methods)
+
+def parse_file_object(file_object, sketch_methods=None, class_methods=None, cache=None, typed=False, lazy=False):
+  '''
+  Returns a dictionary of the parsed student code read from an open file (text or binary mode)
+
+  Parameters:
+    file_object (file object): open file or stream with the student sketch, e.g. an upload or an archive member
+    sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    cache (ParseCache): on-disk cache of parse results; defaults to "None"
+    typed (boolean): return a ParsedSketch instead of nested dictionaries; defaults to False
+    lazy (boolean): return a LazyParsedSketch; defaults to False
+
+  Returns:
+     pc (dictionary): parsed student code
+  '''
+
+  return parse_source(file_object.read(), sketch_methods, class_methods, cache, typed, lazy)
+
+def decode_source(source):
+  '''
+  Returns the text of a sketch; bytes are decoded using their byte order mark, then UTF-8, falling back to Latin-1
+
+  Parameters:
+    source (string or bytes): contents of the student sketch
+
+  Returns:
+     text (string): contents of the student sketch without a byte order mark
+  '''
+
+  if isinstance(source, str):
+    return source[1:] if source.startswith('\ufeff') else source
+
+  for mark, encoding in BYTE_ORDER_MARKS:
+    if source.startswith(mark):
+      return source[len(mark):].decode(encoding)
+  try:
+    return source.decode('utf-8')
+  except UnicodeDecodeError:
+    return source.decode('latin-1')
+
+def split_lines(text):
+  '''
+  Returns a list of strings with the lines of text, the same as "read_file" returns for a file with this text
+
+  Parameters:
+    text (string): contents of the student sketch
+
+  Returns:
+     lines (list of strings): lines of the sketch; "\\r\\n" and "\\r" line endings become "\\n"
+  '''
+
+  return io.StringIO(text, newline=None).readlines()
+
+#######################
+## Incremental Reparsing
+#######################
+
+def reparse(previous_pc, new_source, sketch_methods=None, class_methods=None):
+  '''
+  Returns a dictionary of the parsed student code for a new version of a sketch, reusing the parts of a previous result
+  that did not change. Comments are stripped from the whole sketch, then the lines of code are compared with the previous
+  code to find the range that changed. Only the lines from the end of the last top-level method or statement before the
+  range to the start of the next method, class or statement after it are parsed again, so the rest of the work grows with
+  the size of the edit rather than the size of the sketch. Everything outside is the same object as in the previous
+  result; a global declaration is copied only if its line number moved. If only comments or blank lines changed, nothing
+  is parsed again. If the edit leaves a block or statement open past the range, the whole sketch is parsed again, still
+  reusing every method whose code did not change
+
+  Parameters:
+    previous_pc (dictionary): result of "parse_student_code" or "parse_source" for an earlier version of the sketch
+    new_source (string, bytes or list of strings): contents of the new version of the sketch; bytes are decoded by "decode_source"
+    sketch_methods (list of strings): methods to parse from the sketch; must match the ones used for previous_pc
+    class_methods (list of strings): methods to parse from each user-defined class; must match the ones used for previous_pc
+
+  Returns:
+     pc (dictionary): parsed student code; equal to what "parse_source" returns for new_source
+  '''
+
+  full_code = new_source if isinstance(new_source, list) else split_lines(decode_source(new_source))
+  code, line_numbers = strip_comments_with_line_numbers(full_code)
+  spans = previous_pc.get('spans')
+  pc = None
+  if spans is not None and code == previous_pc.get('code'):
+    pc = dict(previous_pc)
+    pc['global_declarations'] = renumber_declarations(previous_pc.get('global_declarations'), spans.get('global_declarations'), line_numbers)
+    pc['line_numbers'] = line_numbers
+  elif spans is not None:
+    pc = reparse_range(previous_pc, code, line_numbers, sketch_methods, class_methods)
+  if pc is None:
+    pc = reparse_all(previous_pc, code, line_numbers, sketch_methods, class_methods)
+  pc['full_code'] = full_code
+
+  return pc
+
+def reparse_range(previous_pc, code, line_numbers, sketch_methods=None, class_methods=None):
+  '''
+  Returns the parsed student code for new lines of code, parsing only the lines from the end of the last top-level method
+  or statement before the change to the start of the first method, class or statement after it; used by "reparse"
+
+  Parameters:
+    previous_pc (dictionary): earlier parse result; must have spans
+    code (list of strings): lines of the new code without comments
+    line_numbers (list of integers): line number in the sketch of each line of code
+    sketch_methods (list of strings): methods to parse from the sketch; must match the ones used for previous_pc
+    class_methods (list of strings): methods to parse from each user-defined class; must match the ones used for previous_pc
+
+  Returns:
+     pc (dictionary): parsed student code without full_code; None if the changed lines cannot be parsed on their own
+  '''
+
+  previous_code = previous_pc.get('code')
+  spans = previous_pc.get('spans')
+  changed_start, changed_end = find_changed_range(previous_code, code)
+  shift = len(code) - len(previous_code)
+  top_level = [span for span, parsed_class in zip(spans.get('classes'), previous_pc.get('classes')) if parsed_class.get('parent') is None]
+  units = spans.get('methods') + spans.get('global_declarations')
+  ## A method of a class can close after the class does, so only methods and statements are safe to start after. A block
+  ## that is still open ends with the code, so the last one is not safe either
+  start = max([unit_end for _, unit_end in units if unit_end <= changed_start and unit_end < len(previous_code)], default=0)
+  end = min([unit_start for unit_start, _ in units + top_level if unit_start >= changed_end], default=len(previous_code))
+  ## A header at the end of the range could take its curly bracket from the next line
+  if end < len(previous_code) and code[end + shift].lstrip().startswith('{'):
+    return None
+
+  piece = code[start:end + shift]
+  blocks = get_block_index(piece)
+  symbols = build_symbol_table(piece, blocks)
+  if not symbols.get('closed'):
+    return None
+
+  methods_before, methods_inside, methods_after = split_spans(spans.get('methods'), previous_pc.get('methods'), start, end, shift)
+  classes_before, classes_inside, classes_after = split_spans(spans.get('classes'), previous_pc.get('classes'), start, end, shift)
+  declarations_before, _, declarations_after = split_spans(spans.get('global_declarations'), previous_pc.get('global_declarations'),
+                                                           start, end, shift)
+  ## Class methods are found by the name of their class, so a kept class must not share its name with another class
+  previous_names = [parsed_class.get('name') for parsed_class in previous_pc.get('classes')]
+  names = [parsed_class.get('name') for _, parsed_class in classes_before + classes_after]
+  names += [symbol.get('name') for symbol in symbols.get('classes')]
+  if len(set(names)) < len(names) or len(set(previous_names)) < len(previous_names):
+    return None
+
+  create_method = reuse_methods({'methods': methods_inside, 'classes': classes_inside})
+  found = [{'name': method.get('name'), 'class': None, 'start': method_start, 'end': method_end, 'method': method}
+           for (method_start, method_end), method in methods_before]
+  found += [dict(symbol, start=symbol.get('start') + start, end=symbol.get('end') + start) for symbol in symbols.get('methods')
+            if symbol.get('class') is None]
+  found += [{'name': method.get('name'), 'class': None, 'start': method_start, 'end': method_end, 'method': method}
+            for (method_start, method_end), method in methods_after]
+  selected = select_methods({'methods': found}, sketch_methods)
+  piece_spans = get_spans(symbols)
+
+  pc = dict()
+  pc['code'] = code
+  pc['methods'] = []
+  for symbol in selected:
+    if 'method' in symbol:
+      pc['methods'].append(symbol.get('method'))
+    else:
+      method_start, method_end = symbol.get('start') - start, symbol.get('end') - start
+      pc['methods'].append(create_method(piece[method_start:method_end], get_sub_block_index(blocks, method_start, method_end),
+                                         symbols['kinds'][method_start:method_end]))
+  pc['classes'] = [parsed_class for _, parsed_class in classes_before]
+  pc['classes'] += parse_classes(piece, class_methods, blocks, create_method, symbols)
+  pc['classes'] += [parsed_class for _, parsed_class in classes_after]
+  pc['global_declarations'] = renumber_declarations([declaration for _, declaration in declarations_before],
+                                                    [span for span, _ in declarations_before], line_numbers)
+  pc['global_declarations'] += get_global_declarations(piece, symbols, line_numbers[start:end + shift])
+  pc['global_declarations'] += renumber_declarations([declaration for _, declaration in declarations_after],
+                                                     [span for span, _ in declarations_after], line_numbers)
+  pc['global_variables'] = sorted(declaration['code'] for declaration in pc.get('global_declarations'))
+  pc['method_index'] = build_method_index(pc.get('methods'))
+  pc['class_method_index'] = {parsed_class['name']: build_method_index(parsed_class['methods']) for parsed_class in pc.get('classes')}
+  pc['spans'] = {'methods': [[symbol.get('start'), symbol.get('end')] for symbol in selected]}
+  for key, before, after in (('classes', classes_before, classes_after), ('global_declarations', declarations_before, declarations_after)):
+    pc['spans'][key] = [span for span, _ in before]
+    pc['spans'][key] += [[span_start + start, span_end + start] for span_start, span_end in piece_spans.get(key)]
+    pc['spans'][key] += [span for span, _ in after]
+  pc['line_numbers'] = line_numbers
+
+  return pc
+
+def reparse_all(previous_pc, code, line_numbers, sketch_methods=None, class_methods=None):
+  '''
+  Returns the parsed student code for new lines of code, finding every method, class and statement again but reusing
+  each method of previous_pc whose code did not change; used by "reparse"
+
+  Parameters:
+    previous_pc (dictionary): earlier parse result
+    code (list of strings): lines of the new code without comments
+    line_numbers (list of integers): line number in the sketch of each line of code
+    sketch_methods (list of strings): methods to parse from the sketch; must match the ones used for previous_pc
+    class_methods (list of strings): methods to parse from each user-defined class; must match the ones used for previous_pc
+
+  Returns:
+     pc (dictionary): parsed student code without full_code
+  '''
+
+  create_method = reuse_methods(previous_pc)
+  pc = dict()
+  pc['code'] = code
+  blocks = get_block_index(code)
+  symbols = build_symbol_table(code, blocks)
+  pc['methods'] = parse_methods(code, sketch_methods, blocks, create_method, symbols)
+  pc['classes'] = parse_classes(code, class_methods, blocks, create_method, symbols)
+  pc['global_declarations'] = get_global_declarations(code, symbols, line_numbers)
+  pc['global_variables'] = sorted(declaration['code'] for declaration in pc.get('global_declarations'))
+  pc['method_index'] = build_method_index(pc.get('methods'))
+  pc['class_method_index'] = {parsed_class['name']: build_method_index(parsed_class['methods']) for parsed_class in pc.get('classes')}
+  pc['spans'] = get_spans(symbols, sketch_methods)
+  pc['line_numbers'] = line_numbers
+
+  return pc
+
+def find_changed_range(previous_code, code):
+  '''
+  Returns the range of the previous lines of code that were replaced, found by skipping the lines both versions start and end with
+
+  Parameters:
+    previous_code (list of strings): lines of code of the previous version
+    code (list of strings): lines of code of the new version
+
+  Returns:
+     (start, end) (tuple): slice of previous_code that differs; code[start:end + len(code) - len(previous_code)] replaced it
+  '''
+
+  limit = min(len(previous_code), len(code))
+  start = 0
+  while start < limit and previous_code[start] == code[start]:
+    start += 1
+  common_end = 0
+  while common_end < limit - start and previous_code[-1 - common_end] == code[-1 - common_end]:
+    common_end += 1
+
+  return start, len(previous_code) - common_end
+
+def split_spans(spans, items, start, end, shift):
+  '''
+  Returns the items of a previous result that are before, inside and after the range start:end of the previous code
+
+  Parameters:
+    spans (list of lists): [start, end] slice of the previous code for each item
+    items (list): parsed methods, classes or global declarations of the previous result
+    start (integer): start of the range
+    end (integer): end of the range
+    shift (integer): number of lines the code after the range moved by
+
+  Returns:
+     (before, inside, after) (tuple): before and after are lists of ([start, end] in the new code, item); inside is a list of items
+  '''
+
+  before, inside, after = [], [], []
+  for (span_start, span_end), item in zip(spans, items):
+    if span_end <= start:
+      before.append(([span_start, span_end], item))
+    elif span_start >= end:
+      after.append(([span_start + shift, span_end + shift], item))
+    else:
+      inside.append(item)
+
+  return before, inside, after
+
+def renumber_declarations(declarations, spans, line_numbers):
+  '''
+  Returns the global declarations with the line numbers of their spans in the new code; a declaration whose line did not move is reused
+
+  Parameters:
+    declarations (list of dictionaries): global declarations of a previous result
+    spans (list of lists): [start, end] slice of the new code for each declaration
+    line_numbers (list of integers): line number in the sketch of each line of the new code
+
+  Returns:
+     declarations (list of dictionaries): the declarations with up-to-date line numbers
+  '''
+
+  return [declaration if declaration.get('line') == line_numbers[span_start] else dict(declaration, line=line_numbers[span_start])
+          for declaration, (span_start, _) in zip(declarations, spans)]
+
+def reuse_methods(previous_pc):
+  '''
+  Returns a function for the "create_method" argument of "parse_methods" that gives back a method from previous_pc when
+  its code is unchanged and only calls "create_method_dict" for new or edited methods. A method is matched by its lines
+  without leading or trailing whitespace, which is all "create_method_dict" looks at
+
+  Parameters:
+    previous_pc (dictionary): earlier parse result
+
+  Returns:
+     create_method (function): takes the lines of a method, its block index and its line kinds and returns a parsed method
+  '''
+
+  previous = dict()
+  for method in previous_pc.get('methods'):
+    previous[tuple(method.get('code'))] = method
+  for parsed_class in previous_pc.get('classes') or []:
+    for method in parsed_class.get('methods'):
+      previous[tuple(method.get('code'))] = method
+
+  def create_method(method, blocks=None, kinds=None):
+    key = tuple(line.strip() for line in method)
+    if key in previous:
+      return previous[key]
+    return create_method_dict(method, blocks, kinds)
+
+  return create_method
+
+#######################
+## Batch Parsing
+#######################
+
+## Small files are grouped into chunks of roughly CHUNK_BYTES
+## so each trip to a worker process parses several files.
+CHUNK_BYTES = 64 * 1024
+
+def parse_many(paths, sketch_methods=None, class_methods=None, workers=None, chunk_bytes=CHUNK_BYTES, cache=None, stats=None):
+  '''
+  Parses many student files over a pool of processes; yields each result as soon as it is ready (completion order, not input order)
+
+  Parameters:
+    paths (list of strings): student files to be parsed; should include the path
+    sketch_methods (list of strings): methods to parse from every sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    workers (integer): number of worker processes; defaults to "None", which uses one per CPU
+    chunk_bytes (integer): files are grouped into chunks of about this many bytes per task; defaults to CHUNK_BYTES
+    cache (ParseCache): on-disk cache shared by the workers; defaults to "None". Hit and miss counters are kept by each worker, not by this object
+    stats (ParseStats): records the phases of every parse; the workers send their timings back with the results. Defaults to None
+
+  Returns:
+     (path, pc) (tuple): the file and its parsed student code, or the exception raised while parsing it (generator)
+  '''
+
+  chunks = chunk_paths(paths, chunk_bytes)
+  if stats is None:
+    for results in map_chunks(parse_chunk, chunks, (sketch_methods, class_methods, cache), workers):
+      for path, result in results:
+        yield path, result
+    return
+
+  for results, records in map_chunks(parse_timed_chunk, chunks, (sketch_methods, class_methods, cache), workers):
+    for record in records:
+      stats.add(record)
+    for path, result in results:
+      yield path, result
+
+def map_chunks(function, chunks, args=(), workers=None):
+  '''
+  Calls function(chunk, *args) for every chunk over a pool of processes; yields each return value as soon as it is ready.
+  Only a few chunks per worker are submitted at a time, so chunks can be produced lazily without all of them being held in memory
+
+  Parameters:
+    function (function): module-level function run in the worker processes
+    chunks (iterable): the first argument of each call
+    args (tuple): the remaining arguments of every call; defaults to no arguments
+    workers (integer): number of worker processes; defaults to "None", which uses one per CPU
+
+  Returns:
+     result (any): return value of one call (generator)
+  '''
+
+  in_flight = 2 * (workers or os.cpu_count() or 1)
+  executor = ProcessPoolExecutor(max_workers=workers)
+  pending = set()
+  try:
+    for chunk in chunks:
+      if len(pending) >= in_flight:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          yield future.result()
+      pending.add(executor.submit(function, chunk, *args))
+    for future in as_completed(pending):
+      yield future.result()
+  finally:
+    executor.shutdown(wait=True, cancel_futures=True)
+
+def chunk_paths(paths, chunk_bytes):
+  '''
+  Returns a list of lists of paths where the files in each inner list add up to about "chunk_bytes"
+
+  Parameters:
+    paths (list of strings): student files to be parsed
+    chunk_bytes (integer): target size of each chunk in bytes
+
+  Returns:
+     chunks (list of lists of strings): groups of paths; every path appears exactly once
+  '''
+
+  chunks = []
+  chunk = []
+  size = 0
+  for path in paths:
+    try:
+      size += os.path.getsize(path)
+    except OSError:
+      pass
+    chunk.append(path)
+    if size >= chunk_bytes:
+      chunks.append(chunk)
+      chunk = []
+      size = 0
+  if chunk:
+    chunks.append(chunk)
+
+  return chunks
+
+def parse_chunk(paths, sketch_methods, class_methods, cache=None):
+  '''
+  Returns a list of tuples with the parsed student code for each path; runs inside a worker process
+
+  Parameters:
+    paths (list of strings): student files to be parsed
+    sketch_methods (list of strings): methods expected to be found in every sketch
+    class_methods (list of strings): methods to parse from each user-defined class
+    cache (ParseCache): on-disk cache of parse results; defaults to "None"
+
+  Returns:
+     results (list of tuples): (path, pc) for each file; pc is the exception raised if the file could not be parsed
+  '''
+
+  results = []
+  for path in paths:
+    try:
+      results.append((path, parse_student_code(path, sketch_methods, class_methods, cache)))
+    except Exception as error:
+      results.append((path, error))
+
+  return results
+
+def parse_timed_chunk(paths, sketch_methods, class_methods, cache=None):
+  '''
+  Returns the same results as "parse_chunk" plus the timing record of every parse; runs inside a worker process
+
+  Parameters:
+    paths (list of strings): student files to be parsed
+    sketch_methods (list of strings): methods expected to be found in every sketch
+    class_methods (list of strings): methods to parse from each user-defined class
+    cache (ParseCache): on-disk cache of parse results; defaults to "None"
+
+  Returns:
+     (results, records) (tuple): results as returned by "parse_chunk" and a list of records as passed to "ParseStats.add"
+  '''
+
+  records = []
+  stats = ParseStats(records.append)
+  results = []
+  for path in paths:
+    try:
+      results.append((path, parse_student_code(path, sketch_methods, class_methods, cache, stats=stats)))
+    except Exception as error:
+      results.append((path, error))
+
+  return results, records
+
+##############################
+## Parsing Submission Archives
+##############################
+
+def parse_archive(archive_name, sketch_methods=None, class_methods=None, workers=None, chunk_bytes=CHUNK_BYTES, extension='.pde'):
+  '''
+  Parses the sketches in a zip or tar archive without extracting it; yields the results for each sketch directory as soon as they are ready
+
+  Parameters:
+    archive_name (string): zip or tar archive (compressed or not); should include the path
+    sketch_methods (list of strings): methods to parse from every sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    workers (integer): number of worker processes; defaults to "None", which uses one per CPU
+    chunk_bytes (integer): sketches are grouped into chunks of about this many bytes per task; defaults to CHUNK_BYTES
+    extension (string): only archive members ending with this are parsed; defaults to ".pde"
+
+  Returns:
+     (directory, results) (tuple): directory inside the archive and a dictionary mapping the name of each member in it
+                                   to its parsed student code, or to the exception raised while parsing it (generator)
+  '''
+
+  chunks = chunk_sketches(iter_archive_sketches(archive_name, extension), chunk_bytes)
+  for results in map_chunks(parse_sketch_chunk, chunks, (sketch_methods, class_methods), workers):
+    for directory, members in results:
+      yield directory, members
+
+def iter_archive(archive_name, extension='.pde'):
+  '''
+  Yields the name and contents of every matching member of a zip or tar archive, reading one member at a time
+
+  Parameters:
+    archive_name (string): zip or tar archive (compressed or not); should include the path
+    extension (string): only members ending with this are read; defaults to ".pde"
+
+  Returns:
+     (name, data) (tuple): name of the member inside the archive and its contents as bytes (generator)
+  '''
+
+  if zipfile.is_zipfile(archive_name):
+    with zipfile.ZipFile(archive_name) as archive:
+      for member in archive.infolist():
+        if not member.is_dir() and member.filename.endswith(extension):
+          yield member.filename, archive.read(member)
+  else:
+    with tarfile.open(archive_name, 'r|*') as archive:
+      for member in archive:
+        if member.isfile() and member.name.endswith(extension):
+          yield member.name, archive.extractfile(member).read()
+
+def iter_archive_sketches(archive_name, extension='.pde'):
+  '''
+  Yields the members of an archive grouped by the directory they are in; every directory is one sketch.
+  Members of the same directory are expected to be next to each other in the archive, as zip and tar tools write them
+
+  Parameters:
+    archive_name (string): zip or tar archive (compressed or not); should include the path
+    extension (string): only members ending with this are read; defaults to ".pde"
+
+  Returns:
+     (directory, members) (tuple): directory inside the archive and a list of (name, data) tuples (generator)
+  '''
+
+  directory = None
+  members = []
+  for name, data in iter_archive(archive_name, extension):
+    member_directory = os.path.dirname(name)
+    if members and member_directory != directory:
+      yield directory, members
+      members = []
+    directory = member_directory
+    members.append((name, data))
+  if members:
+    yield directory, members
+
+def chunk_sketches(sketches, chunk_bytes):
+  '''
+  Yields lists of sketches whose members add up to about "chunk_bytes"
+
+  Parameters:
+    sketches (iterable of tuples): (directory, members) tuples from "iter_archive_sketches"
+    chunk_bytes (integer): target size of each chunk in bytes
+
+  Returns:
+     chunk (list of tuples): group of sketches; every sketch appears exactly once (generator)
+  '''
+
+  chunk = []
+  size = 0
+  for directory, members in sketches:
+    chunk.append((directory, members))
+    size += sum(len(data) for _, data in members)
+    if size >= chunk_bytes:
+      yield chunk
+      chunk = []
+      size = 0
+  if chunk:
+    yield chunk
+
+def parse_sketch_chunk(sketches, sketch_methods, class_methods):
+  '''
+  Returns a list of tuples with the parsed student code for each member of each sketch; runs inside a worker process
+
+  Parameters:
+    sketches (list of tuples): (directory, members) tuples from "iter_archive_sketches"
+    sketch_methods (list of strings): methods expected to be found in every sketch
+    class_methods (list of strings): methods to parse from each user-defined class
+
+  Returns:
+     results (list of tuples): (directory, {name: pc}) for each sketch; pc is the exception raised if the member could not be parsed
+  '''
+
+  results = []
+  for directory, members in sketches:
+    parsed_members = dict()
+    for name, data in members:
+      try:
+        parsed_members[name] = parse_source(data, sketch_methods, class_methods)
+      except Exception as error:
+        parsed_members[name] = error
+    results.append((directory, parsed_members))
+
+  return results
+
+#######################
+## Parsing Sketch Folders
+#######################
+
+def parse_sketch_dir(directory, sketch_methods=None, class_methods=None, cache=None, workers=None, extension='.pde', stats=None):
+  '''
+  Returns a dictionary that is the parsed student code for a sketch folder with one or more tabs. The tabs are read
+  and parsed on a pool of threads, one result per tab, and then merged with "merge_tabs". Each tab is parsed on its own,
+  so with a cache only the tabs that changed are parsed again
+
+  Parameters:
+    directory (string): path to the sketch folder
+    sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    cache (ParseCache): stores and reuses the result for each tab; defaults to None, which does not cache
+    workers (integer): number of threads reading and parsing tabs; defaults to None, which lets the pool decide
+    extension (string): only files ending with this are tabs; defaults to ".pde"
+    stats (ParseStats): records the phases of the parse of each tab; defaults to None
+
+  Returns:
+     pc (dictionary): parsed student code with the same keys as "parse_student_code" plus tabs and provenance; see "merge_tabs"
+  '''
+
+  tabs = get_tab_order(directory, [name for name in os.listdir(directory) if name.endswith(extension)])
+  paths = [os.path.join(directory, name) for name in tabs]
+  with ThreadPoolExecutor(workers) as executor:
+    results = list(executor.map(parse_student_code, paths, repeat(sketch_methods), repeat(class_methods), repeat(cache),
+                                repeat(False), repeat(False), repeat(False), repeat(stats)))
+
+  return merge_tabs(zip(tabs, results), sketch_methods)
+
+def get_tab_order(directory, names):
+  '''
+  Returns the tab names in the order Processing shows them: the main tab, named after the folder, followed by the rest in alphabetical order
+
+  Parameters:
+    directory (string): path to the sketch folder
+    names (list of strings): file names of the tabs
+
+  Returns:
+     tabs (list of strings): the tab names in order
+  '''
+
+  main_tab = os.path.basename(os.path.normpath(directory))
+
+  return sorted(names, key=lambda name: (os.path.splitext(name)[0] != main_tab, name))
+
+def merge_tabs(tabs, sketch_methods=None):
+  '''
+  Returns one parse result for a sketch made from the parse results of its tabs. Methods and classes are listed tab by tab,
+  full_code and code are the tabs one after the other, and global variables are combined and sorted. The provenance is
+  read from the spans and line numbers of each tab, so no tab is parsed again
+
+  Parameters:
+    tabs (iterable of tuples): (tab name, parsed student code) for each tab, in order
+    sketch_methods (list of strings): no longer used, since each tab's spans list the methods it was parsed with; kept for compatibility
+
+  Returns:
+     pc (dictionary): parsed student code with two more keys. "tabs" is the list of tab names. "provenance" has the keys
+                      methods, classes, global_declarations, and global_variables; each is a list of [tab name, line number]
+                      pairs that lines up with the list of the same name. Line numbers start at 1 and count every line of the
+                      tab as written; the "line" of each global declaration and the line_numbers are also within their own tab
+  '''
+
+  pc = {'full_code': [], 'code': [], 'methods': [], 'classes': [], 'global_declarations': [], 'line_numbers': [], 'tabs': []}
+  pc['spans'] = {'methods': [], 'classes': [], 'global_declarations': []}
+  provenance = {'methods': [], 'classes': [], 'global_declarations': []}
+  for tab, tab_pc in tabs:
+    offset = len(pc['code'])
+    line_numbers = tab_pc.get('line_numbers')
+    spans = tab_pc.get('spans')
+    pc['tabs'].append(tab)
+    pc['full_code'].extend(tab_pc.get('full_code'))
+    pc['code'].extend(tab_pc.get('code'))
+    pc['line_numbers'].extend(line_numbers)
+    pc['methods'].extend(tab_pc.get('methods'))
+    pc['classes'].extend(tab_pc.get('classes'))
+    for key, tab_spans in spans.items():
+      pc['spans'][key].extend([start + offset, end + offset] for start, end in tab_spans)
+    provenance['methods'].extend([tab, line_numbers[start]] for start, _ in spans.get('methods'))
+    provenance['classes'].extend([tab, line_numbers[start]] for start, _ in spans.get('classes'))
+    pc['global_declarations'].extend(tab_pc.get('global_declarations'))
+    provenance['global_declarations'].extend([tab, declaration.get('line')] for declaration in tab_pc.get('global_declarations'))
+  order = sorted(range(len(pc['global_declarations'])), key=lambda position: pc['global_declarations'][position]['code'])
+  pc['global_variables'] = [pc['global_declarations'][position]['code'] for position in order]
+  provenance['global_variables'] = [provenance['global_declarations'][position] for position in order]
+  pc['method_index'] = build_method_index(pc.get('methods'))
+  pc['class_method_index'] = {parsed_class.get('name'): build_method_index(parsed_class.get('methods')) for parsed_class in pc.get('classes')}
+  pc['provenance'] = provenance
 
   return pc
 
+#######################
+## Timing Parse Phases
+#######################
+
+class ParseStats:
+  '''
+  Collects the time spent in each phase of every parse it is passed to, with the size of each sketch. Pass the same
+  object to many calls (or to "parse_many") to add up a whole batch. Each parse makes a record, which is a dictionary
+  with the keys name, seconds, phases (seconds per phase), lines, code_lines, blocks, methods, and classes. The phases
+  are read_file, strip_comments, get_block_index, classify_lines, build_symbol_table, parse_methods, parse_classes,
+  get_global_variables, and build_method_index. It can be shared by threads.
+
+  Attributes:
+    callback (function): called with each record as soon as the parse finishes; None if not given
+    parses (integer): number of parses recorded
+    seconds (float): total time of the recorded parses
+    phases (dictionary): total seconds spent in each phase
+    counts (dictionary): totals of lines, code_lines, blocks, methods, and classes
+  '''
+
+  def __init__(self, callback=None):
+    '''
+    Parameters:
+      callback (function): called with each record; defaults to None
+    '''
+
+    self.callback = callback
+    self.parses = 0
+    self.seconds = 0.0
+    self.phases = dict()
+    self.counts = dict.fromkeys(('lines', 'code_lines', 'blocks', 'methods', 'classes'), 0)
+    self.lock = threading.Lock()
+
+  def start(self, name=None):
+    '''
+    Returns a ParseTimer for one parse; the clock starts now
+
+    Parameters:
+      name (string): file being parsed; defaults to None
+    '''
+
+    return ParseTimer(self, name)
+
+  def add(self, record):
+    '''
+    Adds one record to the totals and passes it to the callback
+
+    Parameters:
+      record (dictionary): record made by a ParseTimer, here or in another process
+    '''
+
+    with self.lock:
+      self.parses += 1
+      self.seconds += record.get('seconds')
+      for phase, seconds in record.get('phases').items():
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+      for key in self.counts:
+        self.counts[key] += record.get(key)
+    if self.callback is not None:
+      self.callback(record)
+
+  def to_dict(self):
+    '''
+    Returns the totals as a dictionary with the keys parses, seconds, phases, and counts, plus share: the fraction of
+    the total time spent in each phase
+    '''
+
+    with self.lock:
+      share = {phase: seconds / self.seconds if self.seconds else 0.0 for phase, seconds in self.phases.items()}
+      return {'parses': self.parses, 'seconds': self.seconds, 'phases': dict(self.phases), 'counts': dict(self.counts), 'share': share}
+
+  def __repr__(self):
+    slowest = max(self.phases, key=self.phases.get) if self.phases else None
+    return 'ParseStats(parses=%d, seconds=%.4f, slowest=%r)' % (self.parses, self.seconds, slowest)
+
+class ParseTimer:
+  '''
+  Times the phases of one parse for a ParseStats; "lap" records the time since the previous lap under a phase name
+  '''
+
+  __slots__ = ('stats', 'record', 'started', 'last')
+
+  def __init__(self, stats, name=None):
+    self.stats = stats
+    self.record = {'name': name, 'seconds': 0.0, 'phases': dict()}
+    self.started = self.last = time.perf_counter()
+
+  def lap(self, phase):
+    now = time.perf_counter()
+    self.record['phases'][phase] = self.record['phases'].get(phase, 0.0) + now - self.last
+    self.last = now
+
+  def finish(self, pc, blocks):
+    '''
+    Completes the record with the size of the parsed sketch and adds it to the ParseStats
+    '''
+
+    self.record['seconds'] = self.last - self.started
+    self.record['lines'] = len(pc.get('full_code'))
+    self.record['code_lines'] = len(pc.get('code'))
+    self.record['blocks'] = len(blocks)
+    self.record['methods'] = len(pc.get('methods'))
+    self.record['classes'] = len(pc.get('classes'))
+    self.stats.add(self.record)
+
+#######################
+## Caching Parse Results
+#######################
+
+## Default limit on the total size of a cache directory (256 MB)
+CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+class ParseCache:
+  '''
+  On-disk cache of parse results. Each entry is keyed by a hash of the file contents, the expected methods and PARSER_VERSION,
+  so renaming or copying a file still hits the cache and editing it misses. When the directory grows past "max_bytes"
+  the least recently used entries are deleted.
+
+  Attributes:
+    directory (string): directory where the cache entries are stored
+    max_bytes (integer): limit on the total size of the cache entries
+    hits (integer): number of parses answered from the cache by this object
+    misses (integer): number of parses that had to be run by this object
+  '''
+
+  def __init__(self, directory, max_bytes=CACHE_MAX_BYTES):
+    '''
+    Parameters:
+      directory (string): directory where the cache entries are stored; created if it does not exist
+      max_bytes (integer): limit on the total size of the cache entries; defaults to CACHE_MAX_BYTES
+    '''
+
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(directory, exist_ok=True)
+    self.size = sum(size for _, size, _ in self.entry_stats())
+
+  def parse(self, file_name, sketch_methods=None, class_methods=None, stats=None):
+    '''
+    Returns a dictionary of the parsed student code, reusing a cached result when the file has been parsed before
+
+    Parameters:
+      file_name (string): student file to be parsed; should include the path
+      sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+      class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+      stats (ParseStats): records the phases of the parse on a cache miss; defaults to None
+
+    Returns:
+       pc (dictionary): parsed student code
+    '''
+
+    with open(file_name, 'rb') as data:
+      return self.parse_source(data.read(), sketch_methods, class_methods, stats, file_name)
+
+  def parse_source(self, source, sketch_methods=None, class_methods=None, stats=None, name=None):
+    '''
+    Returns a dictionary of the parsed student code given the contents of a sketch, reusing a cached result when the same contents have been parsed before
+
+    Parameters:
+      source (string or bytes): contents of the student sketch
+      sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+      class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+      stats (ParseStats): records the phases of the parse on a cache miss; decoding is recorded as "read_file". Defaults to None
+      name (string): name of the parse record, e.g. the file the source was read from; defaults to None
+
+    Returns:
+       pc (dictionary): parsed student code
+    '''
+
+    file_bytes = source.encode('utf-8') if isinstance(source, str) else source
+    key = self.key(file_bytes, sketch_methods, class_methods)
+    pc = self.get(key)
+    if pc is None:
+      timer = stats.start(name) if stats is not None else None
+      full_code = split_lines(decode_source(source))
+      if timer is not None:
+        timer.lap('read_file')
+      pc = parse_lines(full_code, sketch_methods, class_methods, timer)
+      self.put(key, pc)
+
+    return pc
+
+  def key(self, file_bytes, sketch_methods, class_methods):
+    '''
+    Returns a string that identifies a parse result
+
+    Parameters:
+      file_bytes (bytes): contents of the student file
+      sketch_methods (list of strings): methods expected to be found in the sketch
+      class_methods (list of strings): methods to parse from each user-defined class
+
+    Returns:
+       key (string): hex digest of the file contents, the expected methods and PARSER_VERSION
+    '''
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([PARSER_VERSION, sketch_methods, class_methods]).encode('utf-8'))
+    digest.update(file_bytes)
+
+    return digest.hexdigest()
+
+  def get(self, key):
+    '''
+    Returns the cached parse result for a key and marks it as recently used
+
+    Parameters:
+      key (string): key built by the "key" method
+
+    Returns:
+       pc (dictionary): parsed student code; returns "None" if the key is not in the cache
+    '''
+
+    path = self.entry_path(key)
+    try:
+      with open(path, 'r', encoding='utf-8') as data:
+        pc = json.load(data)
+      os.utime(path)
+    except (OSError, ValueError):
+      self.misses += 1
+      return None
+    self.hits += 1
+
+    return pc
+
+  def put(self, key, pc):
+    '''
+    Stores a parse result in the cache and evicts old entries if the cache is over its size limit. Storing is best effort:
+    the directory may be shared with other processes that evict the same entries, so a failed write is ignored
+
+    Parameters:
+      key (string): key built by the "key" method
+      pc (dictionary): parsed student code
+    '''
+
+    path = self.entry_path(key)
+    temp_path = None
+    try:
+      handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+      with os.fdopen(handle, 'w', encoding='utf-8') as data:
+        json.dump(pc, data)
+      old_size = self.entry_size(path)
+      os.replace(temp_path, path)
+      temp_path = None
+      self.size += self.entry_size(path) - old_size
+      if self.size > self.max_bytes:
+        self.evict()
+    except OSError:
+      if temp_path is not None:
+        try:
+          os.remove(temp_path)
+        except OSError:
+          pass
+
+  def evict(self):
+    '''
+    Deletes the least recently used entries until the cache is within its size limit
+    '''
+
+    entries = sorted(self.entry_stats())
+    self.size = sum(size for _, size, _ in entries)
+    for _, size, path in entries:
+      if self.size <= self.max_bytes:
+        break
+      try:
+        os.remove(path)
+      except OSError:
+        continue
+      self.size -= size
+
+  def clear(self):
+    '''
+    Deletes every entry in the cache and resets the hit and miss counters
+    '''
+
+    for entry in self.entries():
+      try:
+        os.remove(entry.path)
+      except FileNotFoundError:
+        continue
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+
+  def stats(self):
+    '''
+    Returns a dictionary with the hit and miss counters and the size of the cache
+
+    Returns:
+       stats (dictionary): has the keys hits, misses, and size
+    '''
+
+    return {'hits': self.hits, 'misses': self.misses, 'size': self.size}
+
+  def entries(self):
+    '''
+    Returns a list of directory entries for the cached parse results
+    '''
+
+    return [entry for entry in os.scandir(self.directory) if entry.name.endswith('.json')]
+
+  def entry_stats(self):
+    '''
+    Returns a list of (modification time, size, path) tuples for the cached parse results; entries deleted by another
+    process while the directory is read are left out
+    '''
+
+    stats = []
+    for entry in self.entries():
+      try:
+        entry_stat = entry.stat()
+      except OSError:
+        continue
+      stats.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+
+    return stats
+
+  def entry_size(self, path):
+    '''
+    Returns the size of a cache entry in bytes, or 0 if it does not exist (e.g. another process evicted it)
+    '''
+
+    try:
+      return os.path.getsize(path)
+    except OSError:
+      return 0
+
+  def entry_path(self, key):
+    '''
+    Returns the path of the file that stores the entry for a key
+    '''
+
+    return os.path.join(self.directory, key + '.json')
+
+###########################
+## Memoizing Parse Results
+###########################
+
+## Number of parse results kept in memory by "memoized_parse"
+MEMO_SIZE = 128
+
+memo = OrderedDict()
+
+def memoized_parse(file_name, sketch_methods=None, class_methods=None, cache=None, stats=None):
+  '''
+  Returns a read-only dictionary of the parsed student code; repeated calls for a file that has not changed return the same object
+
+  Parameters:
+    file_name (string): student file to be parsed; should include the path
+    sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    cache (ParseCache): on-disk cache used when the result is not in memory; defaults to "None"
+    stats (ParseStats): records the phases of the parse when the result is not in memory or the cache; defaults to None
+
+  Returns:
+     pc (ReadOnlyDict): parsed student code shared by every caller
+  '''
+
+  file_stat = os.stat(file_name)
+  key = (os.path.abspath(file_name), file_stat.st_mtime_ns, file_stat.st_size,
+         tuple(sketch_methods) if sketch_methods is not None else None, tuple(class_methods) if class_methods is not None else None)
+  pc = memo.get(key)
+  if pc is not None:
+    memo.move_to_end(key)
+    return pc
+
+  pc = freeze(parse_student_code(file_name, sketch_methods, class_methods, cache, stats=stats))
+  memo[key] = pc
+  while len(memo) > MEMO_SIZE:
+    memo.popitem(last=False)
+
+  return pc
+
+def invalidate_memo(file_name=None):
+  '''
+  Removes memoized parse results so the next call parses the file again
+
+  Parameters:
+    file_name (string): file whose results are removed; defaults to "None", which removes every result
+  '''
+
+  if file_name is None:
+    memo.clear()
+    return
+
+  path = os.path.abspath(file_name)
+  for key in [key for key in memo if key[0] == path]:
+    del memo[key]
+
+def freeze(value):
+  '''
+  Returns a read-only copy of a parse result; dictionaries become ReadOnlyDict and lists become ReadOnlyList
+
+  Parameters:
+    value (dictionary, list or string): parse result or part of a parse result
+
+  Returns:
+     frozen (ReadOnlyDict, ReadOnlyList or string): copy that raises TypeError when modified
+  '''
+
+  if isinstance(value, dict):
+    return ReadOnlyDict((key, freeze(item)) for key, item in value.items())
+  if isinstance(value, list):
+    return ReadOnlyList(freeze(item) for item in value)
+
+  return value
+
+def read_only(self, *args, **kwargs):
+  '''
+  Raises TypeError; stands in for every method that would modify a ReadOnlyDict or ReadOnlyList
+  '''
+
+  raise TypeError('memoized parse results are shared and cannot be modified')
+
+class ReadOnlyDict(dict):
+  '''
+  Dictionary that cannot be modified; compares equal to a plain dictionary with the same contents
+  '''
+
+  __setitem__ = __delitem__ = __ior__ = read_only
+  clear = pop = popitem = setdefault = update = read_only
+
+  def __reduce__(self):
+    return (ReadOnlyDict, (dict(self),))
+
+class ReadOnlyList(list):
+  '''
+  List that cannot be modified; compares equal to a plain list with the same contents
+  '''
+
+  __setitem__ = __delitem__ = __iadd__ = __imul__ = read_only
+  append = extend = insert = remove = pop = clear = sort = reverse = read_only
+
+  def __reduce__(self):
+    return (ReadOnlyList, (list(self),))
+
+#######################
+## Typed Parse Results
+#######################
+
+## The classes below hold the same information as the nested dictionaries
+## built by "parse_student_code" but use __slots__ instead of a dictionary
+## per object. They keep the "get" method so every function in QPC works
+## with either representation.
+
+class ParsedNode:
+  '''
+  Base class for typed parse results. Subclasses list their keys in "fields" and store them in __slots__; the keys can be read as attributes,
+  with "get" or with square brackets. A typed result compares equal to the dictionary it was built from.
+  '''
+
+  __slots__ = ()
+  fields = ()
+  __hash__ = None
+
+  def __init__(self, **fields):
+    for key in self.fields:
+      setattr(self, key, fields.get(key))
+
+  @classmethod
+  def from_dict(cls, data):
+    '''
+    Returns a typed result built from a dictionary with the same keys
+    '''
+
+    return cls(**data)
+
+  def get(self, key, default=None):
+    '''
+    Returns the value for a key, or "default" if it is not one of the keys
+    '''
+
+    return getattr(self, key) if key in self.fields else default
+
+  def __getitem__(self, key):
+    if key not in self.fields:
+      raise KeyError(key)
+    return getattr(self, key)
+
+  def __contains__(self, key):
+    return key in self.fields
+
+  def __iter__(self):
+    return iter(self.fields)
+
+  def __len__(self):
+    return len(self.fields)
+
+  def keys(self):
+    return list(self.fields)
+
+  def items(self):
+    return [(key, getattr(self, key)) for key in self.fields]
+
+  def to_dict(self):
+    '''
+    Returns the nested dictionaries "parse_student_code" would have built for this result
+    '''
+
+    return {key: to_plain(getattr(self, key)) for key in self.fields}
+
+  def __eq__(self, other):
+    if isinstance(other, (ParsedNode, dict)):
+      return self.to_dict() == to_plain(other)
+    return NotImplemented
+
+  def __repr__(self):
+    return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % item for item in self.items()))
+
+class Loop(ParsedNode):
+  '''
+  Typed loop; has the keys type, code, and start
+  '''
+
+  fields = __slots__ = ('type', 'code', 'start')
+
+class Conditional(ParsedNode):
+  '''
+  Typed conditional; has the keys code, true_branch, false_branch, and start
+  '''
+
+  fields = __slots__ = ('code', 'true_branch', 'false_branch', 'start')
+
+class ParsedMethod(ParsedNode):
+  '''
+  Typed method; has the keys return_type, name, parameters, code, conditionals, loops, and return_value
+  '''
+
+  fields = __slots__ = ('return_type', 'name', 'parameters', 'code', 'conditionals', 'loops', 'return_value')
+
+  @classmethod
+  def from_dict(cls, data):
+    method = cls(**data)
+    method.conditionals = [Conditional.from_dict(conditional) for conditional in data.get('conditionals')]
+    method.loops = [Loop.from_dict(loop) for loop in data.get('loops')]
+    return method
+
+class ParsedClass(ParsedNode):
+  '''
+  Typed user-defined class; has the keys name, parent, code, methods, constructors, constructor, and attributes
+  '''
+
+  fields = __slots__ = ('name', 'parent', 'code', 'methods', 'constructors', 'constructor', 'attributes')
+
+  @classmethod
+  def from_dict(cls, data):
+    parsed_class = cls(**data)
+    parsed_class.methods = [ParsedMethod.from_dict(method) for method in data.get('methods')]
+    return parsed_class
+
+class ParsedSketch(ParsedNode):
+  '''
+  Typed student sketch; has the keys full_code, code, methods, classes, global_declarations, global_variables, method_index, class_method_index,
+  spans, and line_numbers
+  '''
+
+  fields = __slots__ = ('full_code', 'code', 'methods', 'classes', 'global_declarations', 'global_variables', 'method_index', 'class_method_index',
+                        'spans', 'line_numbers')
+
+  @classmethod
+  def from_dict(cls, data):
+    sketch = cls(**data)
+    sketch.methods = [ParsedMethod.from_dict(method) for method in data.get('methods')]
+    sketch.classes = [ParsedClass.from_dict(parsed_class) for parsed_class in data.get('classes')]
+    return sketch
+
+#######################
+## Lazy Parse Results
+#######################
+
+class LazyNode:
+  '''
+  Mixin for typed parse results whose keys are computed the first time they are read. A key that has not been
+  computed yet is an empty slot; reading it calls the "compute_<key>" method and stores the result in the slot.
+  '''
+
+  __slots__ = ()
+
+  def __getattr__(self, key):
+    compute = getattr(type(self), 'compute_' + key, None)
+    if compute is None:
+      raise AttributeError(key)
+    value = compute(self)
+    setattr(self, key, value)
+    return value
+
+  def is_computed(self, key):
+    '''
+    Returns a boolean denoting if a key has already been computed
+    '''
+
+    try:
+      object.__getattribute__(self, key)
+    except AttributeError:
+      return False
+    return True
+
+class LazyParsedMethod(LazyNode, ParsedMethod):
+  '''
+  Typed method whose conditionals, loops, and return_value are parsed the first time they are read. Its control_flow
+  attribute is the tree built by "build_control_flow"; it is not one of the keys
+  '''
+
+  __slots__ = ('blocks', 'kinds', 'control_flow')
+
+  def __init__(self, method, blocks=None, kinds=None):
+    '''
+    Parameters:
+      method (list of strings): represents the lines of code in a method
+      blocks (dictionary): block index for the method built by "get_block_index"; defaults to None, which builds it when needed
+      kinds (array): line kinds for the method built by "classify_lines"; defaults to None, which builds them when needed
+    '''
+
+    header = join_header(method, 0)
+    self.return_type = get_method_type(header)
+    self.name = get_method_name(header)
+    self.parameters = get_method_parameters(header)
+    self.code = [line.strip() for line in method]
+    if blocks is not None:
+      self.blocks = blocks
+    if kinds is not None:
+      self.kinds = kinds
+
+  def compute_blocks(self):
+    return get_block_index(self.code)
+
+  def compute_kinds(self):
+    return classify_lines(self.code)
+
+  def compute_conditionals(self):
+    return parse_conditional(self.code, self.blocks, self.kinds)
+
+  def compute_loops(self):
+    return parse_loops(self.code, self.blocks, self.kinds)
+
+  def compute_return_value(self):
+    return get_return_value(self.code, self.kinds)
+
+  def compute_control_flow(self):
+    return build_control_flow(self.code, self.kinds)
+
+class LazyParsedSketch(LazyNode, ParsedSketch):
+  '''
+  Typed student sketch that only parses a key the first time it is read; reading every key gives the same result as
+  "parse_student_code". Methods are LazyParsedMethod objects.
+  '''
+
+  __slots__ = ('sketch_methods', 'class_methods', 'blocks', 'symbols')
+
+  def __init__(self, full_code, sketch_methods=None, class_methods=None):
+    '''
+    Parameters:
+      full_code (list of strings): lines of student code as they wrote it
+      sketch_methods (list of strings): methods to parse from the sketch; defaults to "None", which parses every method
+      class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    '''
+
+    self.full_code = full_code
+    self.sketch_methods = sketch_methods
+    self.class_methods = class_methods
+
+  def compute_code(self):
+    code, self.line_numbers = strip_comments_with_line_numbers(self.full_code)
+    return code
+
+  def compute_line_numbers(self):
+    self.code
+    return self.line_numbers
+
+  def compute_blocks(self):
+    return get_block_index(self.code)
+
+  def compute_symbols(self):
+    return build_symbol_table(self.code, self.blocks)
+
+  def compute_methods(self):
+    return parse_methods(self.code, self.sketch_methods, self.blocks, LazyParsedMethod, self.symbols)
+
+  def compute_classes(self):
+    return [ParsedClass(**parsed_class) for parsed_class in parse_classes(self.code, self.class_methods, self.blocks, LazyParsedMethod, self.symbols)]
+
+  def compute_global_declarations(self):
+    return get_global_declarations(self.code, self.symbols, self.line_numbers)
+
+  def compute_global_variables(self):
+    return sorted(declaration['code'] for declaration in self.global_declarations)
+
+  def compute_method_index(self):
+    return build_method_index(self.methods)
+
+  def compute_class_method_index(self):
+    return {parsed_class.name: build_method_index(parsed_class.methods) for parsed_class in self.classes}
+
+  def compute_spans(self):
+    return get_spans(self.symbols, self.sketch_methods)
+
+def to_typed(pc):
+  '''
+  Returns a ParsedSketch built from the nested dictionaries returned by "parse_student_code"
+
+  Parameters:
+    pc (dictionary): parsed student code
+
+  Returns:
+     sketch (ParsedSketch): parsed student code as slotted objects
+  '''
+
+  return ParsedSketch.from_dict(pc)
+
+def to_plain(value):
+  '''
+  Returns a copy of a parse result made only of dictionaries, lists and strings
+
+  Parameters:
+    value (ParsedNode, dictionary, list or string): parse result or part of a parse result
+
+  Returns:
+     plain (dictionary, list or string): the same information without typed objects
+  '''
+
+  if isinstance(value, ParsedNode):
+    return value.to_dict()
+  if isinstance(value, dict):
+    return {key: to_plain(item) for key, item in value.items()}
+  if isinstance(value, list):
+    return [to_plain(item) for item in value]
+
+  return value
+
 #######################
 ## General Functions
 #######################
@@ -72,98 +1598,313 @@ def read_file(file_name):
   Returns a list of strings representing the student code as they wrote it
 
   Parameters:
-    file_name (string): student file to be parsed; should include the path
+    file_name (string): student file to be parsed; should include the path
+
+  Returns:
+     data (list of strings): lines of student code as they wrote it (no changes made)
+  '''
+
+  with open(file_name, 'r') as data:
+    return data.readlines()
+
+def find_lines(code, matches, start=0):
+  '''
+  Yields the index of every line in the code list for which "matches" is true; lines are visited by position so repeated lines each keep their own index
+
+  Parameters:
+    code (list of strings): represents lines of code
+    matches (function): takes a line of code and returns a boolean
+    start (integer): index of the first line to examine; defaults to 0
+
+  Returns:
+     index (integer): index of a matching line of code (generator)
+  '''
+
+  for index in range(start, len(code)):
+    if matches(code[index]):
+      yield index
+
+def find_line(code, matches, start=0):
+  '''
+  Returns the index of the first line in the code list for which "matches" is true
+
+  Parameters:
+    code (list of strings): represents lines of code
+    matches (function): takes a line of code and returns a boolean
+    start (integer): index of the first line to examine; defaults to 0
+
+  Returns:
+     index (integer): index of the first matching line of code; returns "None" if no line matches
+  '''
+
+  return next(find_lines(code, matches, start), None)
+
+def get_start_bracket(code, keyword):
+  '''
+  Returns the index of where the keyword starts in the code list
+
+  Parameters:
+    code (list of strings): represents lines of code
+    keyword (string): the word to be found in the code
+
+  Returns:
+     index (integer): index of line of code where keyword was found
+  '''
+
+  return find_line(code, lambda line: keyword in line)
+
+def get_end_bracket(code, bracket_start, blocks=None):
+  '''
+  Returns the index of where the code block ends in the code list
+
+  Parameters:
+    code (list of strings): represents lines of code
+    bracket_start (integer): represents the start of a code block
+    blocks (dictionary): block index for code built by "get_block_index"; defaults to None, which scans the code instead
+
+  Returns:
+     code.index(line) (integer): index of line of code where keyword was found
+  '''
+
+  if blocks is not None:
+    return blocks.get(bracket_start)
+
+  opened = 0
+  for index, line in enumerate(code[bracket_start:]):
+    opened += count_braces(line)
+    if opened == 0:
+      return index + bracket_start + 1
+
+def get_block_index(code):
+  '''
+  Returns a dictionary mapping the start of each code block to the end of the block; built in a single pass over the code
+
+  Parameters:
+    code (list of strings): represents lines of code
+
+  Returns:
+     blocks (dictionary): maps the index of every line to the value "get_end_bracket" returns for it; lines whose block never closes are left out
+  '''
+
+  blocks = dict()
+  waiting = dict()
+  opened = 0
+  for index, line in enumerate(code):
+    waiting.setdefault(opened, []).append(index)
+    opened += count_braces(line)
+    for start in waiting.pop(opened, ()):
+      blocks[start] = index + 1
+
+  return blocks
+
+def get_sub_block_index(blocks, start, end):
+  '''
+  Returns the block index for the slice code[start:end] given the block index of the whole code list
+
+  Parameters:
+    blocks (dictionary): block index of the whole code list
+    start (integer): represents the start of the slice
+    end (integer): represents the end of the slice
+
+  Returns:
+     sub_blocks (dictionary): block index with positions relative to the slice; blocks that do not close inside the slice are left out
+  '''
+
+  sub_blocks = dict()
+  for index in range(start, end):
+    block_end = blocks.get(index)
+    if block_end is not None and block_end <= end:
+      sub_blocks[index - start] = block_end - start
+
+  return sub_blocks
+
+#######################
+## Classifying Lines
+#######################
+
+## Kinds of line stored by "classify_lines"; a line that is none of the others is LINE_OTHER.
+## LINE_DO_END is the "} while (x);" that ends a do block; it does not start a loop
+LINE_OTHER, LINE_FOR, LINE_WHILE, LINE_IF, LINE_ELSE_IF, LINE_ELSE, LINE_RETURN, LINE_CLASS, LINE_METHOD, LINE_DECLARATION, LINE_BRACE, \
+  LINE_DO, LINE_SWITCH, LINE_DO_END = range(14)
+
+## Groups: the keyword a line starts with, after a "}" closing the block before it
+LINE_KEYWORD = re.compile(r'^\}?\s*(else\s+if|else|if|for|while|do|switch|return)\b')
+
+LINE_KEYWORDS = {'for': LINE_FOR, 'while': LINE_WHILE, 'if': LINE_IF, 'else if': LINE_ELSE_IF, 'else': LINE_ELSE, 'do': LINE_DO,
+                 'switch': LINE_SWITCH, 'return': LINE_RETURN}
+
+## Starts of the lines LINE_KEYWORD can match; other lines skip the pattern
+KEYWORD_STARTS = ('}', 'if', 'for', 'while', 'else', 'do', 'switch', 'return')
+
+## Groups: declared type; only the start of a declaration, which is enough to tell it from other statements
+DECLARATION_START = re.compile(r'(?:(?:final|static|public|private|protected|transient|volatile)\s+)*([A-Za-z_][\w.]*)(?:\s*<[^;=()]*>)?(?:\s*\[\s*\])*\s+[A-Za-z_]')
+
+def classify_lines(code):
+  '''
+  Returns the kind of every line of code, found once so the parsers do not search each line again. A line that closes a
+  block and opens another, like "} else if (x) {", has the kind of the block it opens. The "while (x);" that ends a do
+  block is LINE_DO_END, whether it follows the "}" on the same line or on the next one
+
+  Parameters:
+    code (list of strings): represents lines of code
+
+  Returns:
+     kinds (array): one byte per line holding LINE_FOR, LINE_WHILE, LINE_IF, LINE_ELSE_IF, LINE_ELSE, LINE_DO, LINE_DO_END,
+                    LINE_SWITCH, LINE_RETURN, LINE_CLASS, LINE_METHOD, LINE_DECLARATION, LINE_BRACE, or LINE_OTHER
+  '''
+
+  kinds = array('B', bytes(len(code)))
+  match_keyword = LINE_KEYWORD.match
+  match_declaration = DECLARATION_START.match
+  open_dos = 0
+  previous = ''
+  for index, line in enumerate(code):
+    line = line.strip()
+    if not line:
+      continue
+    closes = previous.endswith('}')
+    previous = line
+    if not line.strip('{};'):
+      kinds[index] = LINE_BRACE
+      continue
+    match = match_keyword(line) if line.startswith(KEYWORD_STARTS) else None
+    if match:
+      kind = LINE_KEYWORDS[' '.join(match.group(1).split())]
+      if kind == LINE_WHILE and line[-1] == ';' and (line[0] == '}' or (closes and open_dos)):
+        kind = LINE_DO_END
+        open_dos = max(open_dos - 1, 0)
+      elif kind == LINE_DO:
+        open_dos += 1
+      kinds[index] = kind
+    elif line[-1] == ';':
+      declaration = match_declaration(line)
+      if declaration and declaration.group(1) not in NOT_TYPES:
+        kinds[index] = LINE_DECLARATION
+    elif CLASS_HEADER.match(line):
+      kinds[index] = LINE_CLASS
+    elif is_method_header(code, index):
+      kinds[index] = LINE_METHOD
+
+  return kinds
+
+def find_kinds(kinds, *line_kinds):
+  '''
+  Returns the index of every line whose kind is one of line_kinds; the kinds are searched as bytes, not line by line
+
+  Parameters:
+    kinds (array): line kinds built by "classify_lines"
+    line_kinds (integers): the kinds to look for, e.g. LINE_FOR
 
   Returns:
-     data (list of strings): lines of student code as they wrote it (no changes made)
+     indices (list of integers): indices of the matching lines of code, in order
   '''
 
-  with open(file_name, 'r') as data:
-    return data.readlines()
+  data = kinds.tobytes()
+  indices = []
+  for kind in line_kinds:
+    index = data.find(kind)
+    while index != -1:
+      indices.append(index)
+      index = data.find(kind, index + 1)
 
-def get_start_bracket(code, keyword):
+  return sorted(indices) if len(line_kinds) > 1 else indices
+
+#######################
+## Parsing Classes
+#######################
+
+def parse_classes(code, class_methods=None, blocks=None, create_method=None, symbols=None):
   '''
-  Returns the index of where the keyword starts in the code list
+  Returns a list of dictionaries where each element is a parsed user-defined class, including inner classes, in source order
 
   Parameters:
-    code (list of strings): represents lines of code
-    keyword (string): the word to be found in the code
+    code (list of strings): represents lines of code in the student sketch
+    class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+    blocks (dictionary): block index for code built by "get_block_index"; defaults to None, which builds it
+    create_method (function): builds a method from its lines and block index; defaults to None, which uses "create_method_dict"
+    symbols (dictionary): symbol table for code built by "build_symbol_table"; defaults to None, which builds it
 
   Returns:
-     code.index(line) (integer): index of line of code where keyword was found
+     classes (list of dictionaries): represents every user-defined class; see "create_class_dict"
   '''
 
-  for line in code:
-    if keyword in line:
-      return code.index(line)
+  if blocks is None:
+    blocks = get_block_index(code)
+  if symbols is None:
+    symbols = build_symbol_table(code, blocks)
+
+  return [create_class_dict(code, class_methods, blocks, create_method, symbols, symbol) for symbol in symbols.get('classes')]
 
-def get_end_bracket(code, bracket_start):
+def create_class_dict(code, methods, blocks=None, create_method=None, symbols=None, symbol=None):
   '''
-  Returns the index of where the code block ends in the code list
+  Returns a dictionary that is the parsed class
 
   Parameters:
     code (list of strings): represents lines of code
-    bracket_start (integer): represents the start of a code block
+    methods (list of strings): represents the methods to be found in the user-defined class; None parses every method
+    blocks (dictionary): block index for code built by "get_block_index"; defaults to None, which builds it
+    create_method (function): builds a method from its lines and block index; defaults to None, which uses "create_method_dict"
+    symbols (dictionary): symbol table for code built by "build_symbol_table"; defaults to None, which builds it
+    symbol (dictionary): the class from symbols to parse; defaults to None, which parses the first class
 
   Returns:
-     code.index(line) (integer): index of line of code where keyword was found
-  '''
-
-  opened = 0
-  for index, line in enumerate(code[bracket_start:]):
-    opened += line.count('{')
-    opened -= line.count('}')
-    if opened == 0:
-      return index + bracket_start + 1
+     class_dict (dictionary): represents a parsed class; has the keys name, parent, code, methods, constructors, constructor, and attributes.
+                              "constructor" is the first constructor, or None if the class has none; None is returned if there is no class
+  '''
+
+  if blocks is None:
+    blocks = get_block_index(code)
+  if symbols is None:
+    symbols = build_symbol_table(code, blocks)
+  if symbol is None:
+    if not symbols.get('classes'):
+      return None
+    symbol = symbols.get('classes')[0]
+  class_dict = dict()
+  class_dict['name'] = symbol.get('name')
+  class_dict['parent'] = symbol.get('parent')
+  class_dict['code'] = code[symbol.get('start'):symbol.get('end')]
+  class_dict['methods'] = parse_methods(code, methods, blocks, create_method, symbols, class_dict['name'])
+  class_dict['constructors'] = [create_constructor_dict(code[start:end]) for start, end in symbol.get('constructors')]
+  class_dict['constructor'] = class_dict['constructors'][0] if class_dict['constructors'] else None
+  class_dict['attributes'] = [code[index].strip() for index in symbol.get('attributes')]
 
-#######################
-## Parsing Classes
-#######################
+  return class_dict
 
-def create_class_dict(code, methods):
+def create_constructor_dict(constructor):
   '''
-  Returns a dictionary that is the parsed class
+  Returns a dictionary that is the parsed constructor
 
   Parameters:
-    code (list of strings): represents lines of code
-    methods (list of strings): represents the methods to be found in the user-defined class
+    constructor (list of strings): represents the lines of code in a constructor
 
   Returns:
-     class_dict (dictionary): represents a parsed class; has the keys name, code, methods, constructor, and attributes
+     constructor_dict (dictionary): represents a parsed constructor; has the keys code and parameters
   '''
 
-  class_dict = dict()
-  class_start = get_class_start(code)
-  class_end = get_end_bracket(code, class_start)
-  class_dict['name'] = get_class_name(code, class_start)
-  class_dict['code'] = code[class_start:class_end]
-  class_dict['methods'] = parse_methods(class_dict['code'], methods)
-  class_dict['constructor'] = get_class_constructor(class_dict['code'], class_dict['name'])
-  class_dict['attributes'] = get_class_attributes(class_dict['code'], class_dict['name'])
+  constructor_dict = dict()
+  constructor_dict['code'] = [line.strip() for line in constructor]
+  constructor_dict['parameters'] = get_constructor_parameters(join_header(constructor_dict['code'], 0))
 
-  return class_dict
+  return constructor_dict
 
-def get_class_constructor(code, class_name):
+def get_class_constructor(code, class_name, blocks=None):
   '''
   Returns a dictionary that is the parsed constructor
 
   Parameters:
     code (list of strings): represents lines of code
     class_name (string): represents the name of the user-defined class
+    blocks (dictionary): block index for code built by "get_block_index"; defaults to None
 
   Returns:
      constructor (dictionary): represents a parsed class; has the keys code and parameters
   '''
 
-  constructor = dict()
   constructor_start = get_start_bracket(code[1:], class_name) + 1
-  constructor_end = get_end_bracket(code, constructor_start)
-  constructor_code = [line.strip() for line in code[constructor_start:constructor_end]]
-  parameters = get_constructor_parameters(constructor_code[0])
-  constructor['code'] = constructor_code
-  constructor['parameters'] = parameters
+  constructor_end = get_end_bracket(code, constructor_start, blocks)
 
-  return constructor
+  return create_constructor_dict(code[constructor_start:constructor_end])
 
 def get_constructor_parameters(constructor_header):
   '''
@@ -229,15 +1970,12 @@ def get_class_start(code):
     code (list of strings): represents lines of code
 
   Returns:
-     code.index(line) (integer): represents index of the line where the user-defined class starts; returns -1 if not found
+     index (integer): represents index of the line where the user-defined class starts; returns -1 if not found
   '''
 
-  for line in code:
-    if line.startswith('class'):
+  index = find_line(code, lambda line: line.startswith('class'))
 
-      return code.index(line)
-
-  return -1
+  return index if index is not None else -1
 
 def get_class_name(code, class_start):
   '''
@@ -264,46 +2002,48 @@ def get_class_name(code, class_start):
 ## as those are the officeal vehicles for
 ## iteration in the Processing docs.
 
-def get_loop(method, index):
+def get_loop(method, index, blocks=None):
   '''
   Returns a list of strings representing the lines of code in a loop
 
   Parameters:
     method (list of strings): represents lines of code in a method
     index (integer): represents the start of the loop
+    blocks (dictionary): block index for the method built by "get_block_index"; defaults to None
 
   Returns:
      method[loop_start:loop_end] (list of strings): represents lines of code for a loop; returns "None" if not present
   '''
 
   loop_start = index
-  loop_end = get_end_bracket(method, loop_start)
+  loop_end = get_end_bracket(method, loop_start, blocks)
 
   return method[loop_start:loop_end] if loop_start != -1 else None
 
-def parse_loops(method):
+def parse_loops(method, blocks=None, kinds=None):
   '''
   Returns a list of dictionaries representing loops
 
   Parameters:
     method (list of strings): represents lines of code in a method
+    blocks (dictionary): block index for the method built by "get_block_index"; defaults to None, which builds it
+    kinds (array): line kinds for the method built by "classify_lines"; defaults to None, which builds them
 
   Returns:
-     loops (list of dictionaries): represents the loops in a method; dictionary has the keys type and code
+     loops (list of dictionaries): represents the loops in a method; dictionary has the keys type, code, and start (the index of its first line in method)
   '''
 
+  if blocks is None:
+    blocks = get_block_index(method)
+  if kinds is None:
+    kinds = classify_lines(method)
   loops = []
-  for line in method:
-    if 'for(' in line.replace(' ', ''):
-      loop = dict()
-      loop['type'] = 'for'
-      loop['code'] = get_loop(method, method.index(line))
-      loops.append(loop)
-    if 'while(' in line.replace(' ', ''):
-      loop = dict()
-      loop['type'] = 'while'
-      loop['code'] = get_loop(method, method.index(line))
-      loops.append(loop)
+  for index in find_kinds(kinds, LINE_FOR, LINE_WHILE):
+    loop = dict()
+    loop['type'] = 'for' if kinds[index] == LINE_FOR else 'while'
+    loop['code'] = get_loop(method, index, blocks)
+    loop['start'] = index
+    loops.append(loop)
 
   return loops
 
@@ -311,29 +2051,111 @@ def parse_loops(method):
 ## Parsing Global Variables
 ###########################
 
+## Groups: modifiers, type, and the names with their initialisers
+DECLARATION = re.compile(r'^((?:(?:final|static|public|private|protected|transient|volatile)\s+)*)([A-Za-z_][\w.]*(?:\s*<[^;=()]*>)?(?:\s*\[\s*\])*)\s+([A-Za-z_].*?)\s*;$')
+
+## Words that start a statement that looks like a declaration but is not one
+NOT_TYPES = {'import', 'package', 'return', 'new', 'throw', 'else', 'case', 'goto'}
+
 def get_global_variables(methods, code, classes):
   '''
-  Returns a sorted list of strings representing the global variables
+  Returns a sorted list of strings representing the global variables: every statement outside of a class or method
+
+  Parameters:
+    methods (list of dictionaries): represents all of the methods in the sketch; not used, the methods are found by "build_symbol_table"
+    code (list of strings): represents the lines of code in the sketch
+    classes (list of dictionaries): represents the user-defined classes in the sketch; not used, like "methods"
+
+  Returns:
+     variable_list (list of strings): represents global variables in the sketch; this list is sorted
+  '''
+
+  return sorted(declaration['code'] for declaration in get_global_declarations(code))
+
+def get_global_declarations(code, symbols=None, line_numbers=None):
+  '''
+  Returns a list of dictionaries with every statement outside of a class or method, in source order. The statements
+  are found by the same pass that finds methods and classes, so code in any method is left out, whether it was parsed or not
 
   Parameters:
-    methods (list of dictionaries): represents all of the methods in the sketch
     code (list of strings): represents the lines of code in the sketch
-    classes (dictionary): represents the user-defined class in the sketch
+    symbols (dictionary): symbol table for code built by "build_symbol_table"; defaults to None, which builds it
+    line_numbers (list of integers): line number in the sketch of each line of code, see "strip_comments_with_line_numbers";
+                                     defaults to None, which numbers the lines of code from 1
+
+  Returns:
+     declarations (list of dictionaries): each has the keys modifiers, type, names, initialisers, line, and code (see
+                                          "parse_declaration"). A statement that spans several lines is joined with spaces
+  '''
+
+  if symbols is None:
+    symbols = build_symbol_table(code)
+  declarations = []
+  for start, end in symbols.get('statements'):
+    statement = ' '.join(line.strip() for line in code[start:end])
+    declaration = parse_declaration(statement)
+    declaration['line'] = line_numbers[start] if line_numbers is not None else start + 1
+    declarations.append(declaration)
+
+  return declarations
+
+def parse_declaration(statement):
+  '''
+  Returns a dictionary describing a variable declaration such as "final int x = 5, y;"
+
+  Parameters:
+    statement (string): one statement ending with a semicolon
 
   Returns:
-     list(code_set - methods_set - class_set) (list of strings): represents global variables in the sketch; this list is sorted
+     declaration (dictionary): has the keys modifiers (list of strings), type (string), names (list of strings),
+                               initialisers (list with the text after "=" for each name, or None), and code (the statement).
+                               A statement that is not a declaration, like an import, has the type None and no names
+  '''
+
+  declaration = {'modifiers': [], 'type': None, 'names': [], 'initialisers': [], 'code': statement}
+  match = DECLARATION.match(statement)
+  if match is None or match.group(2) in NOT_TYPES:
+    return declaration
+  declaration['modifiers'] = match.group(1).split()
+  declaration['type'] = match.group(2)
+  for declarator in split_declarators(match.group(3)):
+    name, equals, initialiser = declarator.partition('=')
+    declaration['names'].append(re.match(r'[A-Za-z_]\w*', name.strip()).group(0))
+    declaration['initialisers'].append(initialiser.strip() if equals else None)
+
+  return declaration
+
+def split_declarators(text):
   '''
+  Returns the parts of a declaration between commas that are not inside brackets, parentheses, or quotes
 
-  methods_set = set()
-  code_set = set([line.strip() for line in code])
-  class_set = set(classes.get('code')) if len(classes) != 0 else set()
-  for method in methods:
-    set_from_list = set(method.get('code'))
-    methods_set.update(set_from_list)
-  variable_list = list(code_set - methods_set - class_set)
-  variable_list.sort()
+  Parameters:
+    text (string): the names and initialisers of a declaration, e.g. "x = max(1, 2), y"
 
-  return variable_list
+  Returns:
+     declarators (list of strings): e.g. ["x = max(1, 2)", "y"]
+  '''
+
+  declarators = []
+  depth = 0
+  quote = None
+  start = 0
+  for index, character in enumerate(text):
+    if quote is not None:
+      if character == quote and text[index - 1] != '\\':
+        quote = None
+    elif character in '"\'':
+      quote = character
+    elif character in '([{':
+      depth += 1
+    elif character in ')]}':
+      depth -= 1
+    elif character == ',' and depth == 0:
+      declarators.append(text[start:index].strip())
+      start = index + 1
+  declarators.append(text[start:].strip())
+
+  return declarators
 
 #######################
 ## Parsing Conditionals
@@ -345,121 +2167,587 @@ def get_global_variables(methods, code, classes):
 ## } else if (cond) {
 ## The else statement and curly brackets are on the same line
 
-def fetch_conditional_code(method_body, index):
+def fetch_conditional_code(method_body, index, blocks=None):
   '''
   Returns a list of strings representing a conditional
 
   Parameters:
     method_body (list of strings): represents lines of code in a method
     index (integer): represents the start of a conditional
+    blocks (dictionary): block index for the method built by "get_block_index"; defaults to None
 
   Returns:
-     method_body[cond_start:cond_end] (list of strings): represents lines of code in a conditional
+     method_body[cond_start:cond_end] (list of strings): represents lines of code in a conditional; returns "None" if the conditional does not close before the end of the method
   '''
 
   cond_start = index
-  opened = 0
-  for index, line in enumerate(method_body[cond_start:-1]):
-    opened += 1 if '{' in line else 0
-    opened -= 1 if '}' in line else 0
-    if opened == 0:
-      cond_end = index + cond_start + 1
+  cond_end = get_end_bracket(method_body, cond_start, blocks)
+  if cond_end is None or cond_end >= len(method_body):
+    return None
 
-      return method_body[cond_start:cond_end]
+  return method_body[cond_start:cond_end]
 
-def find_else_index(code):
+def find_else_index(code, kinds=None):
   '''
-  Returns the index of the element that contains "else"
+  Returns the index of the first line that starts an "else" or "else if" branch
 
   Parameters:
     code (list of strings): represents lines of code
+    kinds (array): line kinds for code built by "classify_lines"; defaults to None, which builds them
 
   Returns:
-     code.index(line) (integer): represents the start of the else statement
+     index (integer): represents the start of the else statement; returns "None" if there is none
   '''
 
-  for line in code:
-    if 'else' in line:
+  if kinds is None:
+    kinds = classify_lines(code)
+
+  indices = find_kinds(kinds, LINE_ELSE, LINE_ELSE_IF)
 
-      return code.index(line)
+  return indices[0] if indices else None
 
-def fetch_true_branch(conditional_code):
+def fetch_true_branch(conditional_code, kinds=None):
   '''
   Returns a list of strings that represent the first half of a conditional (true branch)
 
   Parameters:
     conditional_code (list of strings): represents lines of code in a complete conditional
+    kinds (array): line kinds for conditional_code built by "classify_lines"; defaults to None, which builds them
 
   Returns:
      code.index(line) (list of strings): represents the true branch of a conditional
   '''
 
-  cond_end = find_else_index(conditional_code)
+  cond_end = find_else_index(conditional_code, kinds)
 
   return conditional_code[:cond_end]
 
-def fetch_false_branch(conditional_code):
+def fetch_false_branch(conditional_code, kinds=None):
   '''
   Returns a list of strings that represent the second half of a conditional (false branch); returns an empty string if there is no false branch
 
   Parameters:
     conditional_code (list of strings): represents lines of code in a complete conditional
+    kinds (array): line kinds for conditional_code built by "classify_lines"; defaults to None, which builds them
 
   Returns:
      conditional_code[false_start:] (list of strings): represents the false branch of a conditional; could be an empty string if there is no else statement
   '''
 
-  false_start = find_else_index(conditional_code)
+  false_start = find_else_index(conditional_code, kinds)
   if false_start == None:
     return ''
 
   return conditional_code[false_start:]
 
-def parse_conditional(method_body):
+def parse_conditional(method_body, blocks=None, kinds=None):
   '''
   Returns a list of dictionaries that represent each conditional
 
   Parameters:
     method_body (list of strings): represents lines of code in a method
+    blocks (dictionary): block index for the method built by "get_block_index"; defaults to None, which builds it
+    kinds (array): line kinds for the method built by "classify_lines"; defaults to None, which builds them
 
   Returns:
-     conditionals (list of dictionaries): represents the conditionals in a method
+     conditionals (list of dictionaries): represents the conditionals in a method; dictionary has the keys code, true_branch, false_branch,
+                                          and start (the index of its first line in method_body). The code and true_branch are None
+                                          if the conditional does not close before the end of the method
   '''
 
+  if blocks is None:
+    blocks = get_block_index(method_body)
+  if kinds is None:
+    kinds = classify_lines(method_body)
+  else_lines = find_kinds(kinds, LINE_ELSE, LINE_ELSE_IF)
   conditionals = []
-  for line in method_body:
-    if 'if(' in line.replace(' ', '') and 'else' not in line:
-      conditional = dict()
-      index = method_body.index(line)
-      conditional['code'] = fetch_conditional_code(method_body, index)
-      conditional['true_branch'] = fetch_true_branch(conditional.get('code'))
-      conditional['false_branch'] = fetch_false_branch(conditional.get('code'))
-      conditionals.append(conditional)
+  for index in find_kinds(kinds, LINE_IF):
+    conditional = dict()
+    conditional['code'] = fetch_conditional_code(method_body, index, blocks)
+    conditional['start'] = index
+    ## Same split as "fetch_true_branch" and "fetch_false_branch", using the else lines found once for the whole method
+    position = bisect_left(else_lines, index)
+    if conditional['code'] is not None and position < len(else_lines) and else_lines[position] < index + len(conditional['code']):
+      conditional['true_branch'] = conditional['code'][:else_lines[position] - index]
+      conditional['false_branch'] = conditional['code'][else_lines[position] - index:]
+    else:
+      conditional['true_branch'] = conditional['code']
+      conditional['false_branch'] = ''
+    conditionals.append(conditional)
 
   return conditionals
 
+#############################
+## Building Control-Flow Trees
+#############################
+
+## Kind of block started by each kind of line from "classify_lines"
+BLOCK_KINDS = {LINE_IF: 'if', LINE_ELSE_IF: 'else if', LINE_ELSE: 'else', LINE_FOR: 'for', LINE_WHILE: 'while', LINE_DO: 'do', LINE_SWITCH: 'switch'}
+
+## Kinds of block that can be looked for by group name
+BLOCK_GROUPS = {'conditional': ('if', 'else if', 'else'), 'loop': ('for', 'while', 'do')}
+
+class BlockNode:
+  '''
+  One block in the control-flow tree of a method. A node holds the span of its lines in the method code instead of a
+  copy of them. The root has the kind "method"; every other node is an if, else if, else, for, while, do, or switch
+  block. The branches of a conditional are siblings, in order, and the code after "} while (...);" belongs to the do block.
+
+  Attributes:
+    kind (string): "method", "if", "else if", "else", "for", "while", "do", or "switch"
+    code (list of strings): the code of the whole method; shared by every node of the tree
+    start (integer): index of the first line of the block in code
+    end (integer): index after the last line of the block; the "} else {" line belongs to the else branch
+    parent (BlockNode): the block this one is nested in, or None for the root
+    children (list of BlockNode): the blocks directly nested in this one, in source order
+    depth (integer): number of curly brackets open inside the block
+  '''
+
+  __slots__ = ('kind', 'code', 'start', 'end', 'parent', 'children', 'depth')
+
+  def __init__(self, kind, code, start, end=None, parent=None):
+    self.kind = kind
+    self.code = code
+    self.start = start
+    self.end = end
+    self.parent = parent
+    self.children = []
+    self.depth = None
+    if parent is not None:
+      parent.children.append(self)
+
+  @property
+  def header(self):
+    '''
+    Returns the first line of the block
+    '''
+
+    return self.code[self.start]
+
+  @property
+  def condition(self):
+    '''
+    Returns the text between the outer parentheses of the header, or an empty string for an else or do block
+    '''
+
+    header = self.header
+    if self.kind in ('else', 'do', 'method') or '(' not in header:
+      return ''
+
+    return header[header.index('(') + 1:header.rindex(')')].strip() if ')' in header else ''
+
+  def lines(self):
+    '''
+    Returns a list of strings with the lines of the block
+    '''
+
+    return self.code[self.start:self.end]
+
+  def is_kind(self, *kinds):
+    '''
+    Returns a boolean denoting if the block is one of the kinds; "conditional" and "loop" stand for every kind in BLOCK_GROUPS
+    '''
+
+    return any(self.kind in BLOCK_GROUPS.get(kind, (kind,)) for kind in kinds)
+
+  def walk(self):
+    '''
+    Yields every block nested in this one, at any depth, in source order (generator)
+    '''
+
+    for child in self.children:
+      yield child
+      yield from child.walk()
+
+  def find(self, *kinds):
+    '''
+    Returns a list of the blocks nested in this one, at any depth, that are one of the kinds; see "is_kind"
+    '''
+
+    return [node for node in self.walk() if node.is_kind(*kinds)]
+
+  def ancestors(self):
+    '''
+    Yields the blocks this one is nested in, from its parent up to the root (generator)
+    '''
+
+    node = self.parent
+    while node is not None:
+      yield node
+      node = node.parent
+
+  def is_inside(self, *kinds):
+    '''
+    Returns a boolean denoting if the block is nested, at any depth, in a block of one of the kinds; see "is_kind"
+    '''
+
+    return any(node.is_kind(*kinds) for node in self.ancestors())
+
+  def nesting(self):
+    '''
+    Returns the number of levels of blocks nested in this one; 0 if it has no children
+    '''
+
+    return max((1 + child.nesting() for child in self.children), default=0)
+
+  def to_dict(self):
+    '''
+    Returns the tree as nested dictionaries with the keys kind, start, end, and children
+    '''
+
+    return {'kind': self.kind, 'start': self.start, 'end': self.end, 'children': [child.to_dict() for child in self.children]}
+
+  def __repr__(self):
+    return 'BlockNode(%r, %d, %r, %d children)' % (self.kind, self.start, self.end, len(self.children))
+
+def build_control_flow(method, kinds=None):
+  '''
+  Returns the control-flow tree of a method, built in a single pass that tracks curly brackets. A block without curly
+  brackets, like "if (x) y++;", ends on the line with its header, or on the next line if the header ends there
+
+  Parameters:
+    method (list of strings): represents the lines of code in a method
+    kinds (array): line kinds for the method built by "classify_lines"; defaults to None, which builds them
+
+  Returns:
+     root (BlockNode): block of the kind "method" spanning every line; the other blocks are its descendants
+  '''
+
+  if kinds is None:
+    kinds = classify_lines(method)
+  root = BlockNode('method', method, 0, len(method))
+  root.depth = 0
+  open_nodes = [root]
+  depth = 0
+  waiting = None
+  for index, line in enumerate(method):
+    line = line.strip()
+    kind = BLOCK_KINDS.get(kinds[index])
+    braces = iter_braces(line)
+    if line.startswith('}'):
+      next(braces)
+      depth -= 1
+      while len(open_nodes) > 1 and open_nodes[-1].depth > depth:
+        open_nodes.pop().end = index if kind in ('else', 'else if') else index + 1
+    if kind is not None:
+      waiting = BlockNode(kind, method, index, parent=open_nodes[-1])
+    for brace in braces:
+      if brace == '{':
+        depth += 1
+        if waiting is not None:
+          waiting.depth = depth
+          open_nodes.append(waiting)
+          waiting = None
+      else:
+        depth -= 1
+        while len(open_nodes) > 1 and open_nodes[-1].depth > depth:
+          open_nodes.pop().end = index + 1
+    if waiting is not None and kind is not None and (line.endswith(';') or index + 1 == len(method) or not method[index + 1].strip().startswith('{')):
+      waiting.end = index + 1 if line.endswith(';') else min(index + 2, len(method))
+      waiting = None
+  for node in open_nodes[1:]:
+    node.end = len(method)
+
+  return root
+
+def iter_braces(line):
+  '''
+  Yields every "{" and "}" of a line of code in order, ignoring any inside strings, chars or comments (generator)
+  '''
+
+  if '"' not in line and "'" not in line and '/' not in line:
+    return (character for character in line if character in '{}')
+
+  return ('{' if token.kind == 'open_brace' else '}' for token in tokenize_line(line)[0] if token.kind in ('open_brace', 'close_brace'))
+
 #######################
 ## Parsing Methods
 #######################
 
-def parse_methods(code, required_methods):
+MODIFIERS = r'(?:(?:public|private|protected|static|final|abstract|synchronized)\s+)*'
+
+## Groups: return type, name, parameters, and the opening curly bracket (if on the same line)
+METHOD_HEADER = re.compile(r'^\s*' + MODIFIERS + r'([A-Za-z_][\w.]*(?:\s*<[^()]*>)?(?:\s*\[\s*\])*)\s+([A-Za-z_]\w*)\s*\(([^()]*)\)\s*(\{.*)?$')
+
+## Groups: class name
+CLASS_HEADER = re.compile(r'^\s*' + MODIFIERS + r'class\s+([A-Za-z_]\w*)')
+
+## Groups: class name; a constructor is only recognised inside a class with the same name
+CONSTRUCTOR_HEADER = re.compile(r'^\s*' + MODIFIERS + r'([A-Za-z_]\w*)\s*\(')
+
+## Words that can look like a return type or method name in statements such as "else if (x) {" or "new int[] {"
+STATEMENT_KEYWORDS = {'if', 'for', 'while', 'switch', 'catch', 'synchronized', 'else', 'new', 'return', 'throw', 'case', 'do', 'try',
+                      'public', 'private', 'protected', 'static', 'final', 'abstract'}
+
+def parse_methods(code, required_methods=None, blocks=None, create_method=None, symbols=None, owner=None):
   '''
-  Returns a list of lists where each element in the first list represents an expected method
+  Returns a list of dictionaries where each element represents a method found in the code
 
   Parameters:
     code (list of strings): represents lines of code in the student sketch
-    required_methods (list of strings): represents the methods expected to be found in the sketch (not in a user-defined class)
+    required_methods (list of strings): represents the methods to parse; defaults to None, which parses every method in source order.
+                                        Methods that are not found are left out; every overload of a method is included
+    blocks (dictionary): block index for code built by "get_block_index"; defaults to None, which builds it
+    create_method (function): builds a method from its lines, block index and line kinds; defaults to None, which uses "create_method_dict"
+    symbols (dictionary): symbol table for code built by "build_symbol_table"; defaults to None, which builds it
+    owner (string): name of the class whose methods are parsed; defaults to None, which parses methods that are not in a class
 
   Returns:
-     methods (list of lists): represents the code (list of strings) for each method expected to be in the sketch
+     methods (list of dictionaries): represents each method that was parsed
   '''
 
+  if blocks is None:
+    blocks = get_block_index(code)
+  if symbols is None:
+    symbols = build_symbol_table(code, blocks)
+  if create_method is None:
+    create_method = create_method_dict
   methods = []
-  for method in required_methods:
-    methods.append(fetch_method(code, method))
+  for symbol in select_methods(symbols, required_methods, owner):
+    start = symbol.get('start')
+    end = symbol.get('end')
+    methods.append(create_method(code[start:end], get_sub_block_index(blocks, start, end), symbols['kinds'][start:end]))
 
   return methods
 
+def select_methods(symbols, required_methods=None, owner=None):
+  '''
+  Returns the methods from a symbol table that "parse_methods" parses, in the order it parses them
+
+  Parameters:
+    symbols (dictionary): symbol table built by "build_symbol_table"
+    required_methods (list of strings): represents the methods to parse; defaults to None, which selects every method in source order
+    owner (string): name of the class whose methods are selected; defaults to None, which selects methods that are not in a class
+
+  Returns:
+     found (list of dictionaries): the selected method symbols; each has the keys name, class, start, and end
+  '''
+
+  found = [symbol for symbol in symbols.get('methods') if symbol.get('class') == owner]
+  if required_methods is not None:
+    by_name = dict()
+    for symbol in found:
+      by_name.setdefault(symbol.get('name'), []).append(symbol)
+    found = [symbol for method in required_methods for symbol in by_name.get(method, [])]
+
+  return found
+
+def get_spans(symbols, sketch_methods=None):
+  '''
+  Returns where each parsed method, class and global declaration is in the code, in the same order as those lists
+
+  Parameters:
+    symbols (dictionary): symbol table built by "build_symbol_table"
+    sketch_methods (list of strings): methods parsed from the sketch; defaults to "None", which is every method
+
+  Returns:
+     spans (dictionary): has the keys methods, classes, and global_declarations; each is a list of [start, end] slices of code
+  '''
+
+  return {'methods': [[symbol.get('start'), symbol.get('end')] for symbol in select_methods(symbols, sketch_methods)],
+          'classes': [[symbol.get('start'), symbol.get('end')] for symbol in symbols.get('classes')],
+          'global_declarations': [[start, end] for start, end in symbols.get('statements')]}
+
+def build_symbol_table(code, blocks=None, kinds=None):
+  '''
+  Returns a dictionary with every class, method and top-level statement in the code, found in a single pass that tracks
+  curly bracket depth. A method is a header at the top level of the sketch or directly inside a class; headers inside
+  method bodies are ignored. A top-level statement is code outside of any class or method that ends with a semicolon,
+  such as a global variable declaration; it may span several lines. A stray closing curly bracket at the top level is skipped
+
+  Parameters:
+    code (list of strings): represents lines of code in the student sketch
+    blocks (dictionary): block index for code built by "get_block_index"; defaults to None, which builds it
+    kinds (array): line kinds for code built by "classify_lines"; defaults to None, which builds them
+
+  Returns:
+     symbols (dictionary): has the keys classes, methods, statements, kinds, and closed; the first three are lists in source order.
+                           Each class has the keys name, parent, start, end, constructors, and attributes; each method has the keys name, class, start, and end.
+                           "start" and "end" are the slice of code holding the class or method; "class" and "parent" are None at the top level.
+                           "constructors" is a list of (start, end) slices and "attributes" is a list of line indices.
+                           "statements" is a list of (start, end) slices, one per top-level statement; "kinds" is the line kinds used.
+                           "closed" is False if the code ends inside a top-level statement or a body that never closes
+  '''
+
+  if blocks is None:
+    blocks = get_block_index(code)
+  if kinds is None:
+    kinds = classify_lines(code)
+  symbols = {'classes': [], 'methods': [], 'statements': [], 'kinds': kinds}
+  open_classes = []
+  depth = 0
+  statement_start = None
+  statement_opened = False
+  skip_until = 0
+  index = 0
+  while index < len(code):
+    line = code[index]
+    while open_classes and index >= open_classes[-1].get('end'):
+      open_classes.pop()
+    owner = open_classes[-1] if open_classes else None
+    if depth == (owner.get('depth') + 1 if owner else 0):
+      class_match = CLASS_HEADER.match(line) if kinds[index] == LINE_CLASS else None
+      constructor_match = CONSTRUCTOR_HEADER.match(line) if owner else None
+      if class_match:
+        parsed_class = {'name': class_match.group(1), 'parent': owner.get('name') if owner else None,
+                        'start': index, 'end': get_body_end(code, index, blocks), 'depth': depth,
+                        'constructors': [], 'attributes': []}
+        symbols['classes'].append(parsed_class)
+        open_classes.append(parsed_class)
+        skip_until = parsed_class.get('end')
+        statement_start = None
+      elif constructor_match and constructor_match.group(1) == owner.get('name') and opens_block(code, get_header_end(code, index)):
+        owner['constructors'].append((index, get_body_end(code, index, blocks)))
+        index = owner['constructors'][-1][1]
+        continue
+      elif kinds[index] == LINE_METHOD:
+        method = {'name': METHOD_HEADER.match(join_header(code, index)).group(2), 'class': owner.get('name') if owner else None,
+                  'start': index, 'end': get_body_end(code, index, blocks)}
+        symbols['methods'].append(method)
+        skip_until = method.get('end')
+        statement_start = None
+        ## The body closes where the curly brackets balance again, so skipping it leaves depth unchanged
+        index = method.get('end')
+        continue
+      elif owner:
+        if line.strip().endswith(';'):
+          owner['attributes'].append(index)
+      elif index >= skip_until and statement_start is None:
+        statement_start = index
+        statement_opened = False
+    depth += count_braces(line)
+    stray = depth < 0
+    if stray:
+      depth = 0
+    if statement_start is not None:
+      if depth > 0:
+        statement_opened = True
+      elif stray:
+        statement_start = None
+      elif line.rstrip().endswith(';'):
+        symbols['statements'].append((statement_start, index + 1))
+        statement_start = None
+      elif statement_opened:
+        statement_start = None
+    index += 1
+  for parsed_class in symbols['classes']:
+    del parsed_class['depth']
+  bodies = [(symbol.get('start'), symbol.get('end')) for symbol in symbols['classes'] + symbols['methods']]
+  bodies += [constructor for parsed_class in symbols['classes'] for constructor in parsed_class.get('constructors')]
+  symbols['closed'] = depth == 0 and statement_start is None and all(get_body_open(code, start) in blocks
+                                                                   for start, end in bodies if end == len(code))
+
+  return symbols
+
+def is_method_header(code, index):
+  '''
+  Returns a boolean denoting if the line at index starts a method; the opening curly bracket may be on the next line
+
+  Parameters:
+    code (list of strings): represents lines of code in the student sketch
+    index (integer): index of the line to check
+
+  Returns:
+     True or False (boolean): the line is a method header or not
+  '''
+
+  end = get_header_end(code, index)
+  match = METHOD_HEADER.match(code[index] if end == index else join_header(code, index))
+  if match is None or match.group(1) in STATEMENT_KEYWORDS or match.group(2) in STATEMENT_KEYWORDS:
+    return False
+
+  return opens_block(code, end)
+
+def get_header_end(code, index):
+  '''
+  Returns the index of the last line of the header at index; the parameters of a header may go on over several lines
+
+  Parameters:
+    code (list of strings): represents lines of code in the student sketch
+    index (integer): index of the first line of the header
+
+  Returns:
+     end (integer): index of the line that closes the parentheses of the header; index itself if they close on the first line
+  '''
+
+  line = code[index]
+  if '(' not in line:
+    return index
+  open_parentheses = line.count('(') - line.count(')')
+  end = index
+  while open_parentheses > 0 and end + 1 < len(code) and not code[end].rstrip().endswith((';', '{', '}')):
+    end += 1
+    open_parentheses += code[end].count('(') - code[end].count(')')
+
+  return end
+
+def join_header(code, index):
+  '''
+  Returns a string with the header at index on one line; the lines its parameters go on over are joined by a space
+  '''
+
+  return ' '.join(line.strip() for line in code[index:get_header_end(code, index) + 1])
+
+def opens_block(code, index):
+  '''
+  Returns a boolean denoting if the line at index opens a curly bracket, either on the line itself or at the start of the next line
+
+  Parameters:
+    code (list of strings): represents lines of code in the student sketch
+    index (integer): index of the line to check
+
+  Returns:
+     True or False (boolean): the line opens a block or not
+  '''
+
+  if code[index].rstrip().endswith(';'):
+    return False
+
+  return '{' in code[index] or (index + 1 < len(code) and code[index + 1].strip().startswith('{'))
+
+def get_body_end(code, index, blocks):
+  '''
+  Returns the end of the class or method whose header is at index; the opening curly bracket may be on the next line
+
+  Parameters:
+    code (list of strings): represents lines of code in the student sketch
+    index (integer): index of the header
+    blocks (dictionary): block index for code built by "get_block_index"
+
+  Returns:
+     end (integer): index just past the closing curly bracket; the length of the code if the body never closes
+  '''
+
+  return blocks.get(get_body_open(code, index), len(code))
+
+def get_body_open(code, index):
+  '''
+  Returns the index of the line with the opening curly bracket of the class or method whose header is at index
+  '''
+
+  index = get_header_end(code, index)
+  if '{' not in code[index] and index + 1 < len(code) and code[index + 1].strip().startswith('{'):
+    return index + 1
+
+  return index
+
+def build_method_index(methods):
+  '''
+  Returns a dictionary mapping each method name to its positions in the list of methods; overloaded methods have more than one position
+
+  Parameters:
+    methods (list of dictionaries): represents parsed methods
+
+  Returns:
+     method_index (dictionary): maps method names to lists of integers
+  '''
+
+  method_index = dict()
+  for position, method in enumerate(methods):
+    method_index.setdefault(method.get('name'), []).append(position)
+
+  return method_index
+
 def get_method_name(method_header):
   '''
   Returns a string that represents the name of the method
@@ -471,6 +2759,9 @@ def get_method_name(method_header):
      name (string): represents the name of the method
   '''
 
+  match = METHOD_HEADER.match(method_header)
+  if match:
+    return match.group(2)
   split_header = method_header.strip().split(' ')
   end_name = split_header[1].index('(')
   name = split_header[1][:end_name]
@@ -488,6 +2779,9 @@ def get_method_type(method_header):
      return_type (string): represents the return type of the method
   '''
 
+  match = METHOD_HEADER.match(method_header)
+  if match:
+    return match.group(1)
   split_header = method_header.strip().split(' ')
   return_type = split_header[0]
 
@@ -510,84 +2804,195 @@ def get_method_parameters(method_header):
 
   return parameters
 
-def create_method_dict(method):
+def create_method_dict(method, blocks=None, kinds=None):
   '''
   Returns a dictionary with information about method
 
   Parameters:
-    method (string): represents the name of a method
+    method (list of strings): represents the lines of code in a method
+    blocks (dictionary): block index for the method built by "get_block_index"; defaults to None, which builds it
+    kinds (array): line kinds for the method built by "classify_lines"; defaults to None, which builds them
 
   Returns:
      method_dict (dictionary): represents a method; it has the keys return_type, name, parameters, code, conditionals, loops, and return_value
   '''
 
+  header = join_header(method, 0)
   method_dict = dict()
-  method_dict['return_type'] = get_method_type(method[0])
-  method_dict['name'] = get_method_name(method[0])
-  method_dict['parameters'] = get_method_parameters(method[0])
+  method_dict['return_type'] = get_method_type(header)
+  method_dict['name'] = get_method_name(header)
+  method_dict['parameters'] = get_method_parameters(header)
   method_dict['code'] = [line.strip() for line in method]
-  method_dict['conditionals'] = parse_conditional(method_dict['code'])
-  method_dict['loops'] = parse_loops(method_dict['code'])
-  method_dict['return_value'] = get_return_value(method_dict['code'])
+  if blocks is None:
+    blocks = get_block_index(method_dict['code'])
+  if kinds is None:
+    kinds = classify_lines(method_dict['code'])
+  method_dict['conditionals'] = parse_conditional(method_dict['code'], blocks, kinds)
+  method_dict['loops'] = parse_loops(method_dict['code'], blocks, kinds)
+  method_dict['return_value'] = get_return_value(method_dict['code'], kinds)
 
   return method_dict
 
-def get_method_start(code, method):
+def get_method_start(code, method, kinds=None):
   '''
   Returns an integer that represents the starting line of the method
 
   Parameters:
     code (list of strings): represents the lines of the student code
     method (string): represents the name of a method
+    kinds (array): line kinds for code built by "classify_lines"; defaults to None, which builds them
 
   Returns:
-     code.index(line) (integer): represents index of the start of the method
+     index (integer): represents index of the start of the method; returns "None" if the method is not found
   '''
 
-  for line in code:
-    words = line.split()
-    if len(words) > 1:
-      if method in line.split()[1]:
+  if kinds is None:
+    kinds = classify_lines(code)
 
-        return code.index(line)
+  return next((index for index in find_kinds(kinds, LINE_METHOD) if METHOD_HEADER.match(join_header(code, index)).group(2) == method), None)
 
-def fetch_method(code, method):
+def fetch_method(code, method, blocks=None, create_method=None):
   '''
   Returns a dictionary that represents a method
 
   Parameters:
     code (list of strings): represents the lines of the student code
     method (string): represents the name of a method
+    blocks (dictionary): block index for code built by "get_block_index"; defaults to None
+    create_method (function): builds a method from its lines and block index; defaults to None, which uses "create_method_dict"
 
   Returns:
      method_dict (dictionary): represents a method
   '''
 
+  if create_method is None:
+    create_method = create_method_dict
+
   method_start = get_method_start(code, method)
-  method_end = get_end_bracket(code, method_start)
+  method_end = get_end_bracket(code, method_start, blocks)
   method_code = code[method_start:method_end]
-  method_dict = create_method_dict(method_code)
+  method_blocks = get_sub_block_index(blocks, method_start, method_end) if blocks is not None else None
+  method_dict = create_method(method_code, method_blocks)
 
   return method_dict
 
-def get_return_value(method):
+## Groups: the value after the word "return", without the semicolon; a closing brace may come first, as in "} return x;"
+RETURN_VALUE = re.compile(r'^\}?\s*return\b\s*(.*?)\s*;?$')
+
+def get_return_value(method, kinds=None):
   '''
   Returns a string that represents the return value of a method; an empty string is return if there is no "return" statement
 
   Parameters:
     method (list of strings): represents the lines of code in a method
+    kinds (array): line kinds for the method built by "classify_lines"; defaults to None, which builds them
 
   Returns:
-     line[7:].replace(';', '') (string): represents the return value of the method; returns an empty string if no "return" statement
+     value (string): represents the value of the first line starting with "return"; returns an empty string if no "return" statement
   '''
 
-  for line in method:
-    if 'return' in line:
+  if kinds is None:
+    kinds = classify_lines(method)
+  for index in find_kinds(kinds, LINE_RETURN):
 
-      return line[7:].replace(';', '')
+    return RETURN_VALUE.match(method[index].strip()).group(1)
 
   return ''
 
+#######################
+## Tokenizing
+#######################
+
+## A token is one piece of a line: a comment, a string or char literal,
+## a curly bracket, or any other run of code. Line and column start at 1
+## and 0 so that line[column:] begins with the token text.
+Token = namedtuple('Token', ['kind', 'text', 'line', 'column'])
+
+TOKEN_PATTERN = re.compile(r'''
+    (?P<block_comment>/\*.*?(?:\*/|$))
+  | (?P<line_comment>//.*)
+  | (?P<string>"(?:\\.|[^"\\])*"?)
+  | (?P<char>'(?:\\.|[^'\\])*'?)
+  | (?P<open_brace>\{)
+  | (?P<close_brace>\})
+  | (?P<code>[^/"'{}]+|/)
+''', re.VERBOSE)
+
+def tokenize(code):
+  '''
+  Yields the tokens of student code in a single pass. Comments, string literals and char literals are single tokens,
+  so a "//" inside a string or a "{" inside a comment is not mistaken for code. A newline token ends every line
+
+  Parameters:
+    code (iterable of strings): represents the lines of code in the sketch
+
+  Returns:
+     token (Token): has the fields kind, text, line, and column; kind is one of block_comment, line_comment, string, char,
+                    open_brace, close_brace, code, or newline (generator)
+  '''
+
+  in_comment = False
+  for line_number, line in enumerate(code, 1):
+    tokens, in_comment = tokenize_line(line.rstrip('\r\n'), line_number, in_comment)
+    yield from tokens
+
+def tokenize_line(line, line_number=1, in_comment=False):
+  '''
+  Returns the tokens of a single line and whether a block comment is still open at the end of it
+
+  Parameters:
+    line (string): represents a line of code without its line ending
+    line_number (integer): line number stored in the tokens; defaults to 1
+    in_comment (boolean): a block comment is open at the start of the line; defaults to False
+
+  Returns:
+     (tokens, in_comment) (tuple): list of Token ending with a newline token, and a boolean for an open block comment
+  '''
+
+  tokens = []
+  column = 0
+  if in_comment:
+    comment_end = line.find('*/')
+    column = len(line) if comment_end == -1 else comment_end + 2
+    in_comment = comment_end == -1
+    tokens.append(Token('block_comment', line[:column], line_number, 0))
+  while column < len(line):
+    match = TOKEN_PATTERN.match(line, column)
+    kind = match.lastgroup
+    text = match.group()
+    if kind == 'block_comment':
+      in_comment = len(text) < 4 or not text.endswith('*/')
+    tokens.append(Token(kind, text, line_number, column))
+    column = match.end()
+  tokens.append(Token('newline', '\n', line_number, len(line)))
+
+  return tokens, in_comment
+
+def count_braces(line):
+  '''
+  Returns the number of "{" minus the number of "}" in a line of code, ignoring any inside strings, chars or comments
+
+  Parameters:
+    line (string): represents a line of code
+
+  Returns:
+     opened (integer): net number of code blocks opened by the line
+  '''
+
+  if '{' not in line and '}' not in line:
+    return 0
+  if '"' not in line and "'" not in line and '/' not in line:
+    return line.count('{') - line.count('}')
+
+  opened = 0
+  for token in tokenize_line(line)[0]:
+    if token.kind == 'open_brace':
+      opened += 1
+    elif token.kind == 'close_brace':
+      opened -= 1
+
+  return opened
+
 #######################
 ## Removing Comments
 #######################
@@ -616,7 +3021,26 @@ def strip_trailing_comments(code):
      [line[:line.find('//')] if '//' in line else line for line in code] (list of strings): represents student code minus lines that end with "//"
   '''
 
-  return [line[:line.find('//')] if '//' in line else line for line in code]
+  return [cut_line_comment(line) for line in code]
+
+def cut_line_comment(line):
+  '''
+  Returns a string that is the line of code up to a "//" comment; a "//" inside a string (such as a URL) is kept
+
+  Parameters:
+    line (string): represents a line of code
+
+  Returns:
+     line[:column] (string): represents the line minus the trailing comment
+  '''
+
+  if '//' not in line:
+    return line
+  for token in tokenize_line(line)[0]:
+    if token.kind == 'line_comment':
+      return line[:token.column]
+
+  return line
 
 def multiline_starting_indices(code):
   '''
@@ -629,10 +3053,7 @@ def multiline_starting_indices(code):
      starting_indices (tuple of integers): represents the indices of elements that start with "/*"
   '''
 
-  starting_indices = ()
-  for line in code:
-    if line.strip().startswith('/*'):
-      starting_indices += (code.index(line),)
+  starting_indices = tuple(find_lines(code, lambda line: line.strip().startswith('/*')))
 
   return starting_indices
 
@@ -647,10 +3068,7 @@ def multiline_ending_indices(code):
      ending_indices (tuple of integers): represents the indices of elements that end with "*/"
   '''
 
-  ending_indices = ()
-  for line in code:
-    if line.strip().endswith('*/'):
-      ending_indices += (code.index(line),)
+  ending_indices = tuple(find_lines(code, lambda line: line.strip().endswith('*/')))
 
   return ending_indices
 
@@ -667,12 +3085,11 @@ def strip_multiline_comments(code):
 
   starting_indices = multiline_starting_indices(code)
   ending_indices = multiline_ending_indices(code)
-  zipped = list(zip(starting_indices, ending_indices))
-  for item in list(zipped):
-    for i in range(item[0], item[1] + 1):
-      code[i] = '~~delete~me~~'
-  no_multiline_comments = [line for line in code if line != '~~delete~me~~']
-  
+  comment_indices = set()
+  for start, end in zip(starting_indices, ending_indices):
+    comment_indices.update(range(start, end + 1))
+  no_multiline_comments = [line for index, line in enumerate(code) if index not in comment_indices]
+
   return no_multiline_comments
 
 def strip_comments(code):
@@ -686,11 +3103,42 @@ def strip_comments(code):
      no_comments (list of strings): represents the lines of code minus all comments
   '''
 
-  code_no_newlines = [line.rstrip() for line in code]
-  code_no_blank_lines = [line for line in code_no_newlines if line != '']
-  no_comments = strip_leading_comments(code_no_blank_lines)
-  no_comments = strip_trailing_comments(no_comments)
-  no_comments = strip_multiline_comments(no_comments)
+  return [line for _, line in iter_stripped_lines(code)]
+
+def strip_comments_with_line_numbers(code):
+  '''
+  Returns the same list as "strip_comments" along with the line number in the sketch of each line
+
+  Parameters:
+    code (list of strings): represents the lines of code in the sketch
+
+  Returns:
+     (no_comments, line_numbers) (tuple): the lines of code minus all comments, and a list with the line number (starting at 1) of each
+  '''
+
+  numbered = list(iter_stripped_lines(code))
+
+  return [line for _, line in numbered], [line_number for line_number, _ in numbered]
+
+def iter_stripped_lines(code):
+  '''
+  Yields the lines of student code without comments or blank lines, one at a time, with their original line numbers.
+  Lines are read lazily, so "code" can be an open file. Lines that could hold a comment are split with "tokenize_line",
+  so comments may start or end anywhere in a line and comment markers inside strings are left alone
+
+  Parameters:
+    code (iterable of strings): represents the lines of code in the sketch
+
+  Returns:
+     (line_number, line) (tuple): line number in the sketch (starting at 1) and the line minus comments and trailing whitespace (generator)
+  '''
 
-  return no_comments
+  in_comment = False
+  for line_number, line in enumerate(code, 1):
+    line = line.rstrip()
+    if in_comment or '/' in line:
+      tokens, in_comment = tokenize_line(line, line_number, in_comment)
+      line = ''.join(token.text for token in tokens if token.kind not in ('block_comment', 'line_comment', 'newline'))
+    if line.strip() != '':
+      yield line_number, line
 
@@ -2,6 +2,24 @@
 Query Processing Code (QPC) - Collection of functions to query Processing code once it has gone through the PPC parser
 '''
 
+from ppc import build_control_flow
+
+try:
+  import numpy as np
+except ImportError:
+  np = None
+
+## Public query functions, each taking the parsed code first; the only QPC functions a check run by "wpc" or "spc" may call
+QUERY_FUNCTIONS = frozenset([
+  'get_code', 'get_full_code', 'has_global_variable', 'get_global_variables', 'count_global_variables',
+  'get_method', 'get_methods', 'get_method_overloads', 'method_has_name', 'get_method_code', 'get_method_parameters',
+  'get_method_return_type', 'get_method_return_value', 'get_method_loops', 'method_has_for_loop', 'method_has_while_loop',
+  'count_method_loops', 'count_method_conditionals', 'method_has_conditional', 'get_control_flow', 'method_has_nested_block',
+  'get_method_nesting', 'has_class_name', 'get_class_names', 'get_class', 'get_constructor', 'get_constructors',
+  'get_constructor_parameters', 'get_constructor_code', 'has_class_method', 'has_attribute', 'get_attributes',
+  'get_method_for_loops', 'get_method_while_loops', 'get_method_conditionals',
+])
+
 #####################################
 ## Working with complete student code
 #####################################
@@ -67,6 +85,19 @@ def get_global_variables(pc):
 
   return pc.get('global_variables')
 
+def count_global_variables(pc):
+  '''
+  Returns the number of global variables in the sketch
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+
+  Returns:
+    count (integer): number of global variables, counting duplicates
+  '''
+
+  return len(pc.get('global_variables'))
+
 #######################
 ## Working with methods
 #######################
@@ -85,11 +116,47 @@ def get_method(pc, method_name):
   '''
 
   methods = pc.get('methods')
+  method_index = pc.get('method_index')
+  if method_index is not None:
+    positions = method_index.get(method_name)
+    return methods[positions[0]] if positions else None
   for method in methods:
     if method.get('name') == method_name:
       return method
   return None
 
+def get_methods(pc, method_names):
+  '''
+  Returns a list of dictionaries containing parsed methods, one for each name
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_names (list of strings): the method names expected to be found in student code
+
+  Returns:
+    methods (list of dictionaries): parsed methods in the same order as the names; an element is None if the method is not found
+  '''
+
+  return [get_method(pc, method_name) for method_name in method_names]
+
+def get_method_overloads(pc, method_name):
+  '''
+  Returns a list of dictionaries containing every parsed method with the given name
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_name (string): the method name expected to be found in student code
+
+  Returns:
+    methods (list of dictionaries): parsed methods with the given name; empty if the method is not found
+  '''
+
+  methods = pc.get('methods')
+  method_index = pc.get('method_index')
+  if method_index is not None:
+    return [methods[position] for position in method_index.get(method_name, [])]
+  return [method for method in methods if method.get('name') == method_name]
+
 def method_has_name(pc, method_name):
   '''
   Returns a boolean or None if the expected method is found (or not) in student code
@@ -221,6 +288,37 @@ def method_has_while_loop(pc, method_name):
       return True
   return False
 
+def count_method_loops(pc, method_name, loop_type=None):
+  '''
+  Returns the number of loops in the method, including nested loops
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_name (string): the method name expected to be found in student code
+    loop_type (string): "for" or "while" to count only that kind of loop; defaults to None, which counts both
+
+  Returns:
+    count (integer): number of loops found
+  '''
+
+  method = get_method(pc, method_name)
+  return sum(1 for loop in method.get('loops') if loop_type is None or loop.get('type') == loop_type)
+
+def count_method_conditionals(pc, method_name):
+  '''
+  Returns the number of conditionals in the method, including nested conditionals
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_name (string): the method name expected to be found in student code
+
+  Returns:
+    count (integer): number of conditionals found
+  '''
+
+  method = get_method(pc, method_name)
+  return len(method.get('conditionals'))
+
 def method_has_conditional(pc, method_name):
   '''
   Returns a boolean if the method has a conditional
@@ -236,6 +334,53 @@ def method_has_conditional(pc, method_name):
   method = get_method(pc, method_name)
   return len(method.get('conditionals')) > 0
 
+def get_control_flow(pc, method_name):
+  '''
+  Returns the control-flow tree of a method: a tree of its if, else if, else, for, while, do, and switch blocks
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_name (string): the method name expected to be found in student code
+
+  Returns:
+    root (BlockNode): block spanning the whole method; see "ppc.BlockNode" for how to walk it
+  '''
+
+  method = get_method(pc, method_name)
+  control_flow = getattr(method, 'control_flow', None)
+  return control_flow if control_flow is not None else build_control_flow(method.get('code'))
+
+def method_has_nested_block(pc, method_name, inner, outer):
+  '''
+  Returns a boolean if the method has a block of one kind nested, at any depth, inside a block of another kind,
+  e.g. a for loop inside a conditional: method_has_nested_block(pc, 'draw', 'for', 'conditional')
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_name (string): the method name expected to be found in student code
+    inner (string): kind of the nested block: if, else if, else, for, while, do, switch, or one of the groups conditional and loop
+    outer (string): kind of the block it is nested in; the same values as inner
+
+  Returns:
+    True or False (boolean): nested block is found or not
+  '''
+
+  return any(node.is_inside(outer) for node in get_control_flow(pc, method_name).find(inner))
+
+def get_method_nesting(pc, method_name):
+  '''
+  Returns the number of levels of loops and conditionals nested in the method
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_name (string): the method name expected to be found in student code
+
+  Returns:
+    nesting (integer): 0 for a method without blocks, 1 for blocks that are not nested, and so on
+  '''
+
+  return get_control_flow(pc, method_name).nesting()
+
 #######################
 ## Working with classes
 #######################
@@ -252,104 +397,150 @@ def has_class_name(pc, class_name):
      True or False (boolean): class name is found or not
   '''
 
-  return pc.get('classes').get('name') == class_name
+  return get_class(pc, class_name) is not None
+
+def get_class_names(pc):
+  '''
+  Returns a list of strings representing the name of every class, in the order they appear in the sketch
 
-def get_class(pc):
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+
+  Returns:
+     names (list of strings): names of the user-defined classes, including inner classes
+  '''
+
+  return [parsed_class.get('name') for parsed_class in pc.get('classes')]
+
+def get_class(pc, class_name=None):
   '''
   Returns a dictionary representing the class
 
   Parameters:
     pc (dictionary): dictionary representing the parsed student code
+    class_name (string): the name of the class; defaults to None, which returns the first class in the sketch
 
   Returns:
-     classes (dictionary): dictionary representation of the class; has the keys name, code, methods, constructor, and attributes
+     classes (dictionary): dictionary representation of the class; has the keys name, parent, code, methods, constructors, constructor, and attributes
+     None (None type): represents lack of expected class
   '''
 
-  return pc.get('classes')
+  for parsed_class in pc.get('classes'):
+    if class_name is None or parsed_class.get('name') == class_name:
+      return parsed_class
+  return None
 
-def get_constructor(pc):
+def get_constructor(pc, class_name=None):
   '''
   Returns a dictionary representing the constructor
 
   Parameters:
     pc (dictionary): dictionary representing the parsed student code
+    class_name (string): the name of the class; defaults to None, which uses the first class in the sketch
 
   Returns:
-    constructor (dictionary): dictionary representation of the class; has the keys code and parameters
+    constructor (dictionary): dictionary representation of the first constructor; has the keys code and parameters
+    None (None type): represents lack of a constructor
   '''
 
-  return pc.get('classes').get('constructor')
+  return get_class(pc, class_name).get('constructor')
 
-def get_constructor_parameters(pc):
+def get_constructors(pc, class_name=None):
+  '''
+  Returns a list of dictionaries representing every constructor of a class
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    class_name (string): the name of the class; defaults to None, which uses the first class in the sketch
+
+  Returns:
+    constructors (list of dictionaries): every constructor in the order they appear; each has the keys code and parameters
+  '''
+
+  return get_class(pc, class_name).get('constructors')
+
+def get_constructor_parameters(pc, class_name=None):
   '''
   Returns a list of strings representing the parameters for the constructor
 
   Parameters:
     pc (dictionary): dictionary representing the parsed student code
+    class_name (string): the name of the class; defaults to None, which uses the first class in the sketch
 
   Returns:
     parameters (list of strings): list of strings representing the parameters for the constructor
   '''
 
-  return pc.get('classes').get('constructor').get('parameters')
+  return get_constructor(pc, class_name).get('parameters')
 
-def get_constructor_code(pc):
+def get_constructor_code(pc, class_name=None):
   '''
   Returns a list of strings representing the code for the constructor
 
   Parameters:
     pc (dictionary): dictionary representing the parsed student code
+    class_name (string): the name of the class; defaults to None, which uses the first class in the sketch
 
   Returns:
     code (list of strings): lines of code for the constructor
   '''
 
-  return pc.get('classes').get('constructor').get('code')
+  return get_constructor(pc, class_name).get('code')
 
-def has_class_method(pc, method_name):
+def has_class_method(pc, method_name, class_name=None):
   '''
   Returns a boolean if the class method name is found
 
   Parameters:
     pc (dictionary): dictionary representing the parsed student code
     method_name (string): the method name expected to be found in the class
+    class_name (string): the name of the class; defaults to None, which uses the first class in the sketch
 
   Returns:
      True or False (boolean): method name is found or not in the class
   '''
 
-  return get_method(pc.get('classes'), method_name)
+  parsed_class = get_class(pc, class_name)
+  if parsed_class is None:
+    return None
+  class_method_index = pc.get('class_method_index')
+  if class_method_index is not None:
+    positions = class_method_index.get(parsed_class.get('name'), {}).get(method_name)
+    return parsed_class.get('methods')[positions[0]] if positions else None
+  return get_method(parsed_class, method_name)
 
-def has_attribute(pc, expected_attribute):
+def has_attribute(pc, expected_attribute, class_name=None):
   '''
   Returns a boolean if the attribute is found in the class
 
   Parameters:
     pc (dictionary): dictionary representing the parsed student code
     expected_attribute (string): the attribute name expected to be found in the class
+    class_name (string): the name of the class; defaults to None, which uses the first class in the sketch
 
   Returns:
      True or False (boolean): attribute is found or not in the class
   '''
 
-  attributes = pc.get('classes').get('attributes')
+  attributes = get_attributes(pc, class_name)
   for attribute in attributes:
     if attribute == expected_attribute:
       return True
   return False
 
-def get_attributes(pc):
+def get_attributes(pc, class_name=None):
   '''
   Returns a list of strings representing the attributes for the class
 
   Parameters:
     pc (dictionary): dictionary representing the parsed student code
+    class_name (string): the name of the class; defaults to None, which uses the first class in the sketch
 
   Returns:
     attributes (list of strings): list of strings representing the attributes for the class
   '''
 
-  return pc.get('classes').get('attributes')
+  return get_class(pc, class_name).get('attributes')
 
 #####################
 ## Working with loops
@@ -415,4 +606,145 @@ def get_method_conditionals(pc, method_name, index=None):
   if index == None:
     return [cond.get('code') for cond in conditionals]
   else:
-    return conditionals[index].get('code')
\ No newline at end of file
+    return conditionals[index].get('code')
+
+###############################
+## Working with many sketches
+###############################
+
+## QPC functions that look up a method by name first; a feature using one is NaN for a sketch without that method
+METHOD_FEATURES = {get_method_code, get_method_parameters, get_method_return_type, get_method_return_value, get_method_loops,
+                   method_has_for_loop, method_has_while_loop, count_method_loops, count_method_conditionals, method_has_conditional,
+                   get_control_flow, method_has_nested_block, get_method_nesting, get_method_for_loops, get_method_while_loops,
+                   get_method_conditionals}
+
+## QPC functions that answer yes or no; their result is turned into 1.0 or 0.0 with bool(), e.g. the method "has_class_method" returns
+BOOLEAN_FEATURES = {has_global_variable, method_has_name, method_has_for_loop, method_has_while_loop, method_has_conditional,
+                    method_has_nested_block, has_class_name, has_class_method, has_attribute}
+
+def feature_matrix(pcs, features):
+  '''
+  Returns a NumPy array with one row per sketch and one column per feature, for rubric statistics or clustering across a
+  cohort. Each feature names a QPC function and the arguments that follow the parsed code, like the checks of
+  "wpc.run_checks"; the yes or no answers of BOOLEAN_FEATURES become 1.0 and 0.0. Requires the optional numpy package.
+  The values are gathered by a Python loop with one step per sketch and feature, since the parsed code is made of
+  dictionaries; NumPy only holds the result. The loop, conditional, and global variable counts are read from the parsed
+  code without calling the QPC function
+
+  Parameters:
+    pcs (iterable): parsed student code for every student, or (name, pc) pairs such as the results of "ppc.parse_many".
+                    It is read once, so a generator is not held in memory; a pc that is the exception raised while
+                    parsing gives a row of NaN
+    features (list): each feature is a dictionary with the keys name, function, and (optionally) args, or a tuple of the
+                     function and its arguments such as ("method_has_for_loop", "draw"). "function" is the name of a QPC
+                     function or any function that takes the parsed code first
+
+  Returns:
+    (matrix, labels) (tuple): a float array of shape (number of sketches, number of features) and the list of column labels.
+                              A feature of METHOD_FEATURES is NaN for a sketch without the method; any other error is raised,
+                              and so is a TypeError for a value that is not a number
+  '''
+
+  if np is None:
+    raise ImportError('feature_matrix needs numpy; install it with "pip install numpy"')
+  columns = [get_feature(feature) for feature in features]
+  labels = [label for label, _, _ in columns]
+  getters = [get_feature_getter(function, args) for _, function, args in columns]
+  values = [[] for _ in columns]
+  rows = 0
+  for pc in pcs:
+    if isinstance(pc, tuple):
+      pc = pc[1]
+    for label, column, getter in zip(labels, values, getters):
+      column.append(np.nan if isinstance(pc, Exception) else to_number(getter(pc), label))
+    rows += 1
+  matrix = np.empty((rows, len(columns)))
+  for index, column in enumerate(values):
+    matrix[:, index] = np.fromiter(column, float, rows)
+  return matrix, labels
+
+def get_feature_getter(function, args):
+  '''
+  Returns a function that gives the value of a feature for one parsed sketch; see "feature_matrix"
+
+  Parameters:
+    function (function): QPC function of the feature
+    args (tuple): arguments that follow the parsed code
+
+  Returns:
+    getter (function): takes the parsed code and returns the value of the feature; None if a method of METHOD_FEATURES is missing
+  '''
+
+  if function is count_global_variables and not args:
+    return lambda pc: len(pc.get('global_variables'))
+  if function is count_method_conditionals and len(args) == 1:
+    return lambda pc: count_method_items(pc, args[0], 'conditionals')
+  if function is count_method_loops and len(args) in (1, 2):
+    loop_type = args[1] if len(args) == 2 else None
+    return lambda pc: count_method_items(pc, args[0], 'loops', loop_type)
+  if function is method_has_name and len(args) == 1:
+    return lambda pc: get_method(pc, args[0]) is not None
+  if function in BOOLEAN_FEATURES:
+    answer = lambda pc: bool(function(pc, *args))
+  else:
+    answer = lambda pc: function(pc, *args)
+  if function in METHOD_FEATURES and args:
+    return lambda pc: answer(pc) if get_method(pc, args[0]) is not None else None
+  return answer
+
+def to_number(value, label):
+  '''
+  Returns a float for a feature value: booleans are 1.0 and 0.0 and None is NaN; raises a TypeError for a value that is not a number
+  '''
+
+  if value is None:
+    return np.nan
+  if isinstance(value, (bool, int, float, np.number)):
+    return float(value)
+  raise TypeError('feature %s does not return a number: %r' % (label, value))
+
+def count_method_items(pc, method_name, key, loop_type=None):
+  '''
+  Returns the number of loops or conditionals in a method, or None if the method is missing
+
+  Parameters:
+    pc (dictionary): dictionary representing the parsed student code
+    method_name (string): the method name expected to be found in student code
+    key (string): "loops" or "conditionals"
+    loop_type (string): "for" or "while" to count only that kind of loop; defaults to None, which counts every item
+
+  Returns:
+    count (integer): number of items found
+    None (None type): represents lack of expected method
+  '''
+
+  method = get_method(pc, method_name)
+  if method is None:
+    return None
+  items = method.get(key)
+  if loop_type is None:
+    return len(items)
+  return sum(1 for item in items if item.get('type') == loop_type)
+
+def get_feature(feature):
+  '''
+  Returns the label, function, and arguments of a feature for "feature_matrix"
+
+  Parameters:
+    feature (dictionary or tuple): see "feature_matrix"
+
+  Returns:
+    (label, function, args) (tuple): the label is the feature name, or the function name and arguments, e.g. "method_has_for_loop(draw)"
+  '''
+
+  if isinstance(feature, dict):
+    function, args, label = feature.get('function'), tuple(feature.get('args', ())), feature.get('name')
+  else:
+    function, args, label = feature[0], tuple(feature[1:]), None
+  if not callable(function):
+    if not callable(globals().get(function)):
+      raise ValueError('unknown qpc function in feature: %r' % (function,))
+    function = globals().get(function)
+  if label is None:
+    label = '%s(%s)' % (function.__name__, ', '.join(str(arg) for arg in args))
+  return label, function, args
@@ -0,0 +1,345 @@
+'''
+Serving Processing Code (SPC) - Grading server that keeps the parser warm between submissions.
+
+Starting Python and importing PPC and QPC takes far longer than parsing one sketch. A GradingServer is started once and
+answers requests over a Unix socket or a localhost TCP port, so an autograder only pays for a connection and the parse.
+Requests are parsed on a pool of worker processes; each worker memoizes parse results and can share a ParseCache.
+Requests can read any file the server can, so a TCP server only listens on a loopback address.
+
+The protocol is one JSON object per line in each direction. A request has an "op" and an optional "id" that is copied
+to the response:
+
+    {"id": 1, "op": "parse", "file": "path/to/sketch.pde", "sketch_methods": ["setup", "draw"]}
+    {"id": 2, "op": "check", "source": "void draw() {...}", "checks": [{"name": "has draw", "function": "get_method", "args": ["draw"]}]}
+    {"id": 3, "op": "ping"}
+
+The sketch is given by exactly one of "file", "directory" (a sketch folder) or "source" (its contents). A response is
+{"id": ..., "ok": true, "result": ...} or {"id": ..., "ok": false, "error": "..."}. "check" results are the same as
+"wpc.run_checks" returns. Start a server from the command line:
+
+    python spc.py --socket /tmp/ppc.sock --workers 4 --cache path/to/cache
+'''
+
+import json, socket, asyncio, argparse, ipaddress
+from concurrent.futures import ProcessPoolExecutor
+import ppc
+from wpc import run_checks
+
+## Longest request line the server reads (16 MB); larger sketches should be sent as a file name
+MAX_REQUEST_BYTES = 16 * 1024 * 1024
+
+## ParseCache used by the worker process; set by "init_worker"
+cache = None
+
+#######################
+## Handling Requests
+#######################
+
+def init_worker(cache_directory):
+  '''
+  Prepares a worker process; the cache is shared by every worker through its directory
+
+  Parameters:
+    cache_directory (string): directory of the ParseCache, or None to parse without a disk cache
+  '''
+
+  global cache
+  cache = ppc.ParseCache(cache_directory) if cache_directory else None
+
+def handle_request(request):
+  '''
+  Returns the result of a parse or check request; runs in a worker process
+
+  Parameters:
+    request (dictionary): decoded request; see the module docstring
+
+  Returns:
+     result (dictionary): the parsed student code for "parse", or the check results for "check"
+  '''
+
+  op = request.get('op')
+  if op not in ('parse', 'check'):
+    raise ValueError('unknown op %r' % op)
+  pc = parse_request(request)
+  if op == 'parse':
+    return ppc.to_plain(pc)
+
+  return run_checks(pc, request.get('checks', []))
+
+def parse_request(request):
+  '''
+  Returns the parsed student code for the sketch named in a request
+
+  Parameters:
+    request (dictionary): decoded request with one of the keys file, directory, or source
+
+  Returns:
+     pc (dictionary): parsed student code
+  '''
+
+  sketch_methods = request.get('sketch_methods')
+  class_methods = request.get('class_methods')
+  if 'source' in request:
+    return ppc.parse_source(request.get('source'), sketch_methods, class_methods, cache)
+  if 'directory' in request:
+    return ppc.parse_sketch_dir(request.get('directory'), sketch_methods, class_methods, cache)
+  if 'file' in request:
+    return ppc.parse_student_code(request.get('file'), sketch_methods, class_methods, cache, memoize=True)
+  raise ValueError('request needs a file, directory, or source')
+
+#######################
+## Grading Server
+#######################
+
+class GradingServer:
+  '''
+  Asyncio server that answers JSON requests from many clients at once and parses on a pool of processes
+
+  Attributes:
+    executor (ProcessPoolExecutor): pool the requests are parsed on
+    requests (integer): number of requests answered so far
+  '''
+
+  def __init__(self, workers=None, cache_directory=None):
+    '''
+    Parameters:
+      workers (integer): number of worker processes; defaults to None, which uses one per CPU
+      cache_directory (string): directory of a ParseCache shared by the workers; defaults to None, which only memoizes
+    '''
+
+    self.executor = ProcessPoolExecutor(workers, initializer=init_worker, initargs=(cache_directory,))
+    self.requests = 0
+
+  async def start(self, socket_path=None, host='127.0.0.1', port=None):
+    '''
+    Returns a started asyncio server listening on a Unix socket, or on a TCP port if no socket path is given
+
+    Parameters:
+      socket_path (string): path of the Unix socket; defaults to None
+      host (string): loopback address to listen on when using TCP; defaults to "127.0.0.1". Other addresses raise ValueError
+      port (integer): TCP port; defaults to None
+
+    Returns:
+       server (asyncio.AbstractServer): the running server
+    '''
+
+    if socket_path is not None:
+      return await asyncio.start_unix_server(self.handle_client, socket_path, limit=MAX_REQUEST_BYTES)
+    if not is_loopback(host):
+      raise ValueError('the grading server only listens on loopback addresses, not %r' % host)
+
+    return await asyncio.start_server(self.handle_client, host, port, limit=MAX_REQUEST_BYTES)
+
+  async def handle_client(self, reader, writer):
+    '''
+    Answers the requests on one connection, in order, until the client disconnects
+    '''
+
+    try:
+      while True:
+        line = await reader.readline()
+        if not line:
+          break
+        response = await self.respond(line)
+        writer.write((json.dumps(response, default=str) + '\n').encode('utf-8'))
+        await writer.drain()
+    except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+      pass
+    finally:
+      writer.close()
+
+  async def respond(self, line):
+    '''
+    Returns the response to one request line
+
+    Parameters:
+      line (bytes): JSON request
+
+    Returns:
+       response (dictionary): has the keys id and ok, and either result or error
+    '''
+
+    try:
+      request = json.loads(line)
+    except ValueError as error:
+      return {'id': None, 'ok': False, 'error': repr(error)}
+    if not isinstance(request, dict):
+      return {'id': None, 'ok': False, 'error': 'a request must be a JSON object'}
+    self.requests += 1
+    try:
+      if request.get('op') == 'ping':
+        result = 'pong'
+      else:
+        result = await asyncio.get_running_loop().run_in_executor(self.executor, handle_request, request)
+    except Exception as error:
+      return {'id': request.get('id'), 'ok': False, 'error': repr(error)}
+
+    return {'id': request.get('id'), 'ok': True, 'result': result}
+
+  def close(self):
+    '''
+    Shuts down the worker processes
+    '''
+
+    self.executor.shutdown()
+
+def is_loopback(host):
+  '''
+  Returns a boolean denoting if host is "localhost" or a loopback IP address
+  '''
+
+  if host == 'localhost':
+    return True
+  try:
+    return ipaddress.ip_address(host).is_loopback
+  except ValueError:
+    return False
+
+def serve(socket_path=None, host='127.0.0.1', port=None, workers=None, cache_directory=None):
+  '''
+  Runs a GradingServer until interrupted with Ctrl+C
+
+  Parameters:
+    socket_path (string): path of the Unix socket; defaults to None, which listens on a TCP port
+    host (string): loopback address to listen on when using TCP; defaults to "127.0.0.1"
+    port (integer): TCP port; defaults to None
+    workers (integer): number of worker processes; defaults to None, which uses one per CPU
+    cache_directory (string): directory of a ParseCache shared by the workers; defaults to None
+  '''
+
+  grading_server = GradingServer(workers, cache_directory)
+
+  async def run():
+    server = await grading_server.start(socket_path, host, port)
+    async with server:
+      await server.serve_forever()
+
+  try:
+    asyncio.run(run())
+  except KeyboardInterrupt:
+    pass
+  finally:
+    grading_server.close()
+
+#######################
+## Client
+#######################
+
+class ServerError(RuntimeError):
+  '''
+  Raised by Client when the server could not answer a request; the message is the error sent by the server
+  '''
+
+class Client:
+  '''
+  Blocking client for a GradingServer. One client keeps one connection open, so grading many submissions only pays
+  for connecting once. It can be used as a context manager.
+  '''
+
+  def __init__(self, socket_path=None, host='127.0.0.1', port=None, timeout=None):
+    '''
+    Parameters:
+      socket_path (string): path of the server's Unix socket; defaults to None, which connects over TCP
+      host (string): address of the server when using TCP; defaults to "127.0.0.1"
+      port (integer): TCP port of the server; defaults to None
+      timeout (float): seconds to wait for a response; defaults to None, which waits forever
+    '''
+
+    if socket_path is not None:
+      self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+      self.socket.settimeout(timeout)
+      self.socket.connect(socket_path)
+    else:
+      self.socket = socket.create_connection((host, port), timeout)
+    self.stream = self.socket.makefile('rwb')
+    self.next_id = 0
+
+  def request(self, op, **fields):
+    '''
+    Returns the result of one request
+
+    Parameters:
+      op (string): "parse", "check", or "ping"
+      fields: the other keys of the request
+
+    Returns:
+       result: the "result" of the response; raises ServerError if the response is not ok
+    '''
+
+    self.next_id += 1
+    fields.update(op=op, id=self.next_id)
+    self.stream.write((json.dumps(fields) + '\n').encode('utf-8'))
+    self.stream.flush()
+    line = self.stream.readline()
+    if not line:
+      raise ConnectionError('the server closed the connection')
+    response = json.loads(line)
+    if not response.get('ok'):
+      raise ServerError(response.get('error'))
+
+    return response.get('result')
+
+  def parse(self, file=None, source=None, directory=None, sketch_methods=None, class_methods=None):
+    '''
+    Returns the parsed student code for a file, sketch folder or source text; give exactly one of them
+    '''
+
+    return self.request('parse', **sketch_fields(file, source, directory, sketch_methods, class_methods))
+
+  def check(self, checks, file=None, source=None, directory=None, sketch_methods=None, class_methods=None):
+    '''
+    Returns the results of the checks (see "wpc.run_checks") for a file, sketch folder or source text; give exactly one of them
+    '''
+
+    return self.request('check', checks=checks, **sketch_fields(file, source, directory, sketch_methods, class_methods))
+
+  def ping(self):
+    '''
+    Returns "pong" if the server is answering
+    '''
+
+    return self.request('ping')
+
+  def close(self):
+    self.stream.close()
+    self.socket.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+def sketch_fields(file, source, directory, sketch_methods, class_methods):
+  '''
+  Returns the request keys that name a sketch, leaving out the ones that are None
+  '''
+
+  fields = {'file': file, 'source': source, 'directory': directory, 'sketch_methods': sketch_methods, 'class_methods': class_methods}
+
+  return {key: value for key, value in fields.items() if value is not None}
+
+#######################
+## Command Line
+#######################
+
+def main(argv=None):
+  '''
+  Runs a GradingServer from the command line; see the module docstring
+  '''
+
+  parser = argparse.ArgumentParser(description='Serve PPC and QPC requests from warm worker processes.')
+  address = parser.add_mutually_exclusive_group(required=True)
+  address.add_argument('--socket', help='Unix socket to listen on')
+  address.add_argument('--port', type=int, help='localhost TCP port to listen on')
+  parser.add_argument('--host', default='127.0.0.1', help='loopback address to listen on with --port')
+  parser.add_argument('--workers', type=int, help='number of worker processes')
+  parser.add_argument('--cache', help='directory of a parse cache shared by the workers')
+  args = parser.parse_args(argv)
+  if args.port is not None and not is_loopback(args.host):
+    parser.error('--host must be a loopback address, such as 127.0.0.1')
+
+  serve(args.socket, args.host, args.port, args.workers, args.cache)
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,74 @@
+import unittest
+import os, sys, csv, gzip, json, shutil, tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ppc import parse_student_code, parse_source
+import epc
+
+class TestEPC(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.names = ['test_sketches/control_flow.pde', 'test_sketches/multiple_classes.pde']
+    self.sketches = [(name, parse_student_code(name)) for name in self.names]
+
+  def read_csv(self, path):
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as table:
+      return list(csv.DictReader(table))
+
+  def test_sketch_rows(self):
+    rows = epc.sketch_rows(3, 'control_flow.pde', self.sketches[0][1])
+    self.assertEqual(rows['sketches'], [(3, 'control_flow.pde', 25, 24, 1, 0, 1)])
+    self.assertEqual(rows['methods'][0][:4], (3, 0, None, 'draw'))
+    self.assertEqual([row[2:5] for row in rows['loops']], [('for', 1, 11), ('while', 5, 3)])
+    self.assertEqual([row[2] for row in rows['conditionals']], [2, 17, 20])
+    self.assertEqual(rows['globals'], [(3, 1, '', 'int', 'count', 'int count = 0;')])
+    for table, columns in epc.TABLES.items():
+      self.assertTrue(all(len(row) == len(columns) for row in rows[table]))
+
+  def test_sketch_rows_unclosed(self):
+    pc = parse_source('void draw() {\n  if (mousePressed) {\n    fill(0);\n  }\n  if (keyPressed) {\n    fill(255);\n  } else {\n    fill(9);\n}\n')
+    rows = epc.sketch_rows(0, 'unclosed.pde', pc)
+    self.assertEqual([row[2:] for row in rows['conditionals']], [(1, 3, 3, 0, 'if (mousePressed) {'), (4, None, None, None, 'if (keyPressed) {')])
+    paths = epc.export([('unclosed.pde', pc)], self.directory, 'csv')
+    self.assertEqual(self.read_csv(paths['conditionals'])[1]['lines'], '')
+
+  def test_export_csv(self):
+    paths = epc.export(iter(self.sketches), self.directory, 'csv', row_group_size=2)
+    self.assertEqual(set(paths), set(epc.TABLES))
+    sketches = self.read_csv(paths['sketches'])
+    self.assertEqual([row['name'] for row in sketches], self.names)
+    self.assertEqual([row['sketch_id'] for row in sketches], ['0', '1'])
+    classes = self.read_csv(paths['classes'])
+    self.assertEqual([row['name'] for row in classes], [parsed_class.get('name') for parsed_class in self.sketches[1][1].get('classes')])
+    self.assertEqual(classes[0]['parent'], '')
+    methods = self.read_csv(paths['methods'])
+    self.assertEqual(len(methods), 1 + sum(len(parsed_class.get('methods')) for parsed_class in self.sketches[1][1].get('classes'))
+                                       + len(self.sketches[1][1].get('methods')))
+
+  def test_export_jsonl(self):
+    paths = epc.export(self.sketches, self.directory, 'jsonl')
+    with gzip.open(paths['loops'], 'rt', encoding='utf-8') as table:
+      loops = [json.loads(line) for line in table]
+    self.assertEqual(loops[0], {'sketch_id': 0, 'method_id': 0, 'type': 'for', 'start': 1, 'lines': 11,
+                                'header': 'for (int i = 0; i < 10; i++) {'})
+
+  def test_exporter_row_groups(self):
+    with epc.Exporter(self.directory, 'csv', row_group_size=2) as exporter:
+      exporter.add(*self.sketches[0])
+      self.assertEqual(exporter.buffers['loops'], [])
+      self.assertEqual(len(exporter.buffers['sketches']), 1)
+      exporter.add(*self.sketches[1])
+      self.assertEqual(exporter.buffers['sketches'], [])
+    self.assertEqual(exporter.sketches, 2)
+    self.assertRaises(ValueError, epc.Exporter, self.directory, 'xml')
+
+  @unittest.skipUnless(epc.pyarrow, 'needs pyarrow')
+  def test_export_parquet(self):
+    paths = epc.export(self.sketches, self.directory, 'parquet', row_group_size=2)
+    table = epc.pyarrow.parquet.read_table(paths['sketches'])
+    self.assertEqual(table.column('name').to_pylist(), self.names)
+    self.assertEqual(epc.pyarrow.parquet.ParquetFile(paths['sketches']).num_row_groups, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 import unittest
-import os, sys
+import os, io, sys, codecs, shutil, tarfile, tempfile, zipfile
+from unittest import mock
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from ppc import parse_student_code
+from ppc import build_symbol_table, merge_tabs, classify_lines, parse_loops, LINE_DO, LINE_DO_END, LINE_SWITCH, LINE_OTHER, LINE_WHILE, LINE_IF, LINE_ELSE, LINE_RETURN, LINE_CLASS, LINE_METHOD, LINE_DECLARATION, LINE_BRACE, parse_student_code, parse_sketch_dir, parse_source, reparse, ParseStats, parse_file_object, parse_many, parse_archive, ParseCache, ParsedSketch, LazyParsedSketch, ParsedMethod, ParsedClass, Loop, Conditional, invalidate_memo, read_file, tokenize, strip_comments, iter_stripped_lines, strip_leading_comments, strip_trailing_comments, strip_multiline_comments, get_end_bracket, get_block_index
 
 class TestPPC(unittest.TestCase):
 
@@ -9,14 +10,14 @@ class TestPPC(unittest.TestCase):
     test_file = 'test_sketches/class_example.pde'
     class_methods = ['update']
     self.code = parse_student_code(test_file, class_methods=class_methods)
-    self.assertEqual(self.code.get('classes').get('name'), "HLine")
+    self.assertEqual(self.code.get('classes')[0].get('name'), "HLine")
 
   def test_class_code(self):
     test_file = 'test_sketches/class_example.pde'
     class_methods = ['update']
     expected_code = ['class HLine {', '  float ypos, speed;', '  HLine (float y, float s, String s1, int num) {', '    ypos = y;', '    speed = s;', '  }', '  void update() {', '    ypos += speed;', '    if (ypos > height) {', '      ypos = 0;', '    }', '    line(0, ypos, width, ypos);', '  }', '}']
     self.code = parse_student_code(test_file, class_methods=class_methods)
-    self.assertEqual(self.code.get('classes').get('code'), expected_code)
+    self.assertEqual(self.code.get('classes')[0].get('code'), expected_code)
 
   def test_class_methods(self):
     test_file = 'test_sketches/class_example.pde'
@@ -28,12 +29,12 @@ class TestPPC(unittest.TestCase):
     expected_conditional = ['if (ypos > height) {', 'ypos = 0;', '}']
     expected_code = ['void update() {', 'ypos += speed;', 'if (ypos > height) {', 'ypos = 0;', '}', 'line(0, ypos, width, ypos);', '}']
     self.code = parse_student_code(test_file, class_methods=class_methods)
-    self.assertEqual(self.code.get('classes').get('methods')[0].get('code'), expected_code)
-    self.assertEqual(self.code.get('classes').get('methods')[0].get('name'), expected_name)
-    self.assertEqual(self.code.get('classes').get('methods')[0].get('return_type'), expected_return_type)
-    self.assertEqual(self.code.get('classes').get('methods')[0].get('return_value'), expected_return_value)
-    self.assertEqual(self.code.get('classes').get('methods')[0].get('parameters'), expected_parameters)
-    self.assertEqual(self.code.get('classes').get('methods')[0].get('conditionals')[0].get('code'), expected_conditional)
+    self.assertEqual(self.code.get('classes')[0].get('methods')[0].get('code'), expected_code)
+    self.assertEqual(self.code.get('classes')[0].get('methods')[0].get('name'), expected_name)
+    self.assertEqual(self.code.get('classes')[0].get('methods')[0].get('return_type'), expected_return_type)
+    self.assertEqual(self.code.get('classes')[0].get('methods')[0].get('return_value'), expected_return_value)
+    self.assertEqual(self.code.get('classes')[0].get('methods')[0].get('parameters'), expected_parameters)
+    self.assertEqual(self.code.get('classes')[0].get('methods')[0].get('conditionals')[0].get('code'), expected_conditional)
 
   def test_class_constructor(self):
     test_file = 'test_sketches/class_example.pde'
@@ -41,15 +42,15 @@ class TestPPC(unittest.TestCase):
     expected_constructor = ['HLine (float y, float s, String s1, int num) {', 'ypos = y;', 'speed = s;', '}']
     expected_parameters = ['float y', 'float s', 'String s1', 'int num']
     self.code = parse_student_code(test_file, class_methods=class_methods)
-    self.assertEqual(self.code.get('classes').get('constructor').get('code'), expected_constructor)
-    self.assertEqual(self.code.get('classes').get('constructor').get('parameters'), expected_parameters)
+    self.assertEqual(self.code.get('classes')[0].get('constructor').get('code'), expected_constructor)
+    self.assertEqual(self.code.get('classes')[0].get('constructor').get('parameters'), expected_parameters)
 
   def test_class_attributes(self):
     test_file = 'test_sketches/class_example.pde'
     class_methods = ['update']
     expected_attributes = ['float ypos, speed;']
     self.code = parse_student_code(test_file, class_methods=class_methods)
-    self.assertEqual(self.code.get('classes').get('attributes'), expected_attributes)
+    self.assertEqual(self.code.get('classes')[0].get('attributes'), expected_attributes)
 
   def test_code_no_comments(self):
     expected = ['void setup() {', '  size(200, 200); ', '}', 'void draw() {', '  background(0);', '}']
@@ -184,5 +185,468 @@ class TestPPC(unittest.TestCase):
     self.assertEqual(self.code.get('methods')[0].get('code'), expected_method_code_1)
     self.assertEqual(self.code.get('methods')[1].get('code'), expected_method_code_2)
 
+  def test_block_index(self):
+    for sketch in os.listdir('test_sketches'):
+      code = strip_comments(read_file(os.path.join('test_sketches', sketch)))
+      blocks = get_block_index(code)
+      for start in range(len(code)):
+        self.assertEqual(blocks.get(start), get_end_bracket(code, start))
+
+  def test_duplicate_lines_loops(self):
+    test_file = 'test_sketches/duplicate_lines.pde'
+    self.code = parse_student_code(test_file)
+    expected_for_1 = ['for (int i = 0; i < 3; i++) {', 'x += 1;', '}']
+    expected_for_2 = ['for (int i = 0; i < 3; i++) {', 'x += 2;', '}']
+    expected_while_1 = ['while (x < 10) {', 'x += 1;', '}']
+    expected_while_2 = ['while (x < 10) {', 'x += 1;', 'println(x);', '}']
+    self.assertEqual(self.code.get('methods')[0].get('loops')[0].get('code'), expected_for_1)
+    self.assertEqual(self.code.get('methods')[0].get('loops')[1].get('code'), expected_for_2)
+    self.assertEqual(self.code.get('methods')[1].get('loops')[0].get('code'), expected_while_1)
+    self.assertEqual(self.code.get('methods')[1].get('loops')[1].get('code'), expected_while_2)
+
+  def test_duplicate_lines_conditionals(self):
+    test_file = 'test_sketches/duplicate_lines.pde'
+    self.code = parse_student_code(test_file)
+    expected_conditional_1 = ['if (x > 5) {', 'x += 1;', '}']
+    expected_conditional_2 = ['if (x > 5) {', 'x = 0;', '} else {', 'x += 1;', '}']
+    self.assertEqual(self.code.get('methods')[1].get('conditionals')[0].get('code'), expected_conditional_1)
+    self.assertEqual(self.code.get('methods')[1].get('conditionals')[1].get('code'), expected_conditional_2)
+    self.assertEqual(self.code.get('methods')[1].get('conditionals')[1].get('false_branch'), ['} else {', 'x += 1;', '}'])
+
+  def test_duplicate_lines_comments(self):
+    test_file = 'test_sketches/duplicate_lines.pde'
+    self.code = parse_student_code(test_file)
+    self.assertEqual(self.code.get('code')[:2], ['int x = 0;', 'void setup() {'])
+    self.assertEqual(self.code.get('global_variables'), ['int x = 0;'])
+
+  def test_parse_many(self):
+    test_files = [os.path.join('test_sketches', sketch) for sketch in sorted(os.listdir('test_sketches'))]
+    missing_file = 'test_sketches/missing.pde'
+    results = dict(parse_many(test_files + [missing_file], workers=2, chunk_bytes=1024))
+    self.assertEqual(sorted(results), sorted(test_files + [missing_file]))
+    self.assertIsInstance(results[missing_file], FileNotFoundError)
+    for test_file in test_files:
+      self.assertEqual(results[test_file], parse_student_code(test_file))
+
+  def test_parse_cache(self):
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    cache = ParseCache(cache_dir)
+    test_file = 'test_sketches/class_example.pde'
+    class_methods = ['update']
+    expected = parse_student_code(test_file, class_methods=class_methods)
+    self.assertEqual(parse_student_code(test_file, class_methods=class_methods, cache=cache), expected)
+    self.assertEqual(parse_student_code(test_file, class_methods=class_methods, cache=cache), expected)
+    self.assertEqual(cache.stats().get('hits'), 1)
+    self.assertEqual(cache.stats().get('misses'), 1)
+    parse_student_code(test_file, cache=cache)
+    self.assertEqual(cache.stats().get('misses'), 2)
+
+  def test_parse_cache_eviction(self):
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    cache = ParseCache(cache_dir, max_bytes=4096)
+    for sketch in os.listdir('test_sketches'):
+      parse_student_code(os.path.join('test_sketches', sketch), cache=cache)
+    self.assertLessEqual(cache.stats().get('size'), 4096)
+    self.assertLessEqual(sum(entry.stat().st_size for entry in cache.entries()), 4096)
+    self.assertGreater(len(cache.entries()), 0)
+
+  def test_parse_cache_shared_directory(self):
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    cache = ParseCache(cache_dir, max_bytes=1)
+    test_file = 'test_sketches/methods.pde'
+    replace = os.replace
+
+    def replace_then_evict(source, destination):
+      replace(source, destination)
+      os.remove(destination)
+
+    with mock.patch('ppc.os.replace', replace_then_evict):
+      self.assertEqual(parse_student_code(test_file, cache=cache), parse_student_code(test_file))
+    parse_student_code('test_sketches/loops.pde', cache=ParseCache(cache_dir))
+    entries = cache.entries()
+    os.remove(entries[0].path)
+    with mock.patch.object(cache, 'entries', return_value=entries):
+      cache.evict()
+    self.assertEqual(cache.entries(), [])
+
+  def test_memoize(self):
+    test_file = 'test_sketches/methods.pde'
+    expected_methods = ['setup', 'draw', 'checkEdge', 'evenOdd', 'concatStrings']
+    self.code = parse_student_code(test_file, expected_methods, memoize=True)
+    self.assertIs(parse_student_code(test_file, expected_methods, memoize=True), self.code)
+    self.assertIsNot(parse_student_code(test_file, memoize=True), self.code)
+    self.assertEqual(self.code, parse_student_code(test_file, expected_methods))
+    with self.assertRaises(TypeError):
+      self.code.get('methods')[0].get('code').append('}')
+    invalidate_memo(test_file)
+    self.assertIsNot(parse_student_code(test_file, expected_methods, memoize=True), self.code)
+
+  def test_memoize_no_class_methods(self):
+    test_file = 'test_sketches/class_example.pde'
+    invalidate_memo(test_file)
+    self.assertEqual(len(parse_student_code(test_file, memoize=True).get('classes')[0].get('methods')), 1)
+    self.assertEqual(len(parse_student_code(test_file, class_methods=[], memoize=True).get('classes')[0].get('methods')), 0)
+
+  def test_memoize_changed_file(self):
+    sketch_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, sketch_dir)
+    test_file = os.path.join(sketch_dir, 'sketch.pde')
+    shutil.copy('test_sketches/global_variables.pde', test_file)
+    self.code = parse_student_code(test_file, memoize=True)
+    with open(test_file, 'a') as sketch:
+      sketch.write('\nint speed = 5;')
+    self.assertIn('int speed = 5;', parse_student_code(test_file, memoize=True).get('global_variables'))
+
+  def test_typed_result(self):
+    test_file = 'test_sketches/class_example.pde'
+    class_methods = ['update']
+    expected = parse_student_code(test_file, class_methods=class_methods)
+    self.code = parse_student_code(test_file, class_methods=class_methods, typed=True)
+    self.assertIsInstance(self.code, ParsedSketch)
+    self.assertIsInstance(self.code.get('methods')[0], ParsedMethod)
+    self.assertIsInstance(self.code.get('classes')[0], ParsedClass)
+    self.assertIsInstance(self.code.get('classes')[0].get('methods')[0].get('conditionals')[0], Conditional)
+    self.assertEqual(self.code, expected)
+    self.assertEqual(self.code.to_dict(), expected)
+    self.assertEqual(self.code.classes[0].name, 'HLine')
+    self.assertEqual(self.code['global_variables'], expected.get('global_variables'))
+    self.assertIsNone(self.code.get('missing'))
+    self.assertFalse(hasattr(self.code, '__dict__'))
+
+  def test_typed_loops(self):
+    test_file = 'test_sketches/loops.pde'
+    self.code = parse_student_code(test_file, typed=True)
+    self.assertIsInstance(self.code.get('methods')[0].get('loops')[0], Loop)
+    self.assertEqual(self.code.get('methods')[0].get('loops')[0].get('type'), 'while')
+
+  def test_lazy_result(self):
+    test_file = 'test_sketches/methods.pde'
+    expected_methods = ['setup', 'draw', 'checkEdge', 'evenOdd', 'concatStrings']
+    self.code = parse_student_code(test_file, expected_methods, lazy=True)
+    self.assertIsInstance(self.code, LazyParsedSketch)
+    self.assertFalse(self.code.is_computed('code'))
+    self.assertEqual(self.code.get('global_variables'), ['int xpos = 0;'])
+    self.assertFalse(self.code.is_computed('classes') and self.code.get('classes'))
+    for method in self.code.get('methods'):
+      self.assertFalse(method.is_computed('conditionals'))
+      self.assertFalse(method.is_computed('loops'))
+    self.assertEqual(self.code.get('methods')[4].get('return_value'), 's1 + s2')
+    self.assertFalse(self.code.get('methods')[4].is_computed('loops'))
+    self.assertEqual(self.code, parse_student_code(test_file, expected_methods))
+
+  def test_lazy_result_class(self):
+    test_file = 'test_sketches/class_example.pde'
+    class_methods = ['update']
+    self.code = parse_student_code(test_file, class_methods=class_methods, lazy=True)
+    expected = parse_student_code(test_file, class_methods=class_methods)
+    self.assertEqual(self.code.get('classes')[0].get('constructor'), expected.get('classes')[0].get('constructor'))
+    self.assertFalse(self.code.get('classes')[0].get('methods')[0].is_computed('conditionals'))
+    self.assertEqual(self.code, expected)
+
+  def test_parse_source(self):
+    test_file = 'test_sketches/comments.pde'
+    expected = parse_student_code(test_file)
+    with open(test_file) as sketch:
+      source = sketch.read()
+    self.assertEqual(parse_source(source), expected)
+    self.assertEqual(parse_source(source.encode('utf-8')), expected)
+    self.assertEqual(parse_source(source.replace('\n', '\r\n').encode('utf-8')), expected)
+    self.assertEqual(parse_source(codecs.BOM_UTF8 + source.encode('utf-8')), expected)
+    self.assertEqual(parse_source(codecs.BOM_UTF16_LE + source.encode('utf-16-le')), expected)
+
+  def test_parse_source_encoding(self):
+    source = 'String name = "Jos\u00e9";\nvoid setup() {\n}\nvoid draw() {\n}'
+    self.assertEqual(parse_source(source.encode('utf-8')).get('global_variables'), ['String name = "Jos\u00e9";'])
+    self.assertEqual(parse_source(source.encode('latin-1')).get('global_variables'), ['String name = "Jos\u00e9";'])
+
+  def test_parse_file_object(self):
+    test_file = 'test_sketches/methods.pde'
+    expected_methods = ['setup', 'draw', 'checkEdge', 'evenOdd', 'concatStrings']
+    expected = parse_student_code(test_file, expected_methods)
+    with open(test_file, 'rb') as sketch:
+      self.assertEqual(parse_file_object(sketch, expected_methods), expected)
+    with open(test_file, 'r') as sketch:
+      self.assertEqual(parse_file_object(sketch, expected_methods, typed=True), expected)
+    with open(test_file, 'rb') as sketch:
+      self.assertEqual(parse_file_object(io.BytesIO(sketch.read()), expected_methods, lazy=True), expected)
+
+  def make_archives(self):
+    archive_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, archive_dir)
+    members = [('student1/sketch.pde', 'test_sketches/for_loop.pde'), ('student2/loops.pde', 'test_sketches/loops.pde'),
+               ('student2/extra.pde', 'test_sketches/while_loop.pde'), ('student2/notes.txt', 'test_sketches/comments.pde')]
+    zip_name = os.path.join(archive_dir, 'cohort.zip')
+    tar_name = os.path.join(archive_dir, 'cohort.tar.gz')
+    with zipfile.ZipFile(zip_name, 'w') as archive:
+      for name, test_file in members:
+        archive.write(test_file, name)
+    with tarfile.open(tar_name, 'w:gz') as archive:
+      for name, test_file in members:
+        archive.add(test_file, name)
+    return zip_name, tar_name
+
+  def test_parse_archive(self):
+    for archive_name in self.make_archives():
+      results = dict(parse_archive(archive_name, workers=2))
+      self.assertEqual(sorted(results), ['student1', 'student2'])
+      self.assertEqual(sorted(results['student2']), ['student2/extra.pde', 'student2/loops.pde'])
+      self.assertEqual(results['student1']['student1/sketch.pde'], parse_student_code('test_sketches/for_loop.pde'))
+      self.assertEqual(results['student2']['student2/extra.pde'], parse_student_code('test_sketches/while_loop.pde'))
+
+  def test_iter_stripped_lines(self):
+    test_file = 'test_sketches/comments.pde'
+    expected = [(7, 'void setup() {'), (9, '  size(200, 200); '), (10, '}'), (12, 'void draw() {'), (14, '  background(0);'), (15, '}')]
+    with open(test_file) as sketch:
+      self.assertEqual(list(iter_stripped_lines(sketch)), expected)
+
+  def test_strip_comments_matches_helpers(self):
+    # the line-based helpers do not understand comments in the middle of a line
+    for sketch in set(os.listdir('test_sketches')) - {'strings_and_comments.pde'}:
+      full_code = read_file(os.path.join('test_sketches', sketch))
+      no_comments = [line.rstrip() for line in full_code if line.rstrip() != '']
+      no_comments = strip_multiline_comments(strip_trailing_comments(strip_leading_comments(no_comments)))
+      self.assertEqual(strip_comments(full_code), no_comments)
+
+  def test_strip_multiline_comments_keeps_input(self):
+    code = ['/*', 'comment', '*/', 'int x = 0;']
+    self.assertEqual(strip_multiline_comments(code), ['int x = 0;'])
+    self.assertEqual(code, ['/*', 'comment', '*/', 'int x = 0;'])
+
+  def test_tokenize(self):
+    tokens = list(tokenize(['x = "a // b"; /* c', 'd */ y(\'{\');']))
+    kinds = [token.kind for token in tokens]
+    self.assertEqual(kinds, ['code', 'string', 'code', 'block_comment', 'newline', 'block_comment', 'code', 'char', 'code', 'newline'])
+    self.assertEqual(tokens[1], ('string', '"a // b"', 1, 4))
+    self.assertEqual(tokens[5], ('block_comment', 'd */', 2, 0))
+
+  def test_strings_and_comments(self):
+    test_file = 'test_sketches/strings_and_comments.pde'
+    self.code = parse_student_code(test_file)
+    expected_code = ['PImage img; ', ' int count = 0;', 'void setup() {', '  img = loadImage("http://example.com/cat.png"); ', '  println("{");  count++;', '}', 'void draw() {', "  char close = '}';", '  if (count > 0) {', '    println("// not a comment");', '  }', '}']
+    expected_setup = ['void setup() {', 'img = loadImage("http://example.com/cat.png");', 'println("{");  count++;', '}']
+    expected_conditional = ['if (count > 0) {', 'println("// not a comment");', '}']
+    self.assertEqual(self.code.get('code'), expected_code)
+    self.assertEqual(self.code.get('methods')[0].get('code'), expected_setup)
+    self.assertEqual(self.code.get('methods')[1].get('conditionals')[0].get('code'), expected_conditional)
+    self.assertEqual(self.code.get('global_variables'), ['PImage img;', 'int count = 0;'])
+
+  def test_discovered_methods(self):
+    test_file = 'test_sketches/discovered_methods.pde'
+    self.code = parse_student_code(test_file)
+    names = [method.get('name') for method in self.code.get('methods')]
+    self.assertEqual(names, ['drawCircle', 'drawCircle', 'setup', 'draw', 'getValues'])
+    self.assertEqual(self.code.get('methods')[1].get('parameters'), ['float x', 'float y', 'float d'])
+    self.assertEqual(self.code.get('methods')[4].get('return_type'), 'int[]')
+    self.assertEqual(self.code.get('methods')[4].get('code'), ['public int[] getValues()', '{', 'return values;', '}'])
+    self.assertEqual(self.code.get('method_index').get('drawCircle'), [0, 1])
+
+  def test_required_methods_filter(self):
+    test_file = 'test_sketches/discovered_methods.pde'
+    self.code = parse_student_code(test_file, sketch_methods=['draw', 'drawCircle', 'missing'])
+    names = [method.get('name') for method in self.code.get('methods')]
+    self.assertEqual(names, ['draw', 'drawCircle', 'drawCircle'])
+    self.assertEqual(self.code.get('methods')[0].get('code')[0], 'void draw() {')
+
+  def test_discovered_class_methods(self):
+    test_file = 'test_sketches/class_example.pde'
+    self.code = parse_student_code(test_file, class_methods=['update'])
+    discovered = parse_student_code(test_file)
+    self.assertEqual([method.get('name') for method in discovered.get('methods')], ['setup', 'draw'])
+    self.assertEqual(self.code.get('methods'), discovered.get('methods'))
+
+  def test_multiple_classes(self):
+    test_file = 'test_sketches/multiple_classes.pde'
+    self.code = parse_student_code(test_file)
+    classes = self.code.get('classes')
+    self.assertEqual([parsed_class.get('name') for parsed_class in classes], ['Ball', 'Paddle', 'Score'])
+    self.assertEqual([parsed_class.get('parent') for parsed_class in classes], [None, None, 'Paddle'])
+    self.assertEqual(classes[0].get('attributes'), ['float x, y;', 'float speed = 2;'])
+    self.assertEqual(classes[0].get('constructor').get('parameters'), ['float x', 'float y'])
+    self.assertEqual([constructor.get('parameters') for constructor in classes[1].get('constructors')], [[''], ['int w']])
+    self.assertEqual(classes[1].get('attributes'), ['int w;', 'Score score = new Score();'])
+    self.assertEqual([method.get('name') for method in classes[1].get('methods')], ['show'])
+    self.assertEqual(classes[2].get('methods')[0].get('parameters'), ['int amount'])
+    self.assertIsNone(classes[2].get('constructor'))
+    self.assertEqual(self.code.get('class_method_index'), {'Ball': {'move': [0]}, 'Paddle': {'show': [0]}, 'Score': {'add': [0]}})
+    self.assertEqual([method.get('name') for method in self.code.get('methods')], ['setup', 'draw'])
+    self.assertEqual(self.code.get('global_variables'), ['Ball ball;', 'Paddle paddle;'])
+
+  def test_multiple_classes_filtered(self):
+    test_file = 'test_sketches/multiple_classes.pde'
+    self.code = parse_student_code(test_file, class_methods=['move', 'add'])
+    self.assertEqual([len(parsed_class.get('methods')) for parsed_class in self.code.get('classes')], [1, 0, 1])
+    self.assertEqual(self.code, parse_student_code(test_file, class_methods=['move', 'add'], lazy=True))
+
+  def test_global_declarations(self):
+    test_file = 'test_sketches/global_declarations.pde'
+    self.code = parse_student_code(test_file, sketch_methods=['setup', 'draw'])
+    declarations = self.code.get('global_declarations')
+    self.assertEqual([declaration.get('line') for declaration in declarations], [1, 4, 5, 8, 21, 22])
+    self.assertEqual(declarations[0].get('type'), None)
+    self.assertEqual(declarations[1], {'modifiers': ['final'], 'type': 'int', 'names': ['LEVELS', 'LIVES'], 'initialisers': ['3', None],
+                                       'code': 'final int LEVELS = 3, LIVES;', 'line': 4})
+    self.assertEqual(declarations[2].get('initialisers'), ['{ 10, 20, 30 }'])
+    self.assertEqual(declarations[3].get('names'), ['title'])
+    expected = ['String title = "a, b; c";', 'final int LEVELS = 3, LIVES;', 'float speed = 2.5;', 'float speed = 2.5;',
+                'import processing.sound.*;', 'int[] scores = { 10, 20, 30 };']
+    self.assertEqual(self.code.get('global_variables'), expected)
+    self.assertEqual(parse_student_code(test_file).get('global_variables'), expected)
+
+  def test_classify_lines(self):
+    test_file = 'test_sketches/line_kinds.pde'
+    self.code = parse_student_code(test_file)
+    self.assertEqual(list(classify_lines(self.code.get('code'))),
+                     [LINE_CLASS, LINE_DECLARATION, LINE_BRACE, LINE_METHOD, LINE_RETURN, LINE_BRACE, LINE_METHOD, LINE_DECLARATION,
+                      LINE_DECLARATION, LINE_IF, LINE_OTHER, LINE_ELSE, LINE_WHILE, LINE_OTHER, LINE_BRACE, LINE_BRACE, LINE_RETURN, LINE_BRACE,
+                      LINE_METHOD, LINE_IF, LINE_OTHER, LINE_RETURN, LINE_BRACE])
+    method = self.code.get('methods')[1]
+    self.assertEqual(method.get('return_value'), 'returnValue')
+    self.assertEqual(len(method.get('conditionals')), 1)
+    self.assertEqual(method.get('conditionals')[0].get('true_branch'), ['if (returnValue > 4) {', 'elseCount++;'])
+    self.assertEqual([loop.get('type') for loop in method.get('loops')], ['while'])
+    self.assertEqual(self.code.get('methods')[2].get('return_value'), '3')
+    lazy = parse_student_code(test_file, lazy=True)
+    self.assertEqual(lazy.get('methods')[2].get('return_value'), '3')
+
+  def test_multiline_header(self):
+    test_file = 'test_sketches/multiline_header.pde'
+    for code in (parse_student_code(test_file), parse_student_code(test_file, lazy=True)):
+      self.assertEqual([method.get('name') for method in code.get('methods')], ['add', 'setup'])
+      self.assertEqual(code.get('methods')[0].get('parameters'), ['int a', 'int b'])
+      self.assertEqual(code.get('methods')[0].get('code'), ['void add(int a,', 'int b) {', 'total = a + b;', '}'])
+      self.assertEqual(code.get('classes')[0].get('constructor').get('parameters'), ['float startX', 'float speed'])
+      self.assertEqual(code.get('classes')[0].get('methods')[0].get('parameters'), ['float dx', 'float dy'])
+      self.assertEqual(code.get('global_variables'), ['int total = 0;'])
+    self.assertEqual(parse_student_code(test_file, ['add']).get('methods')[0].get('parameters'), ['int a', 'int b'])
+
+  def test_parse_loops_do_while(self):
+    method = ['void draw() {', 'do {', 'count++;', '} while (count < 20);', 'switch (count) {', 'case 1:', 'break;', '}', 'do {', 'count--;', '}',
+              'while (count > 0);', 'while (count < 5) {', 'count++;', '}', '}']
+    kinds = classify_lines(method)
+    self.assertEqual([kinds[index] for index in (1, 3, 4, 8, 11, 12)], [LINE_DO, LINE_DO_END, LINE_SWITCH, LINE_DO, LINE_DO_END, LINE_WHILE])
+    self.assertEqual(parse_loops(method), [{'type': 'while', 'code': ['while (count < 5) {', 'count++;', '}'], 'start': 12}])
+
+  def test_parse_sketch_dir(self):
+    sketch_dir = 'test_sketch_folders/multi_tab'
+    self.code = parse_sketch_dir(sketch_dir)
+    self.assertEqual(self.code.get('tabs'), ['multi_tab.pde', 'Ball.pde', 'score.pde'])
+    self.assertEqual([method.get('name') for method in self.code.get('methods')], ['setup', 'draw', 'drawScore'])
+    self.assertEqual(self.code.get('provenance').get('methods'), [['multi_tab.pde', 4], ['multi_tab.pde', 9], ['score.pde', 6]])
+    self.assertEqual(self.code.get('classes')[0].get('name'), 'Ball')
+    self.assertEqual(self.code.get('provenance').get('classes'), [['Ball.pde', 1]])
+    self.assertEqual(self.code.get('global_variables'), ['Ball ball;', 'int score = 0;'])
+    self.assertEqual(self.code.get('provenance').get('global_variables'), [['multi_tab.pde', 2], ['score.pde', 1]])
+    self.assertEqual(self.code.get('provenance').get('global_declarations'), [['multi_tab.pde', 2], ['score.pde', 1]])
+    self.assertEqual(self.code.get('method_index').get('drawScore'), [2])
+    self.assertEqual(self.code.get('class_method_index'), {'Ball': {'move': [0]}})
+    self.assertEqual(self.code.get('methods')[2], parse_student_code(os.path.join(sketch_dir, 'score.pde')).get('methods')[0])
+
+  def test_merge_tabs_spans(self):
+    sketch_dir = 'test_sketch_folders/multi_tab'
+    tabs = [(name, parse_student_code(os.path.join(sketch_dir, name))) for name in ['multi_tab.pde', 'Ball.pde', 'score.pde']]
+    with mock.patch('ppc.build_symbol_table') as build_symbol_table, mock.patch('ppc.iter_stripped_lines') as iter_lines:
+      self.code = merge_tabs(tabs)
+    build_symbol_table.assert_not_called()
+    iter_lines.assert_not_called()
+    self.assertEqual(self.code, parse_sketch_dir(sketch_dir))
+    start, end = self.code.get('spans').get('methods')[2]
+    self.assertEqual(self.code.get('code')[start].strip(), self.code.get('methods')[2].get('code')[0])
+    self.assertEqual(self.code.get('line_numbers')[start], 6)
+
+  def test_parse_sketch_dir_cache(self):
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    sketch_dir = os.path.join(cache_dir, 'multi_tab')
+    shutil.copytree('test_sketch_folders/multi_tab', sketch_dir)
+    cache = ParseCache(os.path.join(cache_dir, 'cache'))
+    expected = parse_sketch_dir(sketch_dir, sketch_methods=['draw', 'drawScore'], cache=cache)
+    self.assertEqual(cache.stats().get('misses'), 3)
+    with open(os.path.join(sketch_dir, 'score.pde'), 'a') as tab:
+      tab.write('\nint lives = 3;\n')
+    self.code = parse_sketch_dir(sketch_dir, sketch_methods=['draw', 'drawScore'], cache=cache)
+    self.assertEqual(cache.stats().get('hits'), 2)
+    self.assertEqual(cache.stats().get('misses'), 4)
+    self.assertEqual(self.code.get('provenance').get('methods'), [['multi_tab.pde', 9], ['score.pde', 6]])
+    self.assertEqual(self.code.get('global_variables'), sorted(expected.get('global_variables') + ['int lives = 3;']))
+
+  def test_reparse(self):
+    test_file = 'test_sketches/multiple_classes.pde'
+    previous = parse_student_code(test_file)
+    source = ''.join(previous.get('full_code')).replace('w = 80;', 'w = 100;').replace('x += speed;', 'x += speed * 2;')
+    self.code = reparse(previous, source)
+    self.assertEqual(self.code, parse_source(source))
+    self.assertIs(self.code.get('methods')[0], previous.get('methods')[0])
+    self.assertIs(self.code.get('classes')[1].get('methods')[0], previous.get('classes')[1].get('methods')[0])
+    self.assertIsNot(self.code.get('classes')[0].get('methods')[0], previous.get('classes')[0].get('methods')[0])
+    self.assertEqual(self.code.get('classes')[1].get('constructor').get('code')[1], 'w = 100;')
+
+  def test_reparse_changed_range(self):
+    test_file = 'test_sketches/multiple_classes.pde'
+    previous = parse_student_code(test_file)
+    source = ''.join(previous.get('full_code')).replace('ball.move();', 'ball.move();\n  ball.move();')
+    with mock.patch('ppc.build_symbol_table', wraps=build_symbol_table) as build:
+      self.code = reparse(previous, source)
+    self.assertEqual(self.code, parse_source(source))
+    self.assertEqual(build.call_args[0][0], ['void draw() {', '  ball.move();', '  ball.move();', '  paddle.show();', '}'])
+    self.assertIs(self.code.get('methods')[0], previous.get('methods')[0])
+    self.assertIs(self.code.get('classes')[2], previous.get('classes')[2])
+    self.assertEqual(self.code.get('spans').get('classes')[0], [12, 26])
+    source = source.replace('ball.move();\n  ball.move();', 'ball.move(); {')
+    self.assertEqual(reparse(self.code, source), parse_source(source))
+    self.assertEqual(reparse(self.code, source, ['draw', 'setup']), parse_source(source, ['draw', 'setup']))
+
+  def test_reparse_comments_only(self):
+    test_file = 'test_sketches/methods.pde'
+    previous = parse_student_code(test_file)
+    source = '// Edited\n' + ''.join(previous.get('full_code'))
+    self.code = reparse(previous, source.encode('utf-8'))
+    self.assertEqual(self.code, parse_source(source))
+    self.assertIs(self.code.get('methods'), previous.get('methods'))
+
+  def test_parse_stats(self):
+    test_file = 'test_sketches/multiple_classes.pde'
+    records = []
+    stats = ParseStats(records.append)
+    self.code = parse_student_code(test_file, stats=stats)
+    self.assertEqual(self.code, parse_student_code(test_file))
+    parse_source(''.join(self.code.get('full_code')), stats=stats)
+    self.assertEqual(stats.parses, 2)
+    self.assertEqual([record.get('name') for record in records], [test_file, None])
+    self.assertEqual(set(records[0].get('phases')), {'read_file', 'strip_comments', 'get_block_index', 'classify_lines', 'build_symbol_table',
+                                                     'parse_methods', 'parse_classes', 'get_global_variables', 'build_method_index'})
+    self.assertAlmostEqual(sum(records[0].get('phases').values()), records[0].get('seconds'))
+    self.assertEqual(records[0].get('lines'), len(self.code.get('full_code')))
+    self.assertEqual(records[0].get('methods'), 2)
+    self.assertEqual(records[0].get('classes'), 3)
+    self.assertEqual(stats.counts.get('classes'), 6)
+    self.assertAlmostEqual(sum(stats.to_dict().get('share').values()), 1)
+
+  def test_parse_stats_cache(self):
+    cache_dir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, cache_dir)
+    cache = ParseCache(cache_dir)
+    test_file = 'test_sketches/methods.pde'
+    records = []
+    stats = ParseStats(records.append)
+    self.code = parse_student_code(test_file, cache=cache, stats=stats)
+    parse_student_code(test_file, cache=cache, stats=stats)
+    self.assertEqual(stats.parses, 1)
+    self.assertEqual(records[0].get('name'), test_file)
+    invalidate_memo(test_file)
+    parse_student_code(test_file, memoize=True, stats=stats)
+    parse_student_code(test_file, memoize=True, stats=stats)
+    self.assertEqual(stats.parses, 2)
+
+  def test_parse_stats_many(self):
+    test_files = [os.path.join('test_sketches', sketch) for sketch in sorted(os.listdir('test_sketches'))]
+    stats = ParseStats()
+    results = dict(parse_many(test_files, workers=2, chunk_bytes=512, stats=stats))
+    self.assertEqual(stats.parses, len(test_files))
+    self.assertEqual(stats.counts.get('lines'), sum(len(results[test_file].get('full_code')) for test_file in test_files))
+    self.assertEqual(results[test_files[0]], parse_student_code(test_files[0]))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
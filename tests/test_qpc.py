@@ -1,9 +1,15 @@
 import unittest
+from unittest import mock
 import os, sys
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 from ppc import parse_student_code
 import qpc
 
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
 class TestQPC(unittest.TestCase):
   
   def test_get_code(self):
@@ -36,7 +42,7 @@ class TestQPC(unittest.TestCase):
     self.assertEqual(actual, expected)
 
   def test_get_method(self):
-    expected = {'return_type': 'double', 'name': 'evenOdd', 'parameters': ['int num'], 'code': ['double evenOdd(int num) {', 'if (num % 2 == 0) {', 'println("Even");', '} else {', 'println("Odd");', '}', '}'], 'conditionals': [{'code': ['if (num % 2 == 0) {', 'println("Even");', '} else {', 'println("Odd");', '}'], 'true_branch': ['if (num % 2 == 0) {', 'println("Even");'], 'false_branch': ['} else {', 'println("Odd");', '}']}], 'loops': [], 'return_value': ''}
+    expected = {'return_type': 'double', 'name': 'evenOdd', 'parameters': ['int num'], 'code': ['double evenOdd(int num) {', 'if (num % 2 == 0) {', 'println("Even");', '} else {', 'println("Odd");', '}', '}'], 'conditionals': [{'code': ['if (num % 2 == 0) {', 'println("Even");', '} else {', 'println("Odd");', '}'], 'true_branch': ['if (num % 2 == 0) {', 'println("Even");'], 'false_branch': ['} else {', 'println("Odd");', '}'], 'start': 1}], 'loops': [], 'return_value': ''}
     test_file = 'test_sketches/methods.pde'
     expected_methods = ['setup', 'draw', 'checkEdge', 'evenOdd', 'concatStrings']
     self.code = parse_student_code(test_file, sketch_methods=expected_methods)
@@ -119,7 +125,7 @@ class TestQPC(unittest.TestCase):
     test_file = 'test_sketches/array_rect_ellipse.pde'
     expected_methods = ['setup', 'draw', 'mousePressed', 'mouseDragged', 'mouseReleased']
     self.code = parse_student_code(test_file, sketch_methods=expected_methods)
-    expected = [{'type': 'for', 'code': ['for(int i=0; i<fcX.length; i++){', 'fill(colors[i]);', 'if(shapes[i] == 1){', 'rect(fcX[i], fcY[i], scX[i], scY[i]);', '}else if(shapes[i] == 2){', 'ellipse(fcX[i], fcY[i], scX[i], scY[i]);', '}', '}']}]
+    expected = [{'type': 'for', 'code': ['for(int i=0; i<fcX.length; i++){', 'fill(colors[i]);', 'if(shapes[i] == 1){', 'rect(fcX[i], fcY[i], scX[i], scY[i]);', '}else if(shapes[i] == 2){', 'ellipse(fcX[i], fcY[i], scX[i], scY[i]);', '}', '}'], 'start': 2}]
     actual = qpc.get_method_loops(self.code, 'mouseDragged')
     self.assertEqual(actual, expected)
 
@@ -145,6 +151,72 @@ class TestQPC(unittest.TestCase):
     self.assertTrue(qpc.method_has_conditional(self.code, 'evenOdd'))
     self.assertFalse(qpc.method_has_conditional(self.code, 'concatStrings'))
 
+  def test_get_control_flow(self):
+    test_file = 'test_sketches/control_flow.pde'
+    self.code = parse_student_code(test_file)
+    root = qpc.get_control_flow(self.code, 'draw')
+    self.assertEqual([node.kind for node in root.children], ['for', 'do', 'switch', 'if'])
+    self.assertEqual([(node.kind, node.start, node.end) for node in root.children[0].children],
+                     [('if', 2, 4), ('else if', 4, 8), ('else', 8, 11)])
+    self.assertEqual(root.children[0].children[1].children[0].lines(), ['while (count > 5) {', 'count--;', '}'])
+    self.assertEqual(root.children[0].condition, 'int i = 0; i < 10; i++')
+    self.assertEqual(root.children[1].lines()[-1], '} while (count < 20);')
+    self.assertEqual((root.children[2].children[0].start, root.children[2].children[0].end), (17, 18))
+    self.assertEqual((root.children[3].start, root.children[3].end), (20, 22))
+    self.assertEqual(qpc.get_control_flow(parse_student_code(test_file, lazy=True), 'draw').to_dict(), root.to_dict())
+
+  def test_method_has_nested_block(self):
+    test_file = 'test_sketches/control_flow.pde'
+    self.code = parse_student_code(test_file)
+    self.assertTrue(qpc.method_has_nested_block(self.code, 'draw', 'while', 'conditional'))
+    self.assertTrue(qpc.method_has_nested_block(self.code, 'draw', 'conditional', 'for'))
+    self.assertTrue(qpc.method_has_nested_block(self.code, 'draw', 'if', 'switch'))
+    self.assertFalse(qpc.method_has_nested_block(self.code, 'draw', 'for', 'conditional'))
+    self.assertFalse(qpc.method_has_nested_block(self.code, 'draw', 'loop', 'do'))
+    self.assertEqual(qpc.get_method_nesting(self.code, 'draw'), 3)
+
+  def test_count_method_loops(self):
+    test_file = 'test_sketches/control_flow.pde'
+    self.code = parse_student_code(test_file)
+    self.assertEqual(qpc.count_method_loops(self.code, 'draw'), 2)
+    self.assertEqual(qpc.count_method_loops(self.code, 'draw', 'for'), 1)
+    self.assertEqual(qpc.count_method_conditionals(self.code, 'draw'), 3)
+    self.assertEqual(qpc.count_global_variables(self.code), 1)
+
+  @unittest.skipUnless(numpy, 'needs numpy')
+  def test_feature_matrix(self):
+    pcs = [parse_student_code('test_sketches/control_flow.pde'), parse_student_code('test_sketches/methods.pde')]
+    features = [('method_has_for_loop', 'draw'), {'name': 'draw loops', 'function': 'count_method_loops', 'args': ['draw']},
+                ('count_method_conditionals', 'checkEdge'), ('count_global_variables',)]
+    matrix, labels = qpc.feature_matrix(iter(pcs), features)
+    self.assertEqual(labels, ['method_has_for_loop(draw)', 'draw loops', 'count_method_conditionals(checkEdge)', 'count_global_variables()'])
+    self.assertEqual(matrix.shape, (2, 4))
+    self.assertEqual(matrix[0, :2].tolist(), [1.0, 2.0])
+    self.assertTrue(numpy.isnan(matrix[0, 2]))
+    self.assertEqual(matrix[1, 2], qpc.count_method_conditionals(pcs[1], 'checkEdge'))
+    self.assertEqual(matrix[:, 3].tolist(), [1.0, float(len(pcs[1].get('global_variables')))])
+    pairs = ((name, pc) for name, pc in zip(['control_flow.pde', 'methods.pde'], pcs))
+    pair_matrix, _ = qpc.feature_matrix(pairs, features)
+    self.assertTrue(numpy.array_equal(pair_matrix, matrix, equal_nan=True))
+    failed, _ = qpc.feature_matrix([('broken.pde', SyntaxError('unreadable'))], features)
+    self.assertTrue(numpy.isnan(failed).all())
+    self.assertTrue(numpy.isnan(qpc.feature_matrix(pcs, [('get_method_return_value', 'missing')])[0]).all())
+    self.assertRaises(ZeroDivisionError, qpc.feature_matrix, pcs, [(lambda pc: 1 / 0,)])
+    self.assertRaises(TypeError, qpc.feature_matrix, pcs, [('get_method_code', 'draw')])
+
+  @unittest.skipUnless(numpy, 'needs numpy')
+  def test_feature_matrix_class_methods(self):
+    pcs = [parse_student_code('test_sketches/class_example.pde'), parse_student_code('test_sketches/control_flow.pde')]
+    features = [('has_class_method', 'update'), ('has_class_method', 'update', 'Missing'), ('method_has_name', 'draw'), ('has_class_name', 'HLine')]
+    matrix, _ = qpc.feature_matrix(pcs, features)
+    self.assertTrue(qpc.has_class_method(pcs[0], 'update'))
+    self.assertEqual(matrix.tolist(), [[1.0, 0.0, 1.0, 1.0], [0.0, 0.0, 1.0, 0.0]])
+
+  def test_feature_matrix_errors(self):
+    with mock.patch.object(qpc, 'np', None):
+      self.assertRaises(ImportError, qpc.feature_matrix, [], [])
+    self.assertRaises(ValueError, qpc.get_feature, ('missing_function', 'draw'))
+
   def test_has_class_name(self):
     test_file = 'test_sketches/class_example.pde'
     class_methods = ['update']
@@ -155,7 +227,7 @@ class TestQPC(unittest.TestCase):
     test_file = 'test_sketches/class_example.pde'
     class_methods = ['update']
     self.code = parse_student_code(test_file, class_methods=class_methods)
-    expected = {'name': 'HLine', 'code': ['class HLine {', '  float ypos, speed;', '  HLine (float y, float s, String s1, int num) {', '    ypos = y;', '    speed = s;', '  }', '  void update() {', '    ypos += speed;', '    if (ypos > height) {', '      ypos = 0;', '    }', '    line(0, ypos, width, ypos);', '  }', '}'], 'methods': [{'return_type': 'void', 'name': 'update', 'parameters': [''], 'code': ['void update() {', 'ypos += speed;', 'if (ypos > height) {', 'ypos = 0;', '}', 'line(0, ypos, width, ypos);', '}'], 'conditionals': [{'code': ['if (ypos > height) {', 'ypos = 0;', '}'], 'true_branch': ['if (ypos > height) {', 'ypos = 0;', '}'], 'false_branch': ''}], 'loops': [], 'return_value': ''}], 'constructor': {'code': ['HLine (float y, float s, String s1, int num) {', 'ypos = y;', 'speed = s;', '}'], 'parameters': ['float y', 'float s', 'String s1', 'int num']}, 'attributes': ['float ypos, speed;']}
+    expected = {'name': 'HLine', 'parent': None, 'code': ['class HLine {', '  float ypos, speed;', '  HLine (float y, float s, String s1, int num) {', '    ypos = y;', '    speed = s;', '  }', '  void update() {', '    ypos += speed;', '    if (ypos > height) {', '      ypos = 0;', '    }', '    line(0, ypos, width, ypos);', '  }', '}'], 'methods': [{'return_type': 'void', 'name': 'update', 'parameters': [''], 'code': ['void update() {', 'ypos += speed;', 'if (ypos > height) {', 'ypos = 0;', '}', 'line(0, ypos, width, ypos);', '}'], 'conditionals': [{'code': ['if (ypos > height) {', 'ypos = 0;', '}'], 'true_branch': ['if (ypos > height) {', 'ypos = 0;', '}'], 'false_branch': '', 'start': 2}], 'loops': [], 'return_value': ''}], 'constructors': [{'code': ['HLine (float y, float s, String s1, int num) {', 'ypos = y;', 'speed = s;', '}'], 'parameters': ['float y', 'float s', 'String s1', 'int num']}], 'constructor': {'code': ['HLine (float y, float s, String s1, int num) {', 'ypos = y;', 'speed = s;', '}'], 'parameters': ['float y', 'float s', 'String s1', 'int num']}, 'attributes': ['float ypos, speed;']}
     actual = qpc.get_class(self.code)
     self.assertEqual(expected, actual)
 
@@ -226,5 +298,53 @@ class TestQPC(unittest.TestCase):
   def test_get_method_conditionals(self):
     pass
 
+  def test_get_methods(self):
+    test_file = 'test_sketches/methods.pde'
+    expected_methods = ['setup', 'draw', 'checkEdge', 'evenOdd', 'concatStrings']
+    self.code = parse_student_code(test_file, sketch_methods=expected_methods)
+    actual = qpc.get_methods(self.code, ['concatStrings', 'setup', 'missing'])
+    self.assertEqual(actual[0].get('return_value'), 's1 + s2')
+    self.assertEqual(actual[1].get('name'), 'setup')
+    self.assertIsNone(actual[2])
+
+  def test_get_method_overloads(self):
+    test_file = 'test_sketches/discovered_methods.pde'
+    self.code = parse_student_code(test_file)
+    overloads = qpc.get_method_overloads(self.code, 'drawCircle')
+    self.assertEqual([method.get('parameters') for method in overloads], [['float x', 'float y'], ['float x', 'float y', 'float d']])
+    self.assertEqual(qpc.get_method_overloads(self.code, 'missing'), [])
+
+  def test_get_method_without_index(self):
+    test_file = 'test_sketches/methods.pde'
+    expected_methods = ['setup', 'draw', 'checkEdge', 'evenOdd', 'concatStrings']
+    self.code = parse_student_code(test_file, sketch_methods=expected_methods)
+    indexed = qpc.get_method(self.code, 'evenOdd')
+    del self.code['method_index']
+    self.assertIs(qpc.get_method(self.code, 'evenOdd'), indexed)
+
+  def test_multiple_classes(self):
+    test_file = 'test_sketches/multiple_classes.pde'
+    self.code = parse_student_code(test_file)
+    self.assertEqual(qpc.get_class_names(self.code), ['Ball', 'Paddle', 'Score'])
+    self.assertTrue(qpc.has_class_name(self.code, 'Score'))
+    self.assertFalse(qpc.has_class_name(self.code, 'Brick'))
+    self.assertEqual(qpc.get_constructor_parameters(self.code, 'Ball'), ['float x', 'float y'])
+    self.assertEqual(len(qpc.get_constructors(self.code, 'Paddle')), 2)
+    self.assertTrue(qpc.has_class_method(self.code, 'show', 'Paddle'))
+    self.assertFalse(qpc.has_class_method(self.code, 'show', 'Ball'))
+    self.assertTrue(qpc.has_attribute(self.code, 'int points;', 'Score'))
+
+  def test_typed_result(self):
+    test_file = 'test_sketches/class_example.pde'
+    class_methods = ['update']
+    expected = parse_student_code(test_file, class_methods=class_methods)
+    self.code = parse_student_code(test_file, class_methods=class_methods, typed=True)
+    self.assertEqual(qpc.get_method_code(self.code, 'draw'), qpc.get_method_code(expected, 'draw'))
+    self.assertEqual(qpc.get_constructor_parameters(self.code), ['float y', 'float s', 'String s1', 'int num'])
+    self.assertTrue(qpc.has_class_method(self.code, 'update'))
+    self.assertTrue(qpc.has_attribute(self.code, 'float ypos, speed;'))
+    self.assertEqual(qpc.get_class(self.code), qpc.get_class(expected))
+    self.assertTrue(qpc.has_global_variable(self.code, 'HLine h1 = new HLine(20, 2.0);'))
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,11 @@
+class Ball {
+  float x;
+
+  Ball(float x) {
+    this.x = x;
+  }
+
+  void move() {
+    x += 1;
+  }
+}
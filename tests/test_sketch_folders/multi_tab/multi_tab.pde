@@ -0,0 +1,13 @@
+// Main tab
+Ball ball;
+
+void setup() {
+  size(400, 400);
+  ball = new Ball(200);
+}
+
+void draw() {
+  background(0);
+  ball.move();
+  drawScore();
+}
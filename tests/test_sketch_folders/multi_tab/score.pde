@@ -0,0 +1,8 @@
+int score = 0;
+
+/*
+ * Shows the score
+ */
+void drawScore() {
+  text(score, 10, 10);
+}
@@ -0,0 +1,25 @@
+int count = 0;
+
+void draw() {
+  for (int i = 0; i < 10; i++) {
+    if (i % 2 == 0) {
+      count++;
+    } else if (i % 3 == 0) {
+      while (count > 5) {
+        count--;
+      }
+    } else {
+      println("}");
+    }
+  }
+  do {
+    count += 2;
+  } while (count < 20);
+  switch (count) {
+    case 1:
+      if (mousePressed) count = 0;
+      break;
+  }
+  if (count > 100)
+    count = 0;
+}
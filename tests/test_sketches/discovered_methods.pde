@@ -0,0 +1,26 @@
+int[] values = {1, 2, 3};
+
+void drawCircle(float x, float y) {
+  ellipse(x, y, 10, 10);
+}
+
+void drawCircle(float x, float y, float d) {
+  ellipse(x, y, d, d);
+}
+
+void setup() {
+  size(400, 400);
+}
+
+void draw() {
+  if (mousePressed) {
+    drawCircle(mouseX, mouseY);
+  } else if (keyPressed) {
+    drawCircle(mouseX, mouseY, 20);
+  }
+}
+
+public int[] getValues()
+{
+  return values;
+}
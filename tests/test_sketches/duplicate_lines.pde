@@ -0,0 +1,34 @@
+/*
+first comment
+*/
+int x = 0;
+/*
+second comment
+*/
+
+void setup() {
+  for (int i = 0; i < 3; i++) {
+    x += 1;
+  }
+  for (int i = 0; i < 3; i++) {
+    x += 2;
+  }
+}
+
+void draw() {
+  while (x < 10) {
+    x += 1;
+  }
+  while (x < 10) {
+    x += 1;
+    println(x);
+  }
+  if (x > 5) {
+    x += 1;
+  }
+  if (x > 5) {
+    x = 0;
+  } else {
+    x += 1;
+  }
+}
@@ -0,0 +1,26 @@
+import processing.sound.*;
+
+// Scores for each level
+final int LEVELS = 3, LIVES;
+int[] scores = {
+  10, 20, 30
+};
+String title = "a, b; c";
+
+void setup() {
+  size(400, 400);
+}
+
+// helper is not in the list of sketch methods
+int helper(int a) {
+  int local = a * 2;
+  return local;
+}
+}
+
+float speed = 2.5;
+float speed = 2.5;
+
+void draw() {
+  background(0);
+}
@@ -0,0 +1,26 @@
+class Score {
+  int elseCount = 0;
+}
+
+int platform(int x) {
+  return x * 2;
+}
+
+int step() {
+  int returnValue = platform(3);
+  String label = "if (done) {";
+  if (returnValue > 4) {
+    elseCount++;
+  } else {
+    while (returnValue > 0) {
+      returnValue--;
+    }
+  }
+  return returnValue;
+}
+
+int pick(boolean first) {
+  if (first) {
+    elseCount = 0;
+  } return 3;
+}
@@ -0,0 +1,25 @@
+int total = 0;
+
+void add(int a,
+         int b) {
+  total = a + b;
+}
+
+class Ball {
+  float x;
+  Ball(float startX,
+       float speed)
+  {
+    x = startX;
+  }
+  void move(float dx,
+            float dy)
+  {
+    x += dx;
+  }
+}
+
+void setup() {
+  add(1,
+      2);
+}
@@ -0,0 +1,56 @@
+Ball ball;
+Paddle paddle;
+
+void setup() {
+  size(400, 400);
+  ball = new Ball(200, 200);
+  paddle = new Paddle();
+}
+
+void draw() {
+  ball.move();
+  paddle.show();
+}
+
+class Ball {
+  float x, y;
+  float speed = 2;
+
+  Ball(float x, float y) {
+    this.x = x;
+    this.y = y;
+  }
+
+  void move() {
+    x += speed;
+    if (x > width) {
+      speed = -speed;
+    }
+  }
+}
+
+class Paddle {
+  int w;
+  Score score = new Score();
+
+  Paddle() {
+    w = 80;
+  }
+
+  Paddle(int w)
+  {
+    this.w = w;
+  }
+
+  void show() {
+    rect(mouseX, height - 10, w, 10);
+  }
+
+  class Score {
+    int points;
+
+    void add(int amount) {
+      points += amount;
+    }
+  }
+}
@@ -0,0 +1,14 @@
+PImage img; /* the image
+   loaded in setup */ int count = 0;
+
+void setup() {
+  img = loadImage("http://example.com/cat.png"); // from the web
+  println("{"); /* an open bracket */ count++;
+}
+
+void draw() {
+  char close = '}';
+  if (count > 0) {
+    println("// not a comment");
+  }
+}
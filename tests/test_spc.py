@@ -0,0 +1,98 @@
+import unittest
+import os, sys, shutil, socket, asyncio, tempfile, threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ppc import parse_student_code, parse_sketch_dir
+from wpc import run_checks
+import spc
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'needs Unix sockets')
+class TestSPC(unittest.TestCase):
+
+  @classmethod
+  def setUpClass(cls):
+    cls.directory = tempfile.mkdtemp()
+    cls.socket_path = os.path.join(cls.directory, 'ppc.sock')
+    cls.grading_server = spc.GradingServer(workers=2, cache_directory=os.path.join(cls.directory, 'cache'))
+    cls.loop = asyncio.new_event_loop()
+    cls.server = cls.loop.run_until_complete(cls.grading_server.start(cls.socket_path))
+    cls.thread = threading.Thread(target=cls.loop.run_forever)
+    cls.thread.start()
+
+  @classmethod
+  def tearDownClass(cls):
+    async def shutdown():
+      cls.server.close()
+      await cls.server.wait_closed()
+      tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+      for task in tasks:
+        task.cancel()
+      await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run_coroutine_threadsafe(shutdown(), cls.loop).result()
+    cls.loop.call_soon_threadsafe(cls.loop.stop)
+    cls.thread.join()
+    cls.loop.close()
+    cls.grading_server.close()
+    shutil.rmtree(cls.directory)
+
+  def setUp(self):
+    self.client = spc.Client(self.socket_path, timeout=30)
+    self.addCleanup(self.client.close)
+
+  def test_ping(self):
+    self.assertEqual(self.client.ping(), 'pong')
+
+  def test_parse_file(self):
+    test_file = 'test_sketches/class_example.pde'
+    self.assertEqual(self.client.parse(test_file, class_methods=['update']), parse_student_code(test_file, class_methods=['update']))
+
+  def test_parse_source_and_directory(self):
+    test_file = 'test_sketches/methods.pde'
+    with open(test_file) as sketch:
+      source = sketch.read()
+    self.assertEqual(self.client.parse(source=source), parse_student_code(test_file))
+    self.assertEqual(self.client.parse(directory='test_sketch_folders/multi_tab'), parse_sketch_dir('test_sketch_folders/multi_tab'))
+
+  def test_check(self):
+    test_file = 'test_sketches/multiple_classes.pde'
+    checks = [{'name': 'ball moves', 'function': 'has_class_method', 'args': ['move', 'Ball']},
+              {'name': 'paddle', 'function': 'get_constructor_parameters', 'args': ['Paddle']},
+              {'name': 'missing', 'function': 'get_method_code', 'args': ['keyPressed']}]
+    self.assertEqual(self.client.check(checks, test_file), run_checks(parse_student_code(test_file), checks))
+    private = [{'name': 'helper', 'function': 'build_control_flow', 'args': [[]]}, {'name': 'matrix', 'function': 'feature_matrix', 'args': [[]]},
+               {'name': 'bad', 'function': ['get_code']}, {'name': 'code', 'function': 'get_code'}]
+    results = self.client.check(private, test_file)
+    self.assertEqual(results.get('helper'), {'error': "unknown qpc function: 'build_control_flow'"})
+    self.assertIn('error', results.get('matrix'))
+    self.assertIn('error', results.get('bad'))
+    self.assertEqual(results.get('code'), parse_student_code(test_file).get('code'))
+
+  def test_errors(self):
+    with self.assertRaises(spc.ServerError):
+      self.client.parse('test_sketches/missing.pde')
+    with self.assertRaises(spc.ServerError):
+      self.client.request('compile', file='test_sketches/methods.pde')
+    self.assertEqual(self.client.ping(), 'pong')
+    response = asyncio.run_coroutine_threadsafe(self.grading_server.respond(b'[1, 2]\n'), self.loop).result()
+    self.assertEqual((response.get('id'), response.get('ok')), (None, False))
+
+  def test_loopback_only(self):
+    with self.assertRaises(ValueError):
+      asyncio.run_coroutine_threadsafe(self.grading_server.start(host='0.0.0.0', port=0), self.loop).result()
+    self.assertTrue(spc.is_loopback('::1'))
+    self.assertFalse(spc.is_loopback('example.com'))
+
+  def test_concurrent_clients(self):
+    test_files = ['test_sketches/methods.pde', 'test_sketches/loops.pde', 'test_sketches/conditionals.pde', 'test_sketches/class_example.pde']
+    results = dict()
+    def grade(test_file):
+      with spc.Client(self.socket_path, timeout=30) as client:
+        results[test_file] = client.parse(test_file)
+    threads = [threading.Thread(target=grade, args=(test_file,)) for test_file in test_files]
+    for thread in threads:
+      thread.start()
+    for thread in threads:
+      thread.join()
+    self.assertEqual(results, {test_file: parse_student_code(test_file) for test_file in test_files})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+import os, sys, json, shutil, socket, tempfile, threading
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from ppc import parse_sketch_dir
+import wpc
+
+class TestWPC(unittest.TestCase):
+
+  def setUp(self):
+    self.workspace = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.workspace)
+    self.sketch_dir = os.path.join(self.workspace, 'multi_tab')
+    shutil.copytree('test_sketch_folders/multi_tab', self.sketch_dir)
+    self.checks = [{'name': 'has draw', 'function': 'get_method_code', 'args': ['draw']},
+                   {'name': 'score', 'function': 'get_method_code', 'args': ['drawScore']},
+                   {'name': 'missing', 'function': 'get_method_code', 'args': ['keyPressed']}]
+    self.published = []
+    self.watcher = wpc.Watcher(self.workspace, self.checks, self.published.append, debounce=1)
+
+  def test_poll(self):
+    self.assertEqual(self.watcher.poll(now=0), [])
+    self.assertEqual(self.watcher.poll(now=1), ['multi_tab'])
+    result = self.watcher.results.get('multi_tab')
+    self.assertIsNone(result.get('error'))
+    self.assertEqual(result.get('tabs'), ['multi_tab.pde', 'Ball.pde', 'score.pde'])
+    self.assertEqual(result.get('checks').get('score'), ['void drawScore() {', 'text(score, 10, 10);', '}'])
+    self.assertIn('error', result.get('checks').get('missing'))
+    self.assertEqual(len(self.published), 1)
+    self.assertEqual(self.watcher.poll(now=5), [])
+
+  def test_poll_debounce(self):
+    self.watcher.poll(now=0)
+    self.watcher.poll(now=1)
+    draw_method = self.watcher.sketches.get(self.sketch_dir).get(os.path.join(self.sketch_dir, 'multi_tab.pde')).get('methods')[1]
+    with open(os.path.join(self.sketch_dir, 'score.pde'), 'a') as tab:
+      tab.write('\nvoid resetScore() {\n  score = 0;\n}\n')
+    self.assertEqual(self.watcher.poll(now=2), [])
+    os.utime(os.path.join(self.sketch_dir, 'score.pde'), ns=(1, 1))
+    self.assertEqual(self.watcher.poll(now=2.5), [])
+    self.assertEqual(self.watcher.poll(now=3.5), ['multi_tab'])
+    tabs = self.watcher.sketches.get(self.sketch_dir)
+    self.assertIs(tabs.get(os.path.join(self.sketch_dir, 'multi_tab.pde')).get('methods')[1], draw_method)
+    self.assertEqual(wpc.run_checks(parse_sketch_dir(self.sketch_dir), self.checks), self.watcher.results.get('multi_tab').get('checks'))
+
+  def test_poll_removed_sketch(self):
+    self.watcher.poll(now=0)
+    self.watcher.poll(now=1)
+    shutil.rmtree(self.sketch_dir)
+    self.watcher.poll(now=2)
+    self.assertEqual(self.watcher.poll(now=3), ['multi_tab'])
+    self.assertEqual(self.watcher.results, {})
+
+  def test_load_checks(self):
+    checks_file = os.path.join(self.workspace, 'checks.json')
+    with open(checks_file, 'w') as data:
+      json.dump(self.checks, data)
+    self.assertEqual(wpc.load_checks(checks_file), self.checks)
+    with open(checks_file, 'w') as data:
+      json.dump([{'name': 'bad', 'function': 'not_a_function'}], data)
+    with self.assertRaises(ValueError):
+      wpc.load_checks(checks_file)
+    with open(checks_file, 'w') as data:
+      json.dump([{'name': 'import', 'function': 'build_control_flow'}], data)
+    with self.assertRaises(ValueError):
+      wpc.load_checks(checks_file)
+
+  def test_publish_file(self):
+    output = os.path.join(self.workspace, 'results.json')
+    self.watcher.publish = wpc.publish_file(output)
+    self.watcher.poll(now=0)
+    self.watcher.poll(now=1)
+    with open(output) as data:
+      self.assertEqual(json.load(data), self.watcher.results)
+
+  @unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'needs Unix sockets')
+  def test_publish_socket(self):
+    socket_path = os.path.join(self.workspace, 'results.sock')
+    wpc.publish_socket(socket_path)({'nobody': 'listening'})
+    received = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+      server.bind(socket_path)
+      server.listen(1)
+      def receive():
+        connection, _ = server.accept()
+        with connection, connection.makefile() as lines:
+          received.append(json.loads(lines.readline()))
+      thread = threading.Thread(target=receive)
+      thread.start()
+      wpc.publish_socket(socket_path)({'multi_tab': {'error': None}})
+      thread.join(5)
+    self.assertEqual(received, [{'multi_tab': {'error': None}}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,323 @@
+'''
+Watching Processing Code (WPC) - Long-running watch mode that keeps parse results for a workspace of sketches up to date.
+
+A Watcher scans a workspace directory for sketch folders (any directory holding ".pde" tabs). When tabs change it waits
+for the saves to settle (the debounce delay), reparses only the tabs that changed with "ppc.reparse", merges them with
+"ppc.merge_tabs", runs a configured list of QPC checks and publishes the results as JSON, either to a file or to a Unix
+socket. Changes are noticed with inotify when the optional "inotify_simple" package is installed and by polling otherwise.
+
+Run it from the command line:
+
+    python wpc.py path/to/workspace --checks checks.json --output results.json
+
+The checks file is a JSON list; each check names a QPC function and the arguments that follow the parsed code:
+
+    [{"name": "has draw", "function": "get_method", "args": ["draw"]}]
+'''
+
+import os, json, time, socket, argparse, tempfile
+import ppc, qpc
+
+try:
+  from inotify_simple import INotify, flags
+except ImportError:
+  INotify = None
+
+## Seconds a sketch must go without changes before it is reparsed
+DEBOUNCE_SECONDS = 0.5
+
+## Seconds between scans of the workspace when polling
+POLL_SECONDS = 0.5
+
+#######################
+## Watching a Workspace
+#######################
+
+class Watcher:
+  '''
+  Keeps the parse results and check results for every sketch folder in a workspace up to date
+
+  Attributes:
+    workspace (string): directory that is watched
+    results (dictionary): maps each sketch folder (relative to the workspace) to its latest result; see "update"
+    sketches (dictionary): maps each sketch folder to a dictionary of its tab paths and their parsed code
+  '''
+
+  def __init__(self, workspace, checks=None, publish=None, debounce=DEBOUNCE_SECONDS, interval=POLL_SECONDS,
+               sketch_methods=None, class_methods=None, extension='.pde'):
+    '''
+    Parameters:
+      workspace (string): directory to watch
+      checks (list of dictionaries): checks run on each parsed sketch; see "run_checks"; defaults to None, which runs no checks
+      publish (function): called with "results" after any sketch is updated; defaults to None, which does not publish
+      debounce (float): seconds a sketch must go without changes before it is reparsed; defaults to DEBOUNCE_SECONDS
+      interval (float): seconds between scans of the workspace; defaults to POLL_SECONDS
+      sketch_methods (list of strings): methods to parse from each sketch; defaults to "None", which parses every method
+      class_methods (list of strings): methods to parse from each user-defined class; defaults to "None", which parses every method
+      extension (string): only files ending with this are tabs; defaults to ".pde"
+    '''
+
+    self.workspace = workspace
+    self.checks = checks or []
+    self.publish = publish
+    self.debounce = debounce
+    self.interval = interval
+    self.sketch_methods = sketch_methods
+    self.class_methods = class_methods
+    self.extension = extension
+    self.results = dict()
+    self.sketches = dict()
+    self.snapshot = dict()
+    self.pending = dict()
+    self.inotify = INotify() if INotify is not None else None
+    self.watched = dict()
+
+  def scan(self):
+    '''
+    Returns a dictionary that maps the path of every tab in the workspace to its modification time and size
+    '''
+
+    snapshot = dict()
+    for directory, _, files in os.walk(self.workspace):
+      if self.inotify is not None and directory not in self.watched:
+        mask = flags.CREATE | flags.MODIFY | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO | flags.CLOSE_WRITE
+        self.watched[directory] = self.inotify.add_watch(directory, mask)
+      for name in files:
+        if name.endswith(self.extension):
+          path = os.path.join(directory, name)
+          try:
+            stat = os.stat(path)
+          except FileNotFoundError:
+            continue
+          snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+
+    return snapshot
+
+  def poll(self, now=None):
+    '''
+    Scans the workspace once, marks the sketches with changed tabs and updates the ones whose changes have settled
+
+    Parameters:
+      now (float): current time from "time.monotonic"; defaults to None, which reads the clock
+
+    Returns:
+       updated (list of strings): sketch folders that were reparsed, relative to the workspace
+    '''
+
+    now = time.monotonic() if now is None else now
+    snapshot = self.scan()
+    for path in set(snapshot) | set(self.snapshot):
+      if snapshot.get(path) != self.snapshot.get(path):
+        self.pending[os.path.dirname(path)] = now
+    self.snapshot = snapshot
+
+    updated = []
+    for directory, changed_at in list(self.pending.items()):
+      if now - changed_at >= self.debounce:
+        del self.pending[directory]
+        updated.append(self.update(directory))
+    if updated and self.publish is not None:
+      self.publish(self.results)
+
+    return updated
+
+  def update(self, directory):
+    '''
+    Reparses the changed tabs of a sketch folder, runs the checks and stores the result in "results"
+
+    Parameters:
+      directory (string): path to the sketch folder
+
+    Returns:
+       name (string): the sketch folder relative to the workspace; its result has the keys tabs, checks, and error
+    '''
+
+    name = os.path.relpath(directory, self.workspace)
+    tabs = self.sketches.setdefault(directory, dict())
+    names = ppc.get_tab_order(directory, [os.path.basename(path) for path in self.snapshot if os.path.dirname(path) == directory])
+    for path in [path for path in tabs if os.path.basename(path) not in names]:
+      del tabs[path]
+    if not names:
+      del self.sketches[directory]
+      self.results.pop(name, None)
+      return name
+
+    try:
+      for tab in names:
+        path = os.path.join(directory, tab)
+        lines = ppc.read_file(path)
+        previous = tabs.get(path)
+        if previous is None:
+          tabs[path] = ppc.parse_lines(lines, self.sketch_methods, self.class_methods)
+        elif previous.get('full_code') != lines:
+          tabs[path] = ppc.reparse(previous, lines, self.sketch_methods, self.class_methods)
+      pc = ppc.merge_tabs([(tab, tabs[os.path.join(directory, tab)]) for tab in names], self.sketch_methods)
+      self.results[name] = {'tabs': names, 'checks': run_checks(pc, self.checks), 'error': None}
+    except Exception as error:
+      self.results[name] = {'tabs': names, 'checks': dict(), 'error': repr(error)}
+
+    return name
+
+  def wait(self):
+    '''
+    Waits until a tab may have changed: blocks on inotify for up to "interval" seconds, or sleeps for "interval" when polling
+    '''
+
+    if self.inotify is None:
+      time.sleep(self.interval)
+    else:
+      self.inotify.read(timeout=int(self.interval * 1000))
+
+  def run(self):
+    '''
+    Watches the workspace until interrupted with Ctrl+C
+    '''
+
+    try:
+      while True:
+        self.poll()
+        self.wait()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      if self.inotify is not None:
+        self.inotify.close()
+
+#######################
+## Running Checks
+#######################
+
+def load_checks(file_name):
+  '''
+  Returns the list of checks stored in a JSON file
+
+  Parameters:
+    file_name (string): JSON file with a list of checks; each check has the keys name, function, and (optionally) args
+
+  Returns:
+     checks (list of dictionaries): the checks, after making sure every function is one of qpc.QUERY_FUNCTIONS
+  '''
+
+  with open(file_name, encoding='utf-8') as data:
+    checks = json.load(data)
+  for check in checks:
+    if get_check_function(check.get('function')) is None:
+      raise ValueError('unknown qpc function in check %r: %r' % (check.get('name'), check.get('function')))
+
+  return checks
+
+def run_checks(pc, checks):
+  '''
+  Returns a dictionary with the result of every check on the parsed student code
+
+  Parameters:
+    pc (dictionary): parsed student code
+    checks (list of dictionaries): checks built by "load_checks"
+
+  Returns:
+     results (dictionary): maps each check name to the value returned by the QPC function, or to a dictionary with an
+                           "error" key if the function raised an exception (e.g. the method it looks for is missing)
+                           or is not one of qpc.QUERY_FUNCTIONS
+  '''
+
+  results = dict()
+  for check in checks:
+    function = get_check_function(check.get('function'))
+    if function is None:
+      results[check.get('name')] = {'error': 'unknown qpc function: %r' % (check.get('function'),)}
+      continue
+    try:
+      results[check.get('name')] = ppc.to_plain(function(pc, *check.get('args', [])))
+    except Exception as error:
+      results[check.get('name')] = {'error': repr(error)}
+
+  return results
+
+def get_check_function(name):
+  '''
+  Returns the QPC function a check names, or None if the name is not one of qpc.QUERY_FUNCTIONS
+
+  Parameters:
+    name (string): function name from a check
+
+  Returns:
+     function (function): the public QPC query function
+  '''
+
+  if not isinstance(name, str) or name not in qpc.QUERY_FUNCTIONS:
+    return None
+
+  return getattr(qpc, name)
+
+#######################
+## Publishing Results
+#######################
+
+def publish_file(file_name):
+  '''
+  Returns a function that writes the results to a JSON file. The file is replaced in one step, so readers never see a partial file
+
+  Parameters:
+    file_name (string): path of the JSON file
+
+  Returns:
+     publish (function): takes the results dictionary of a Watcher
+  '''
+
+  directory = os.path.dirname(os.path.abspath(file_name))
+
+  def publish(results):
+    handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'w', encoding='utf-8') as data:
+      json.dump(results, data, default=str)
+    os.replace(temp_path, file_name)
+
+  return publish
+
+def publish_socket(socket_path):
+  '''
+  Returns a function that sends the results as one line of JSON to a Unix socket. Nothing is sent if no one is listening
+
+  Parameters:
+    socket_path (string): path of the Unix socket
+
+  Returns:
+     publish (function): takes the results dictionary of a Watcher
+  '''
+
+  def publish(results):
+    message = (json.dumps(results, default=str) + '\n').encode('utf-8')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+      try:
+        client.connect(socket_path)
+        client.sendall(message)
+      except (FileNotFoundError, ConnectionRefusedError):
+        pass
+
+  return publish
+
+#######################
+## Command Line
+#######################
+
+def main(argv=None):
+  '''
+  Runs a Watcher from the command line; see the module docstring
+  '''
+
+  parser = argparse.ArgumentParser(description='Reparse Processing sketches and rerun QPC checks as they are saved.')
+  parser.add_argument('workspace', help='directory with the sketch folders to watch')
+  parser.add_argument('--checks', help='JSON file with the QPC checks to run')
+  output = parser.add_mutually_exclusive_group(required=True)
+  output.add_argument('--output', help='JSON file the results are written to')
+  output.add_argument('--socket', help='Unix socket the results are sent to')
+  parser.add_argument('--debounce', type=float, default=DEBOUNCE_SECONDS, help='seconds to wait for saves to settle')
+  parser.add_argument('--interval', type=float, default=POLL_SECONDS, help='seconds between scans')
+  args = parser.parse_args(argv)
+
+  checks = load_checks(args.checks) if args.checks else []
+  publish = publish_file(args.output) if args.output else publish_socket(args.socket)
+  Watcher(args.workspace, checks, publish, args.debounce, args.interval).run()
+
+if __name__ == '__main__':
+  main()